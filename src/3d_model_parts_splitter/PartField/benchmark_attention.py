@@ -0,0 +1,68 @@
+"""
+Parity check and benchmark: SDPAttention (attention_backend "sdpa") vs. nn.MultiheadAttention.
+
+Builds BasicBlock, ConditionBlock and the full TriplaneTransformer with both attention
+backends, loads the "mha" weights into the "sdpa" modules (the state_dict keys are the
+same), checks that the outputs agree and times the forward passes at the inference shape
+(3 x 32 x 32 tokens of width 1024).
+
+Example:
+    python benchmark_attention.py --device cuda --fp16
+"""
+import argparse
+
+import torch
+
+from benchmark_utils import timeit
+from partfield.model.triplane import BasicBlock, ConditionBlock, TriplaneTransformer
+
+def build_pair(build, device):
+    """
+    The same module with both backends, "sdpa" loaded from the "mha" state_dict.
+    """
+    torch.manual_seed(0)
+    mha = build("mha").to(device).eval()
+    sdpa = build("sdpa").to(device).eval()
+    sdpa.load_state_dict(mha.state_dict())
+    return mha, sdpa
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--batch", default=1, type=int)
+    parser.add_argument("--fp16", action="store_true", help="run under fp16 autocast (as in inference on cuda)")
+    parser.add_argument("--repeats", default=5, type=int)
+    parser.add_argument("--atol", default=None, type=float, help="max abs difference allowed (default 1e-4, 2e-2 with --fp16)")
+    args = parser.parse_args()
+    device = torch.device(args.device)
+    atol = args.atol if args.atol is not None else (2e-2 if args.fp16 else 1e-4)
+
+    D, L, N = 1024, 3 * 32 * 32, args.batch
+    x = torch.randn(N, L, D, device=device)
+    cond = torch.randn(N, 16 ** 3, 64, device=device)
+    triplanes = torch.randn(N, 3, 256, 128, 128, device=device)
+    cases = [
+        ("BasicBlock", lambda a: BasicBlock(inner_dim=D, num_heads=8, eps=1e-6, attention=a), (x,)),
+        ("ConditionBlock", lambda a: ConditionBlock(inner_dim=D, cond_dim=64, num_heads=8, eps=1e-6, attention=a), (x, cond)),
+        ("TriplaneTransformer", lambda a: TriplaneTransformer(input_dim=256, transformer_dim=D, transformer_layers=6,
+                                                              transformer_heads=8, triplane_low_res=32, triplane_high_res=128,
+                                                              triplane_dim=512, attention=a), (triplanes,)),
+    ]
+
+    print("%-20s %10s %10s %9s %12s" % ("module", "mha [ms]", "sdpa [ms]", "speedup", "max |diff|"))
+    failed = []
+    for name, build, inputs in cases:
+        mha, sdpa = build_pair(build, device)
+        with torch.no_grad(), torch.autocast(device.type, dtype=torch.float16, enabled=args.fp16):
+            t_mha, ref = timeit(lambda: mha(*inputs), device, args.repeats)
+            t_sdpa, out = timeit(lambda: sdpa(*inputs), device, args.repeats)
+        diff = float((out.float() - ref.float()).abs().max())
+        print("%-20s %10.1f %10.1f %8.2fx %12.2e" % (name, t_mha * 1000, t_sdpa * 1000, t_mha / t_sdpa, diff))
+        if diff > atol:
+            failed.append(name)
+        del mha, sdpa
+    assert not failed, f"sdpa output differs from mha by more than {atol}: {failed}"
+    print(f"parity ok (atol {atol})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+CPU bf16 benchmark and feature-drift report (cpu.bf16_stages).
+
+Encodes the same point clouds with fp32 and with every stage set in --configs run under
+bf16 (each stage on its own and all together by default), and reports per configuration
+the time of every stage (pc_encoder, plane scatter + unet, transformer), the speedup
+over fp32, and the drift of the features: cosine similarity of the point features at the
+encoder points (mean, min) and relative L2 error of the part planes.
+
+Example:
+    python benchmark_bf16.py -c configs/final/demo.yaml --points 20000 100000 --opts \
+        continue_ckpt model/model_objaverse.ckpt
+"""
+import json
+import os
+import time
+
+import torch
+
+from partfield.config import default_argument_parser, setup
+from partfield.face_features import point_features
+from partfield.precision import BF16_STAGES, stage_modules
+from partfield.predictor import PartFieldPredictor
+
+def time_stages(predictor):
+    """
+    Forward hooks adding the seconds spent in every stage to the returned dict.
+    """
+    times = {}
+    modules = stage_modules(predictor.pvcnn, predictor.triplane_transformer)
+    for stage, module in modules.items():
+        def pre_hook(module, args, stage=stage):
+            times[stage] = times.get(stage, 0.0) - time.time()
+        def hook(module, args, output, stage=stage):
+            times[stage] += time.time()
+        module.register_forward_pre_hook(pre_hook)
+        module.register_forward_hook(hook)
+    return times
+
+def run(predictor, times, clouds, repeats):
+    """
+    Mean stage times over `repeats` encodes (after a warm-up) and the outputs of each cloud.
+    """
+    results = {}
+    for n, pc in clouds.items():
+        planes = predictor.encode(pc)
+        times.clear()
+        start = time.time()
+        for _ in range(repeats):
+            predictor.encode(pc)
+        stage_times = {stage: t / repeats for stage, t in times.items()}
+        stage_times["total"] = (time.time() - start) / repeats
+        results[n] = (stage_times, planes.float(), point_features(planes.float(), pc[0]))
+    return results
+
+def main():
+    parser = default_argument_parser()
+    parser.add_argument("--points", nargs="+", type=int, default=[20000, 100000])
+    parser.add_argument("--configs", nargs="+", default=list(BF16_STAGES) + [",".join(BF16_STAGES)],
+                        help="comma-separated bf16 stage lists")
+    parser.add_argument("--repeats", default=2, type=int)
+    parser.add_argument("--output", default="exp_results/bench_bf16/report.json")
+    args = parser.parse_args()
+    cfg = setup(args, freeze=False)
+    cfg.device = "cpu"
+
+    torch.manual_seed(0)
+    clouds = {n: torch.nn.functional.normalize(torch.randn(1, n, 3), dim=-1) * 0.9 for n in args.points}
+
+    results = {}
+    for config in ["fp32"] + args.configs:
+        cfg.cpu.bf16_stages = [] if config == "fp32" else config.split(",")
+        predictor = PartFieldPredictor(cfg)
+        results[config] = run(predictor, time_stages(predictor), clouds, args.repeats)
+        del predictor
+
+    report = {}
+    stages = ["pc_encoder", "unet", "transformer", "total"]
+    print()
+    print("%-36s %8s" % ("bf16 stages", "points") + "".join("%16s" % (s + " [s]") for s in stages) +
+          "%9s %10s %10s %10s" % ("speedup", "cos mean", "cos min", "rel L2"))
+    for config, per_n in results.items():
+        report[config] = {}
+        for n, (stage_times, planes, feat) in per_n.items():
+            ref_times, ref_planes, ref_feat = results["fp32"][n]
+            cos = torch.nn.functional.cosine_similarity(feat, ref_feat, dim=-1)
+            row = {"times": stage_times, "speedup": ref_times["total"] / stage_times["total"],
+                   "cos_mean": float(cos.mean()), "cos_min": float(cos.min()),
+                   "rel_l2": float((planes - ref_planes).norm() / ref_planes.norm())}
+            report[config][n] = row
+            print("%-36s %8d" % (config, n) + "".join("%16.2f" % stage_times.get(s, 0.0) for s in stages) +
+                  "%8.2fx %10.5f %10.5f %10.2e" % (row["speedup"], row["cos_mean"], row["cos_min"], row["rel_l2"]))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved report to {args.output}")
+
+if __name__ == "__main__":
+    main()
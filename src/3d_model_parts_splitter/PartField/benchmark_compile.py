@@ -0,0 +1,93 @@
+"""
+Per-stage report: eager vs. torch.compile (compile.* options) for the pvcnn encoder and
+the triplane transformer.
+
+Runs both stages eagerly, compiles them in place with compile_encoder_stack and runs them
+again, for every point count in --points. The first compiled call of a shape includes the
+compilation, or the load from compile.cache_dir when a previous run filled it; running the
+script twice with the same cache_dir shows the cold-start time of a worker with a warm cache.
+Reports per stage the first-call and steady-state times, the speedup and the max difference
+of the part planes.
+
+Example:
+    python benchmark_compile.py -c configs/final/demo.yaml --points 20000 100000 --opts \
+        continue_ckpt model/model_objaverse.ckpt compile.cache_dir /workspace/inductor_cache
+"""
+import time
+
+import torch
+
+from partfield.compile import compile_encoder_stack
+from partfield.config import default_argument_parser, setup
+from partfield.predictor import PartFieldPredictor
+
+STAGES = ("pvcnn", "triplane_transformer")
+
+def sync(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+@torch.no_grad()
+def run_stages(predictor, pc):
+    """
+    Seconds spent in every stage, and the part planes.
+    """
+    times = {}
+    with predictor.autocast():
+        sync(predictor.device)
+        start = time.time()
+        feat = predictor.pvcnn(pc, pc)
+        sync(predictor.device)
+        times["pvcnn"] = time.time() - start
+        planes = predictor.triplane_transformer(feat)
+        sync(predictor.device)
+        times["triplane_transformer"] = time.time() - start - times["pvcnn"]
+    return times, planes[:, :, 64:].float()
+
+def measure(predictor, pc, repeats):
+    first, planes = run_stages(predictor, pc)
+    steady = {stage: 0.0 for stage in STAGES}
+    for _ in range(repeats):
+        times, _ = run_stages(predictor, pc)
+        for stage in STAGES:
+            steady[stage] += times[stage] / repeats
+    return first, steady, planes
+
+def main():
+    parser = default_argument_parser()
+    parser.add_argument("--points", nargs="+", type=int, default=[20000, 100000])
+    parser.add_argument("--repeats", default=3, type=int)
+    args = parser.parse_args()
+    cfg = setup(args, freeze=False)
+
+    enabled = cfg.compile.enabled
+    cfg.compile.enabled = False
+    predictor = PartFieldPredictor(cfg)
+    cfg.compile.enabled = True
+
+    torch.manual_seed(0)
+    clouds = {n: torch.nn.functional.normalize(torch.randn(1, n, 3), dim=-1).to(predictor.device) * 0.9
+              for n in args.points}
+    eager = {n: measure(predictor, pc, args.repeats) for n, pc in clouds.items()}
+    compile_encoder_stack(cfg, predictor.pvcnn, predictor.triplane_transformer)
+    compiled = {n: measure(predictor, pc, args.repeats) for n, pc in clouds.items()}
+    cfg.compile.enabled = enabled
+
+    print()
+    print("%-22s %8s %12s %12s %12s %12s %9s %11s" % ("stage", "points", "eager 1st", "eager [ms]",
+                                                     "compiled 1st", "compiled [ms]", "speedup", "max |diff|"))
+    for n in args.points:
+        e_first, e_steady, e_planes = eager[n]
+        c_first, c_steady, c_planes = compiled[n]
+        diff = float((c_planes - e_planes).abs().max())
+        for stage in STAGES + ("total",):
+            if stage == "total":
+                e_f, e_s, c_f, c_s = (sum(t.values()) for t in (e_first, e_steady, c_first, c_steady))
+            else:
+                e_f, e_s, c_f, c_s = e_first[stage], e_steady[stage], c_first[stage], c_steady[stage]
+            ### the difference is that of the part planes, i.e. of the whole stack
+            print("%-22s %8d %11.2fs %12.1f %11.2fs %13.1f %8.2fx %11s" % (stage, n, e_f, e_s * 1000, c_f, c_s * 1000, e_s / c_s,
+                                                                        "%.2e" % diff if stage == "total" else ""))
+
+if __name__ == "__main__":
+    main()
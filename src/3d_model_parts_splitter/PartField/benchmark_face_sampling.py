@@ -0,0 +1,113 @@
+"""
+Accuracy report: face features from quadrature rules and adaptive sample counts vs. the
+Monte Carlo baseline.
+
+Encodes every mesh of dataset.data_path once with PartFieldPredictor, then reads the face
+features out with random sampling (the baseline, n_point_per_face points per face), with a
+second random draw of the same size (the Monte Carlo noise floor), with a few smaller
+random counts, with area-adaptive counts (--adaptive) and with each quadrature rule. Every
+readout is compared to the baseline per face (cosine similarity and relative L2 error),
+timed, and its triplane query count reported.
+
+Example:
+    python benchmark_face_sampling.py -c configs/final/demo.yaml --opts \
+        continue_ckpt model/model_objaverse.ckpt dataset.data_path data/objaverse_samples preprocess_mesh True
+"""
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+from partfield.config import default_argument_parser, setup
+from partfield.dataloader import Demo_Dataset
+from partfield.face_features import adaptive_face_kwargs, face_sample_counts, mesh_features
+from partfield.predictor import PartFieldPredictor
+
+def compare(feat, ref):
+    cos = (feat * ref).sum(-1) / (np.linalg.norm(feat, axis=-1) * np.linalg.norm(ref, axis=-1) + 1e-12)
+    rel = np.linalg.norm(feat - ref, axis=-1) / (np.linalg.norm(ref, axis=-1) + 1e-12)
+    return {"cos_mean": float(cos.mean()), "cos_min": float(cos.min()), "rel_l2_mean": float(rel.mean())}
+
+def readout(predictor, part_planes, vertices, faces, seed, **kwargs):
+    torch.manual_seed(seed)
+    if predictor.device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.time()
+    with torch.no_grad(), predictor.autocast():
+        feat = mesh_features(part_planes, vertices, faces, n_sample_each=predictor.n_sample_each, **kwargs)
+    feat = feat.float().cpu().numpy()
+    return feat, time.time() - start
+
+def methods(cfg, args):
+    """
+    (name, mesh_features kwargs, queries per face) of every readout that is compared.
+    """
+    n_ref = cfg.n_point_per_face
+    runs = [("random_%d (2nd draw)" % n_ref, dict(n_point_per_face=n_ref, face_sampling="random"), n_ref)]
+    for n in args.random_counts:
+        runs.append(("random_%d" % n, dict(n_point_per_face=n, face_sampling="random"), n))
+    if args.adaptive:
+        runs.append(("adaptive", dict(n_point_per_face=n_ref, face_sampling="adaptive",
+                                      adaptive=adaptive_face_kwargs(cfg)), None))
+    for n in args.rules:
+        runs.append(("quadrature_%d" % n, dict(n_point_per_face=n_ref, face_sampling="quadrature",
+                                               quadrature_points_per_face=n), n))
+    return runs
+
+def main():
+    parser = default_argument_parser()
+    parser.add_argument("--random_counts", nargs="+", type=int, default=[10, 100])
+    parser.add_argument("--rules", nargs="+", type=int, default=[1, 3, 7, 12])
+    parser.add_argument("--adaptive", action="store_true", help="also report face_sampling adaptive (adaptive_face.*)")
+    parser.add_argument("--output", default="exp_results/bench_face_sampling/report.json")
+    args = parser.parse_args()
+    cfg = setup(args, freeze=False)
+
+    predictor = PartFieldPredictor(cfg)
+    dataset = Demo_Dataset(cfg)
+
+    results = {}
+    for index in range(len(dataset)):
+        item = dataset[index]
+        if 'skipped' in item or 'vertices' not in item:
+            continue
+        uid = item['uid']
+        vertices = predictor.as_tensor(np.asarray(item['vertices']))
+        faces = predictor.as_tensor(np.asarray(item['faces']), torch.int64)
+        pc = item['pc'] if 'pc' in item else predictor.sample_pc(vertices, faces, item['pc_num_pts'])
+        part_planes = predictor.encode(pc)
+
+        ref, ref_time = readout(predictor, part_planes, vertices, faces, seed=0,
+                                n_point_per_face=cfg.n_point_per_face, face_sampling="random")
+        results[uid] = {"n_faces": len(faces), "baseline": {"time": ref_time, "queries": len(faces) * cfg.n_point_per_face}}
+        for name, kwargs, per_face in methods(cfg, args):
+            feat, elapsed = readout(predictor, part_planes, vertices, faces, seed=1, **kwargs)
+            if per_face is None:
+                queries = int(face_sample_counts(vertices, faces, part_planes.shape[-1], **kwargs["adaptive"]).sum())
+            else:
+                queries = len(faces) * per_face
+            results[uid][name] = dict(compare(feat, ref), time=elapsed, queries=queries)
+
+    print()
+    print("baseline: random_%d" % cfg.n_point_per_face)
+    print("%-24s %10s %10s %12s %12s %10s" % ("method", "cos mean", "cos min", "rel L2 mean", "queries", "speedup"))
+    summary = {}
+    for name, _, _ in methods(cfg, args):
+        rows = [r[name] for r in results.values()]
+        if not rows:
+            continue
+        summary[name] = {key: float(np.mean([row[key] for row in rows])) for key in rows[0]}
+        speedup = np.mean([r["baseline"]["time"] / max(r[name]["time"], 1e-9) for r in results.values()])
+        summary[name]["speedup"] = float(speedup)
+        print("%-24s %10.4f %10.4f %12.4f %12.0f %9.1fx" % (name, summary[name]["cos_mean"], summary[name]["cos_min"],
+                                                           summary[name]["rel_l2_mean"], summary[name]["queries"], speedup))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"summary": summary, "per_mesh": results}, f, indent=2)
+    print(f"Saved report to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Parity check and CPU latency benchmark: onnxruntime encoder (encoder_backend "onnx") vs.
+the PyTorch encoder.
+
+Builds a PartFieldPredictor with each backend (the first onnx run exports the encoder to
+onnx.model_path), encodes the same point clouds with both and reports per point count the
+latency of each, the speedup and the difference of the part planes (max abs and relative
+L2). Fails if the relative L2 error exceeds --rtol.
+
+Example:
+    python benchmark_onnx.py -c configs/final/demo.yaml --points 20000 100000 --opts \
+        continue_ckpt model/model_objaverse.ckpt cpu.num_threads 8
+"""
+import torch
+
+from benchmark_utils import timeit
+from partfield.config import default_argument_parser, setup
+from partfield.predictor import PartFieldPredictor
+
+def main():
+    parser = default_argument_parser()
+    parser.add_argument("--points", nargs="+", type=int, default=[20000, 100000])
+    parser.add_argument("--repeats", default=3, type=int)
+    parser.add_argument("--rtol", default=1e-3, type=float, help="max relative L2 error of the part planes")
+    args = parser.parse_args()
+    cfg = setup(args, freeze=False)
+    cfg.device = "cpu"
+
+    cfg.encoder_backend = "torch"
+    torch_predictor = PartFieldPredictor(cfg)
+    cfg.encoder_backend = "onnx"
+    onnx_predictor = PartFieldPredictor(cfg)
+
+    print()
+    print("threads (intra-op):", torch.get_num_threads())
+    print("%8s %12s %12s %9s %12s %12s" % ("points", "torch [ms]", "onnx [ms]", "speedup", "max |diff|", "rel L2"))
+    failed = []
+    torch.manual_seed(0)
+    for n in args.points:
+        pc = torch.nn.functional.normalize(torch.randn(1, n, 3), dim=-1) * 0.9
+        t_torch, ref = timeit(lambda: torch_predictor.encode(pc).float().cpu(), torch_predictor.device, args.repeats)
+        t_onnx, out = timeit(lambda: onnx_predictor.encode(pc).float().cpu(), onnx_predictor.device, args.repeats)
+        rel = float((out - ref).norm() / ref.norm())
+        print("%8d %12.1f %12.1f %8.2fx %12.2e %12.2e" % (n, t_torch * 1000, t_onnx * 1000, t_torch / t_onnx,
+                                                         float((out - ref).abs().max()), rel))
+        if rel > args.rtol:
+            failed.append(n)
+    assert not failed, f"onnx part planes differ by more than rtol {args.rtol} at {failed} points"
+    print(f"parity ok (rtol {args.rtol})")
+
+if __name__ == "__main__":
+    main()
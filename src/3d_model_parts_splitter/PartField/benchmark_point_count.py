@@ -0,0 +1,124 @@
+"""
+Benchmark: segmentation quality vs. encoder point count.
+
+Runs partfield_inference.py + run_part_clustering.py once per point count (and once with the
+adaptive policy), then scores every run against the run with the largest count using the
+compute_metric.py IoU (best-matching predicted part per reference part, averaged).
+If --gt_dir is given (PartObjaverse-Tiny style <uid>.npy face labels), the best mIoU against
+ground truth is reported as well.
+
+Example:
+    python benchmark_point_count.py -c configs/final/demo.yaml --data_path data/ \
+        --counts 10000 20000 50000 100000 --opts continue_ckpt model/model_objaverse.ckpt
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from compute_metric import eval_single_gt_shape
+
+def run_pipeline(args, tag, extra_opts):
+    result_name = f"bench_point_count/{tag}"
+    feat_dir = os.path.join("exp_results", result_name)
+    cluster_dir = os.path.join("exp_results", "bench_point_count_clustering", tag)
+    os.makedirs(cluster_dir, exist_ok=True)
+
+    cmd = [sys.executable, "partfield_inference.py", "-c", args.config, "--opts",
+           "result_name", result_name,
+           "dataset.data_path", args.data_path,
+           "preprocess_mesh", "True"] + extra_opts + args.opts
+    start = time.time()
+    subprocess.check_call(cmd)
+    inference_time = time.time() - start
+
+    cmd = [sys.executable, "run_part_clustering.py",
+           "--root", feat_dir,
+           "--dump_dir", cluster_dir,
+           "--source_dir", args.data_path,
+           "--max_num_clusters", str(args.max_num_clusters),
+           "--use_agglo", "True", "--option", "1", "--with_knn", "True"]
+    subprocess.check_call(cmd)
+    return cluster_dir, inference_time
+
+def load_labels(cluster_dir):
+    """
+    {(uid, k): labels} for every cluster_out/<uid>_0_<k>.npy.
+    """
+    labels = {}
+    for fname in glob.glob(os.path.join(cluster_dir, "cluster_out", "*.npy")):
+        name = os.path.basename(fname)[:-len(".npy")]
+        uid, _, k = name.rsplit("_", 2)
+        labels[(uid, int(k))] = np.squeeze(np.load(fname))
+    return labels
+
+def score_against_reference(labels, ref_labels):
+    mious = []
+    for key, ref in ref_labels.items():
+        if key not in labels or labels[key].shape != ref.shape:
+            continue
+        pred = labels[key]
+        pred_masks = np.array([pred == l for l in np.unique(pred)])
+        mious.append(eval_single_gt_shape(ref, pred_masks))
+    return float(np.mean(mious)) if mious else float("nan")
+
+def score_against_gt(labels, gt_dir):
+    best = {}
+    for (uid, k), pred in labels.items():
+        gt_path = os.path.join(gt_dir, uid + ".npy")
+        if not os.path.exists(gt_path):
+            continue
+        gt_label = np.load(gt_path)
+        if gt_label.shape[0] != pred.shape[0]:
+            continue
+        pred_masks = np.array([pred == l for l in np.unique(pred)])
+        best[uid] = max(best.get(uid, 0), eval_single_gt_shape(gt_label, pred_masks))
+    return float(np.mean(list(best.values()))) if best else float("nan")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", "-c", default="configs/final/demo.yaml")
+    parser.add_argument("--data_path", required=True)
+    parser.add_argument("--counts", nargs="+", type=int, default=[10000, 20000, 50000, 100000])
+    parser.add_argument("--no_adaptive", action="store_true", help="skip the adaptive policy run")
+    parser.add_argument("--max_num_clusters", default=20, type=int)
+    parser.add_argument("--gt_dir", default="", type=str)
+    parser.add_argument("--output", default="exp_results/bench_point_count/report.json")
+    parser.add_argument("--opts", default=[], nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    runs = {}
+    for n_pts in sorted(args.counts):
+        runs[str(n_pts)] = run_pipeline(args, f"pts_{n_pts}",
+                                        ["adaptive_pc.enabled", "False", "pc_num_pts", str(n_pts)])
+    if not args.no_adaptive:
+        runs["adaptive"] = run_pipeline(args, "adaptive", ["adaptive_pc.enabled", "True"])
+
+    ref_tag = str(max(args.counts))
+    ref_labels = load_labels(runs[ref_tag][0])
+
+    report = {}
+    print()
+    print("%-10s %14s %16s %12s" % ("points", "inference [s]", "mIoU vs %s" % ref_tag, "mIoU vs GT"))
+    for tag, (cluster_dir, inference_time) in runs.items():
+        labels = load_labels(cluster_dir)
+        report[tag] = {
+            "inference_time": inference_time,
+            "miou_vs_reference": score_against_reference(labels, ref_labels),
+            "miou_vs_gt": score_against_gt(labels, args.gt_dir) if args.gt_dir else None,
+        }
+        print("%-10s %14.2f %16.2f %12s" % (tag, inference_time, report[tag]["miou_vs_reference"],
+                                            "%.2f" % report[tag]["miou_vs_gt"] if args.gt_dir else "-"))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved report to {args.output}")
+
+if __name__ == "__main__":
+    main()
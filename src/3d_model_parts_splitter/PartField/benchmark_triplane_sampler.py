@@ -0,0 +1,53 @@
+"""
+Micro-benchmark: fused single-call triplane sampling vs. one grid_sample per plane.
+
+Times sample_triplane_feat (encoder_pc.py) and sample_from_planes (triplane.py) against
+their per-plane versions on random planes of the inference shape, for a few point counts,
+and checks that the outputs match.
+
+Example:
+    python benchmark_triplane_sampler.py --device cuda --points 10000 100000 1000000
+"""
+import argparse
+
+import torch
+
+from benchmark_utils import timeit
+from partfield.model.PVCNN.encoder_pc import sample_triplane_feat, sample_triplane_feat_unfused
+from partfield.model.plane_sampling import PLANE_AXES_PAIRS, plane_axes_pairs
+from partfield.model.triplane import sample_from_planes, sample_from_planes_unfused
+
+PLANE_AXES = [[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+              [[1, 0, 0], [0, 0, 1], [0, 1, 0]],
+              [[0, 0, 1], [0, 1, 0], [1, 0, 0]]]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--points", nargs="+", type=int, default=[10000, 100000, 1000000])
+    parser.add_argument("--channels", default=448, type=int)
+    parser.add_argument("--resolution", default=128, type=int)
+    parser.add_argument("--fp16", action="store_true", help="run under fp16 autocast (as in inference on cuda)")
+    parser.add_argument("--repeats", default=10, type=int)
+    args = parser.parse_args()
+    device = torch.device(args.device)
+
+    assert plane_axes_pairs(PLANE_AXES) == PLANE_AXES_PAIRS
+    planes = torch.randn(1, 3, args.channels, args.resolution, args.resolution, device=device)
+    if args.fp16:
+        planes = planes.half()
+
+    print("%-22s %10s %14s %14s %9s %12s" % ("function", "points", "per-plane [ms]", "fused [ms]", "speedup", "max |diff|"))
+    for n_points in args.points:
+        points = torch.rand(1, n_points, 3, device=device) * 2 - 1
+        for name, fused, unfused in [("sample_triplane_feat", sample_triplane_feat, sample_triplane_feat_unfused),
+                                     ("sample_from_planes", sample_from_planes, sample_from_planes_unfused)]:
+            with torch.no_grad(), torch.autocast(device.type, dtype=torch.float16, enabled=args.fp16):
+                t_unfused, ref = timeit(lambda: unfused(planes, points), device, args.repeats)
+                t_fused, out = timeit(lambda: fused(planes, points), device, args.repeats)
+            diff = float((out.float() - ref.float()).abs().max())
+            print("%-22s %10d %14.2f %14.2f %8.2fx %12.2e" % (name, n_points, t_unfused * 1000, t_fused * 1000,
+                                                               t_unfused / t_fused, diff))
+
+if __name__ == "__main__":
+    main()
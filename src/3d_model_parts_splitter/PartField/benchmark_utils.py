@@ -0,0 +1,24 @@
+"""
+Helpers shared by the benchmark_*.py scripts.
+"""
+import time
+
+import torch
+
+def timeit(fn, device, repeats):
+    """
+    Mean wall time of fn() over `repeats` calls after one warm-up call (cuda is
+    synchronized around the timed calls).
+
+    Returns:
+        tuple: (seconds per call, output of the last call).
+    """
+    fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(repeats):
+        out = fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.time() - start) / repeats, out
@@ -0,0 +1,109 @@
+"""
+Parity check and benchmark of the PVConv voxelization stages: shared VoxelGrid +
+channels-as-rows scatter_add_ mean vs. the previous per-block scatter_add_ with channel-expanded indices.
+
+Runs the voxelization of every PVConv block of PVCNNEncoder (resolutions 32, 16, 16, 8)
+on random point clouds, once with the previous routine (indices rebuilt per block) and
+once with one VoxelGrid per resolution shared by the blocks, checks that the voxel
+features agree and reports the time and the peak memory allocated by the stages.
+
+Example:
+    python benchmark_voxelization.py --points 20000 100000 --batch 1 3
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import torch
+
+from benchmark_utils import timeit
+from partfield.model.PVCNN.pc_encoder import PVCNNEncoder
+from partfield.model.PVCNN.pv_module import PVConv
+
+def legacy_voxelization(features, coords, resolution):
+    """
+    The previous my_voxelization (coords: rounded voxel coordinates).
+    """
+    b, c, _ = features.shape
+    result = torch.zeros(b, c + 1, resolution * resolution * resolution, device=features.device, dtype=torch.float)
+    r = resolution
+    r2 = resolution * resolution
+    indices = coords[:, 0] * r2 + coords[:, 1] * r + coords[:, 2]
+    indices = indices.unsqueeze(dim=1).expand(-1, result.shape[1], -1)
+    features = torch.cat([features, torch.ones(features.shape[0], 1, features.shape[2], device=features.device, dtype=features.dtype)], dim=1)
+    out_feature = result.scatter_add_(2, indices.long(), features)
+    cnt = out_feature[:, -1:, :]
+    zero_mask = (cnt == 0).float()
+    cnt = cnt * (1 - zero_mask) + zero_mask * 1e-5
+    vox_feature = out_feature[:, :-1, :] / cnt
+    return vox_feature.view(b, c, resolution, resolution, resolution)
+
+def run_legacy(voxelizations, inputs, coords):
+    outputs = []
+    for voxelization, features in zip(voxelizations, inputs):
+        norm_coords = voxelization.grid(coords).norm_coords
+        outputs.append(legacy_voxelization(features, torch.round(norm_coords), voxelization.r))
+    return outputs
+
+def run_shared(voxelizations, inputs, coords):
+    grids = {}
+    return [voxelization(features, coords, grids)[0] for voxelization, features in zip(voxelizations, inputs)]
+
+def peak_memory(fn, device):
+    """
+    Peak bytes allocated while running fn (CPU: from the profiler's memory timeline).
+    """
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        fn()
+        return torch.cuda.max_memory_allocated() - base
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True,
+                                record_shapes=True, with_stack=True) as prof:
+        fn()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.json")
+        prof.export_memory_timeline(path, device="cpu")
+        with open(path) as f:
+            _, sizes = json.load(f)
+    return max(sum(s) for s in sizes)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--points", nargs="+", type=int, default=[20000, 100000])
+    parser.add_argument("--batch", nargs="+", type=int, default=[1, 3])
+    parser.add_argument("--repeats", default=5, type=int)
+    parser.add_argument("--atol", default=1e-5, type=float)
+    args = parser.parse_args()
+    device = torch.device(args.device)
+
+    encoder = PVCNNEncoder(128, device=device)
+    blocks = [block for block in encoder.encoder if isinstance(block, PVConv)]
+    voxelizations = [block.voxelization for block in blocks]
+
+    print("%6s %8s %12s %12s %9s %14s %14s %12s" % ("batch", "points", "legacy [ms]", "shared [ms]", "speedup",
+                                                    "legacy [MB]", "shared [MB]", "max |diff|"))
+    failed = []
+    for b in args.batch:
+        for n in args.points:
+            torch.manual_seed(0)
+            coords = torch.rand(b, 3, n, device=device) * 2 - 1
+            inputs = [torch.randn(b, block.in_channels, n, device=device) for block in blocks]
+            with torch.no_grad():
+                t_legacy, ref = timeit(lambda: run_legacy(voxelizations, inputs, coords), device, args.repeats)
+                t_shared, out = timeit(lambda: run_shared(voxelizations, inputs, coords), device, args.repeats)
+                m_legacy = peak_memory(lambda: run_legacy(voxelizations, inputs, coords), device)
+                m_shared = peak_memory(lambda: run_shared(voxelizations, inputs, coords), device)
+            diff = max(float((o - r).abs().max()) for o, r in zip(out, ref))
+            print("%6d %8d %12.1f %12.1f %8.2fx %14.1f %14.1f %12.2e" % (b, n, t_legacy * 1000, t_shared * 1000, t_legacy / t_shared,
+                                                                         m_legacy / 2 ** 20, m_shared / 2 ** 20, diff))
+            if diff > args.atol:
+                failed.append((b, n))
+    assert not failed, f"shared voxelization differs by more than {args.atol}: {failed}"
+    print(f"parity ok (atol {args.atol})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+
+import torch
+
+#########################
+## Compiled encoder stack
+#########################
+## With cfg.compile.enabled the pvcnn encoder and the triplane transformer are compiled
+## in place with torch.compile (Module.compile keeps the parameter names, so checkpoints
+## load as usual). Compilation is lazy: the first forward pass per input shape pays for it.
+##
+## Shapes: the transformer always sees 3 x 128 x 128 planes. The encoder input has
+## pc_num_pts points, or the adaptive_pc count rounded to adaptive_pc.bucket, so each
+## bucket is one static graph. compile.dynamic marks the point count dynamic instead:
+## one graph for every count, slightly slower kernels.
+##
+## Cache: inductor's FX graph cache (and the autotuning results) are written to
+## compile.cache_dir. On a volume shared by the workers, a cold worker loads the compiled
+## kernels instead of recompiling them.
+
+def configure_compile_cache(cache_dir):
+    if not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = cache_dir
+    os.environ.setdefault("TRITON_CACHE_DIR", os.path.join(cache_dir, "triton"))
+    import torch._inductor.config as inductor_config
+    inductor_config.fx_graph_cache = True
+
+def compile_encoder_stack(cfg, pvcnn, triplane_transformer):
+    """
+    Compiles `pvcnn` and `triplane_transformer` in place if cfg.compile.enabled.
+
+    Returns:
+        bool: whether the modules were compiled.
+    """
+    if not cfg.compile.enabled:
+        return False
+    configure_compile_cache(cfg.compile.cache_dir)
+    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, cfg.compile.max_shapes)
+    dynamic = bool(cfg.compile.dynamic)
+    for module in (pvcnn, triplane_transformer):
+        module.compile(mode=cfg.compile.mode, dynamic=dynamic)
+    print(f"Compiling pvcnn and triplane_transformer (mode {cfg.compile.mode}, dynamic {dynamic}, "
+          f"cache {cfg.compile.cache_dir or 'default'})")
+    return True
@@ -15,8 +15,45 @@ _C.num_neg_hard_emb = 128
 
 _C.vertex_feature = False  # if true, sample feature on vertices; if false, sample feature on faces
 _C.n_point_per_face = 2000
-_C.n_sample_each = 10000
+_C.face_sampling = "random"  # face feature = mean over "random" points (n_point_per_face) or "quadrature"
+_C.face_quadrature_points = 7  # symmetric triangle rule for face_sampling quadrature: 1, 3, 7 or 12
+# face_sampling "adaptive": random points per face from its projected area in triplane texels
+_C.adaptive_face = CN()
+_C.adaptive_face.points_per_texel = 4.0
+_C.adaptive_face.min_points = 4
+_C.adaptive_face.max_points = 1000
+_C.save_part_planes = False  # also write the fp16 part triplanes (part_planes_<uid>_0.npz, see feature_field.py)
+_C.n_sample_each = 0  # triplane queries per readout chunk; 0 = sized from free device memory
 _C.preprocess_mesh = False
+_C.mesh_cleanup = "native"  # "native" (numpy/scipy) or "pymeshlab"
+_C.mesh_cleanup_compare = False  # if true, also run pymeshlab and report the differences
+_C.mesh_cache_dir = ""  # if set, preprocessed meshes are cached here (keyed by input file hash)
+
+# Per-item memory budget of the datasets (see memory_budget.py)
+_C.memory_budget = CN()
+_C.memory_budget.ceiling_mb = 0  # 0: no ceiling, garbage is collected when close to the available memory
+_C.memory_budget.gc_fraction = 0.75
+_C.memory_budget.action = "downsample"  # items over the ceiling: "downsample" or "reject" (skipped)
+_C.memory_budget.bytes_per_face = 512
+_C.memory_budget.bytes_per_file_byte = 8
+_C.memory_budget.remesh_extra_mb = 1024  # added per item in the remesh path
+
+_C.pc_num_pts = 100000  # encoder input point count
+_C.pc_sampler = "torch"  # "torch" (seeded, see surface_sampler.py) or "trimesh" (unseeded)
+_C.pc_sample_on_device = False  # if true, the encoder point cloud is sampled in predict_step on the inference device
+
+# Adaptive encoder point count (see point_budget.py); pc_num_pts is used when disabled
+_C.adaptive_pc = CN()
+_C.adaptive_pc.enabled = False
+_C.adaptive_pc.min_pts = 10000
+_C.adaptive_pc.max_pts = 100000
+_C.adaptive_pc.pts_per_voxel = 4.0
+_C.adaptive_pc.voxel_resolution = 32
+_C.adaptive_pc.pts_per_face = 2.0
+_C.adaptive_pc.latency_budget_ms = 0.0  # 0 disables the latency cap
+_C.adaptive_pc.base_latency_ms = 0.0
+_C.adaptive_pc.ms_per_kpt = 0.0
+_C.adaptive_pc.bucket = 10000
 
 _C.regress_2d_feat = False
 
@@ -24,6 +61,16 @@ _C.is_pc = False
 
 _C.cut_manifold = False
 _C.remesh_demo = False
+
+# UDF + tetgen remesh used by remesh_demo (see remesh.py)
+_C.remesh = CN()
+_C.remesh.resolution = 256
+_C.remesh.sparse_udf = True  # narrow-band distance field on occupied blocks; False uses dense mesh2sdf
+_C.remesh.band = 2.5  # narrow-band half width, in voxels
+_C.remesh.block_size = 16
+_C.remesh.num_workers = -1  # component workers: 0 serial, -1 one per CPU (threads inside DataLoader workers)
+_C.remesh.chunk_faces = 50000  # components are packed into tasks of about this many faces
+_C.remesh.per_component_tet = False  # run tetgen per group of overlapping components instead of once
 _C.correspondence_demo = False
 
 _C.save_every_epoch = 10
@@ -31,11 +78,15 @@ _C.training_epochs = 30
 _C.continue_training = False
 
 _C.continue_ckpt = None
+_C.inference_only = True  # Model builds only the predict path; False also builds the sdf/feat decoders and losses
+_C.device = ""  # inference device: "" (cuda when available, else cpu), "cuda", "cuda:1", "cpu"
+_C.inference_engine = "lightning"  # "lightning" (Trainer, all GPUs) or "predictor" (PartFieldPredictor, one device)
 _C.epoch_selected = "epoch=50.ckpt"
 
 _C.triplane_resolution = 128
 _C.triplane_channels_low = 128
 _C.triplane_channels_high = 512
+_C.attention_backend = "mha"  # transformer attention: "mha" (nn.MultiheadAttention) or "sdpa" (see model/attention.py)
 _C.lr = 1e-3
 _C.train = True
 _C.test = False
@@ -47,14 +98,50 @@ _C.test_subset = False
 _C.test_corres = False
 _C.test_partobjaversetiny = False
 
+# torch.compile of pvcnn + triplane_transformer for inference (see compile.py)
+_C.compile = CN()
+_C.compile.enabled = False
+_C.compile.mode = "default"  # torch.compile mode: "default", "reduce-overhead" or "max-autotune"
+_C.compile.dynamic = False  # one graph for all point counts instead of one per count (bucket)
+_C.compile.max_shapes = 16  # compiled graphs kept per module before falling back to recompiling
+_C.compile.cache_dir = ""  # inductor cache (e.g. on the shared volume); empty uses the default /tmp location
+
+# onnxruntime encoder backend (see onnx_backend.py)
+_C.encoder_backend = "torch"  # pvcnn + triplane_transformer: "torch" or "onnx" (CPU, inference_engine predictor)
+_C.onnx = CN()
+_C.onnx.model_path = ""  # exported encoder; empty: <checkpoint>.encoder.onnx
+_C.onnx.opset = 20
+_C.onnx.export_points = 20000  # point count of the example input traced at export (the axis stays dynamic)
+
+# int8 quantization of the transformer MLPs for CPU inference (see quantization.py)
+_C.quantization = CN()
+_C.quantization.mode = ""  # "" (fp32) or "dynamic_int8" (inference_engine predictor, CPU)
+_C.quantization.path = ""  # int8 weights written by quantize_partfield.py; empty: <checkpoint>.int8.pt
+_C.quantization.max_cos_drop = 0.002  # calibration: largest mean drop of the feature cosine similarity to fp32
+
+# CPU inference (see device.py)
+_C.cpu = CN()
+_C.cpu.num_threads = 0  # intra-op threads; 0 = physical cores available to the process
+_C.cpu.num_interop_threads = 0  # 0 = min(2, num_threads)
+_C.cpu.n_sample_each = 20000  # triplane readout chunk on CPU; 0 uses n_sample_each
+_C.cpu.bf16_stages = []  # encoder stages run under bf16 autocast on CPU: "pc_encoder", "unet", "transformer" (see precision.py)
+
 _C.dataset = CN()
 _C.dataset.type = "Demo_Dataset"
 _C.dataset.data_path = "objaverse_data/"
 _C.dataset.train_num_workers = 64
-_C.dataset.val_num_workers = 32
+_C.dataset.val_num_workers = 32  # upper bound; inference uses at most one worker per item and CPU
+_C.dataset.persistent_workers = False  # keep inference workers alive between passes (long-lived predictor)
+_C.dataset.prefetch_factor = 2
 _C.dataset.train_batch_size = 2
 _C.dataset.val_batch_size = 2
 _C.dataset.all_files = []  # only used for correspondence demo
+# Manifest-driven streaming (see streaming_dataset.py); used instead of listing data_path when set
+_C.dataset.manifest = ""  # local path or s3:// URI, one input per line
+_C.dataset.s3_endpoint_url = ""  # S3-compatible store endpoint; empty uses the AWS default
+_C.dataset.ledger_dir = ""  # progress ledger; defaults to exp_results/<result_name>/ledger
+_C.dataset.num_shards = 1  # machine-level shards (separate jobs), each further split by rank and worker
+_C.dataset.shard_id = 0
 
 _C.voxel2triplane = CN()
 _C.voxel2triplane.transformer_dim = 1024
@@ -11,18 +11,18 @@ import skimage
 import trimesh
 import os
 from scipy.spatial import KDTree
-import gc
 from plyfile import PlyData
 
 ## For remeshing
-import mesh2sdf
-import tetgen
-import vtk
-import math
-import tempfile
+from partfield.remesh import remesh
 
 ### For mesh processing
-import pymeshlab
+from partfield.mesh_cleanup import preprocess_mesh_arrays
+from partfield.mesh_cache import MeshCache, file_digest, mesh_cache_params
+from partfield.surface_sampler import sample_surface_points
+from partfield.point_budget import PointCountPolicy
+from partfield.memory_budget import MemoryBudget, MemoryBudgetExceeded
+from partfield.device import usable_cpus
 
 from partfield.utils import *
 
@@ -60,33 +60,39 @@ def quad_to_triangle_mesh(F):
     return new_faces
 #########################
 
-class Demo_Dataset(torch.utils.data.Dataset):
-    def __init__(self, cfg):
-        super().__init__()
+#########################
+## Item loading
+#########################
+## One input file -> normalized mesh (or point cloud), encoder point count and point cloud,
+## through the mesh cache and the memory budget. The map-style datasets below are
+## MeshLoaders over a file list; the streaming Manifest_Dataset holds one.
+
+class MeshLoader:
+    def __init__(self, cfg, extra_mb=0):
+        """
+        Point cloud, preprocessing, cache and memory settings shared by every item.
 
+        Parameters:
+            cfg (CfgNode): the inference config.
+            extra_mb (int): memory added to the per-item estimate (remeshing).
+        """
         self.data_path = cfg.dataset.data_path
         self.is_pc = cfg.is_pc
 
-        all_files = os.listdir(self.data_path)
-
-        selected = []
-        for f in all_files:
-            if ".ply" in f and self.is_pc:
-                selected.append(f)
-            elif (".obj" in f or ".glb" in f or ".off" in f) and not self.is_pc:
-                selected.append(f)
-
-        self.data_list = selected
-        self.pc_num_pts = 100000
+        self.pc_num_pts = cfg.pc_num_pts
+        self.pc_sampler = cfg.pc_sampler
+        self.pc_sample_on_device = cfg.pc_sample_on_device
+        self.seed = cfg.seed
+        self.point_policy = PointCountPolicy.from_cfg(cfg) if cfg.adaptive_pc.enabled else None
 
         self.preprocess_mesh = cfg.preprocess_mesh
+        self.mesh_cleanup = cfg.mesh_cleanup
+        self.mesh_cleanup_compare = cfg.mesh_cleanup_compare
         self.result_name = cfg.result_name
 
-        print("val dataset len:", len(self.data_list))
-
-    
-    def __len__(self):
-        return len(self.data_list)
+        self.mesh_cache = MeshCache(cfg.mesh_cache_dir) if cfg.mesh_cache_dir else None
+        self.cache_params = mesh_cache_params(cfg)
+        self.memory_budget = MemoryBudget.from_cfg(cfg, extra_mb=extra_mb)
 
     def load_ply_to_numpy(self, filename):
         """
@@ -108,13 +114,73 @@ class Demo_Dataset(torch.utils.data.Dataset):
 
         return points
 
-    def get_model(self, ply_file):
+    def num_points_for(self, mesh):
+        """
+        Encoder point count for a normalized mesh: fixed pc_num_pts, or chosen by the
+        adaptive policy from its surface area and face count.
+        """
+        if self.point_policy is None:
+            return self.pc_num_pts
+        return self.point_policy.choose(mesh.area, len(mesh.faces))
+
+    def sample_point_cloud(self, mesh, n_pts):
+        """
+        Encoder input points on the mesh surface, or None if they are sampled
+        later on the inference device (pc_sample_on_device).
+        """
+        if self.pc_sampler == "trimesh":
+            pc, _ = trimesh.sample.sample_surface(mesh, n_pts)
+            return pc
+        if self.pc_sample_on_device:
+            return None
+        return sample_surface_points(mesh.vertices, mesh.faces, n_pts, seed=self.seed)
+
+    def load_and_preprocess_mesh(self, obj_path):
+        mesh = load_mesh_util(obj_path)
+        vertices = mesh.vertices
+        faces = mesh.faces
 
-        uid = ply_file.split(".")[-2].replace("/", "_")
+        bbmin = vertices.min(0)
+        bbmax = vertices.max(0)
+        center = (bbmin + bbmax) * 0.5
+        scale = 2.0 * 0.9 / (bbmax - bbmin).max()
+        vertices = (vertices - center) * scale
+        mesh.vertices = vertices
+
+        ### Make sure it is a triangle mesh -- just convert the quad
+        mesh.faces = quad_to_triangle_mesh(faces)
+
+        print("before preprocessing...")
+        print(mesh.vertices.shape)
+        print(mesh.faces.shape)
+        print()
+
+        ### Pre-process mesh
+        if self.preprocess_mesh:
+            vertices, faces = preprocess_mesh_arrays(mesh.vertices, mesh.faces,
+                                                     backend=self.mesh_cleanup,
+                                                     compare=self.mesh_cleanup_compare)
+            mesh.vertices = vertices
+            mesh.faces = faces
+
+            print("after preprocessing...")
+            print(mesh.vertices.shape)
+            print(mesh.faces.shape)
+
+        return mesh
+
+    def get_model(self, ply_file, uid=None, local_path=None):
+        """
+        Load one item. `ply_file` is relative to data_path; `uid` and `local_path`
+        override the uid derived from it and the file actually read.
+        """
+        if uid is None:
+            uid = ply_file.split(".")[-2].replace("/", "_")
 
         ####
         if self.is_pc:
-            ply_file_read = os.path.join(self.data_path, ply_file)
+            ply_file_read = local_path or os.path.join(self.data_path, ply_file)
+            mem_stats = self.memory_budget.begin(uid, ply_file_read)
             pc = self.load_ply_to_numpy(ply_file_read)
 
             bbmin = pc.min(0)
@@ -122,88 +188,95 @@ class Demo_Dataset(torch.utils.data.Dataset):
             center = (bbmin + bbmax) * 0.5
             scale = 2.0 * 0.9 / (bbmax - bbmin).max()
             pc = (pc - center) * scale
+            n_pts = len(pc)
 
         else:
-            obj_path = os.path.join(self.data_path, ply_file)
-            mesh = load_mesh_util(obj_path)
-            vertices = mesh.vertices
-            faces = mesh.faces
-
-            bbmin = vertices.min(0)
-            bbmax = vertices.max(0)
-            center = (bbmin + bbmax) * 0.5
-            scale = 2.0 * 0.9 / (bbmax - bbmin).max()
-            vertices = (vertices - center) * scale
-            mesh.vertices = vertices
-
-            ### Make sure it is a triangle mesh -- just convert the quad
-            mesh.faces = quad_to_triangle_mesh(faces)
-
-            print("before preprocessing...")
-            print(mesh.vertices.shape)
-            print(mesh.faces.shape)
-            print()
-
-            ### Pre-process mesh
-            if self.preprocess_mesh:
-                # Create a PyMeshLab mesh directly from vertices and faces
-                ml_mesh = pymeshlab.Mesh(vertex_matrix=mesh.vertices, face_matrix=mesh.faces)
-
-                # Create a MeshSet and add your mesh
-                ms = pymeshlab.MeshSet()
-                ms.add_mesh(ml_mesh, "from_trimesh")
-
-                # Apply filters
-                ms.apply_filter('meshing_remove_duplicate_faces')
-                ms.apply_filter('meshing_remove_duplicate_vertices')
-                percentageMerge = pymeshlab.PercentageValue(0.5)
-                ms.apply_filter('meshing_merge_close_vertices', threshold=percentageMerge)
-                ms.apply_filter('meshing_remove_unreferenced_vertices')
-
-                # Save or extract mesh
-                processed = ms.current_mesh()
-                mesh.vertices = processed.vertex_matrix()
-                mesh.faces = processed.face_matrix()               
-
-                print("after preprocessing...")
-                print(mesh.vertices.shape)
-                print(mesh.faces.shape)
-
-            ### Save input
+            obj_path = local_path or os.path.join(self.data_path, ply_file)
+            mem_stats = self.memory_budget.begin(uid, obj_path)
+
+            cache_key = None
+            entry = None
+            if self.mesh_cache is not None:
+                cache_key = file_digest(obj_path)
+                entry = self.mesh_cache.load(cache_key, self.cache_params)
+
+            if entry is not None:
+                print("Loaded preprocessed mesh from cache: " + cache_key)
+                mesh = trimesh.Trimesh(vertices=entry['vertices'].astype(np.float64),
+                                       faces=entry['faces'].astype(np.int64), process=False)
+                pc = entry['pc'] if len(entry['pc']) > 0 else None
+                n_pts = self.num_points_for(mesh)
+            else:
+                mesh = self.load_and_preprocess_mesh(obj_path)
+                mesh = self.memory_budget.fit_mesh(mesh, mem_stats)
+                n_pts = self.num_points_for(mesh)
+                print("encoder points:", n_pts)
+                pc = self.sample_point_cloud(mesh, n_pts)
+
+                ### downsampled meshes depend on the memory state, never cache them
+                if self.mesh_cache is not None and mem_stats["action"] == "ok":
+                    self.mesh_cache.save(cache_key, mesh.vertices, mesh.faces,
+                                         pc if pc is not None else np.zeros((0, 3)),
+                                         self.cache_params)
+
+            ### Save input (read by the clustering and application scripts, cached or not)
             save_dir = f"exp_results/{self.result_name}"
             os.makedirs(save_dir, exist_ok=True)
-            view_id = 0            
-            mesh.export(f'{save_dir}/input_{uid}_{view_id}.ply')                
-
-
-            pc, _ = trimesh.sample.sample_surface(mesh, self.pc_num_pts) 
+            view_id = 0
+            mesh.export(f'{save_dir}/input_{uid}_{view_id}.ply')
 
         result = {
                     'uid': uid
                 }
 
-        result['pc'] = torch.tensor(pc, dtype=torch.float32)
+        if pc is not None:
+            result['pc'] = torch.tensor(pc, dtype=torch.float32)
+        result['pc_num_pts'] = n_pts
 
         if not self.is_pc:
             result['vertices'] = mesh.vertices
             result['faces'] = mesh.faces
 
+        self.memory_budget.finish(mem_stats)
         return result
 
-    def __getitem__(self, index):
-        
-        gc.collect()
+#########################
+
+class Demo_Dataset(MeshLoader, torch.utils.data.Dataset):
+    def __init__(self, cfg):
+        MeshLoader.__init__(self, cfg)
+        torch.utils.data.Dataset.__init__(self)
+
+        all_files = os.listdir(self.data_path)
+
+        selected = []
+        for f in all_files:
+            if ".ply" in f and self.is_pc:
+                selected.append(f)
+            elif (".obj" in f or ".glb" in f or ".off" in f) and not self.is_pc:
+                selected.append(f)
+
+        self.data_list = selected
+
+        print("val dataset len:", len(self.data_list))
+
+    def __len__(self):
+        return len(self.data_list)
 
-        return self.get_model(self.data_list[index])
+    def __getitem__(self, index):
+        try:
+            return self.get_model(self.data_list[index])
+        except MemoryBudgetExceeded as e:
+            print("Skipping " + e.uid + ": " + str(e))
+            return {'uid': e.uid, 'skipped': True}
 
 ##############
 
 ###############################
-class Demo_Remesh_Dataset(torch.utils.data.Dataset):
+class Demo_Remesh_Dataset(MeshLoader, torch.utils.data.Dataset):
     def __init__(self, cfg):
-        super().__init__()
-
-        self.data_path = cfg.dataset.data_path
+        MeshLoader.__init__(self, cfg, extra_mb=cfg.memory_budget.remesh_extra_mb)
+        torch.utils.data.Dataset.__init__(self)
 
         all_files = os.listdir(self.data_path)
 
@@ -213,10 +286,7 @@ class Demo_Remesh_Dataset(torch.utils.data.Dataset):
                 selected.append(f)
 
         self.data_list = selected
-        self.pc_num_pts = 100000
-
-        self.preprocess_mesh = cfg.preprocess_mesh
-        self.result_name = cfg.result_name
+        self.remesh_cfg = cfg.remesh
 
         print("val dataset len:", len(self.data_list))
 
@@ -231,6 +301,7 @@ class Demo_Remesh_Dataset(torch.utils.data.Dataset):
 
         ####
         obj_path = os.path.join(self.data_path, ply_file)
+        mem_stats = self.memory_budget.begin(uid, obj_path)
         mesh =  load_mesh_util(obj_path)
         vertices = mesh.vertices
         faces = mesh.faces
@@ -244,30 +315,18 @@ class Demo_Remesh_Dataset(torch.utils.data.Dataset):
 
         ### Pre-process mesh
         if self.preprocess_mesh:
-            # Create a PyMeshLab mesh directly from vertices and faces
-            ml_mesh = pymeshlab.Mesh(vertex_matrix=mesh.vertices, face_matrix=mesh.faces)
-
-            # Create a MeshSet and add your mesh
-            ms = pymeshlab.MeshSet()
-            ms.add_mesh(ml_mesh, "from_trimesh")
-
-            # Apply filters
-            ms.apply_filter('meshing_remove_duplicate_faces')
-            ms.apply_filter('meshing_remove_duplicate_vertices')
-            percentageMerge = pymeshlab.PercentageValue(0.5)
-            ms.apply_filter('meshing_merge_close_vertices', threshold=percentageMerge)
-            ms.apply_filter('meshing_remove_unreferenced_vertices')
-
-
-            # Save or extract mesh
-            processed = ms.current_mesh()
-            mesh.vertices = processed.vertex_matrix()
-            mesh.faces = processed.face_matrix()               
+            vertices, faces = preprocess_mesh_arrays(mesh.vertices, mesh.faces,
+                                                     backend=self.mesh_cleanup,
+                                                     compare=self.mesh_cleanup_compare)
+            mesh.vertices = vertices
+            mesh.faces = faces
 
             print("after preprocessing...")
             print(mesh.vertices.shape)
             print(mesh.faces.shape)
 
+        mesh = self.memory_budget.fit_mesh(mesh, mem_stats)
+
         ### Save input
         save_dir = f"exp_results/{self.result_name}"
         os.makedirs(save_dir, exist_ok=True)
@@ -276,91 +335,134 @@ class Demo_Remesh_Dataset(torch.utils.data.Dataset):
 
         try:
             ###### Remesh ######
-            size= 256
-            level = 2 / size
-
-            sdf = mesh2sdf.core.compute(mesh.vertices, mesh.faces, size)
-            # NOTE: the negative value is not reliable if the mesh is not watertight
-            udf = np.abs(sdf)
-            vertices, faces, _, _ = skimage.measure.marching_cubes(udf, level)
-
-            #### Only use SDF mesh ###
-            # new_mesh = trimesh.Trimesh(vertices, faces)
-            ##########################
-
-            #### Make tet #####
-            components = trimesh.Trimesh(vertices, faces).split(only_watertight=False)
-            new_mesh = [] #trimesh.Trimesh()
-            if len(components) > 100000:
-                raise NotImplementedError
-            for i, c in enumerate(components):
-                c.fix_normals()
-                new_mesh.append(c) #trimesh.util.concatenate(new_mesh, c)
-            new_mesh = trimesh.util.concatenate(new_mesh)
-
-            # generate tet mesh
-            tet = tetgen.TetGen(new_mesh.vertices, new_mesh.faces)
-            tet.tetrahedralize(plc=True, nobisect=1., quality=True, fixedvolume=True, maxvolume=math.sqrt(2) / 12 * (2 / size) ** 3)
-            tmp_vtk = tempfile.NamedTemporaryFile(suffix='.vtk', delete=True)
-            tet.grid.save(tmp_vtk.name)
-
-            # extract surface mesh from tet mesh
-            reader = vtk.vtkUnstructuredGridReader()
-            reader.SetFileName(tmp_vtk.name)
-            reader.Update()
-            surface_filter = vtk.vtkDataSetSurfaceFilter()
-            surface_filter.SetInputConnection(reader.GetOutputPort())
-            surface_filter.Update()
-            polydata = surface_filter.GetOutput()
-            writer = vtk.vtkOBJWriter()
-            tmp_obj = tempfile.NamedTemporaryFile(suffix='.obj', delete=True)
-            writer.SetFileName(tmp_obj.name)
-            writer.SetInputData(polydata)
-            writer.Update()
-            new_mesh =  load_mesh_util(tmp_obj.name)
-            ##########################
-
-            new_mesh.vertices = new_mesh.vertices * (2.0 / size) - 1.0  # normalize it to [-1, 1]
-
-            mesh = new_mesh
+            mesh = remesh(mesh.vertices, mesh.faces, size=self.remesh_cfg.resolution,
+                          sparse=self.remesh_cfg.sparse_udf, band=self.remesh_cfg.band,
+                          block_size=self.remesh_cfg.block_size,
+                          num_workers=self.remesh_cfg.num_workers,
+                          per_component_tet=self.remesh_cfg.per_component_tet,
+                          chunk_faces=self.remesh_cfg.chunk_faces)
         ####################
 
         except:
             print("Error in tet.")
             mesh = mesh 
 
-        pc, _ = trimesh.sample.sample_surface(mesh, self.pc_num_pts) 
-
         result = {
                     'uid': uid
                 }
 
-        result['pc'] = torch.tensor(pc, dtype=torch.float32)
+        n_pts = self.num_points_for(mesh)
+        pc = self.sample_point_cloud(mesh, n_pts)
+        if pc is not None:
+            result['pc'] = torch.tensor(pc, dtype=torch.float32)
+        result['pc_num_pts'] = n_pts
         result['vertices'] = mesh.vertices
         result['faces'] = mesh.faces
 
+        self.memory_budget.finish(mem_stats)
         return result
 
     def __getitem__(self, index):
-        
-        gc.collect()
-
-        return self.get_model(self.data_list[index])
+        try:
+            return self.get_model(self.data_list[index])
+        except MemoryBudgetExceeded as e:
+            print("Skipping " + e.uid + ": " + str(e))
+            return {'uid': e.uid, 'skipped': True}
 
 
 class Correspondence_Demo_Dataset(Demo_Dataset):
     def __init__(self, cfg):
         super().__init__(cfg)
 
-        self.data_path = cfg.dataset.data_path
-        self.is_pc = cfg.is_pc
-
+        ### the files to match, instead of every file of data_path
         self.data_list = cfg.dataset.all_files
 
-        self.pc_num_pts = 100000
+        print("val dataset len:", len(self.data_list))
+    
 
-        self.preprocess_mesh = cfg.preprocess_mesh
-        self.result_name = cfg.result_name
+#########################
+## Inference DataLoader
+#########################
+def inference_num_workers(requested, dataset):
+    """
+    Worker count for an inference DataLoader: never more than the items to load or the
+    CPUs available, and 0 (load in-process) for a single item.
+    """
+    try:
+        n_items = len(dataset)
+    except TypeError:
+        ### iterable datasets may not know their length
+        n_items = requested
+    if n_items <= 1:
+        return 0
+    return max(0, min(requested, n_items, usable_cpus()))
+
+def stack_point_clouds(pcs):
+    """
+    (B, N, 3) stack of point clouds with the same point count.
+    """
+    n_pts = {len(pc) for pc in pcs}
+    assert len(n_pts) == 1, f"Point clouds of different sizes {sorted(n_pts)}, use encode_point_clouds"
+    return torch.stack(list(pcs))
 
-        print("val dataset len:", len(self.data_list))
-    
\ No newline at end of file
+def encode_point_clouds(encode, pcs):
+    """
+    Runs `encode` on a list of (N_i, 3) point clouds whose sizes can differ (adaptive_pc,
+    is_pc inputs): once per group of clouds with the same point count, so every cloud is
+    encoded with all of its points and a fixed-size batch still runs as one stack.
+
+    Parameters:
+        encode (callable): (B, N, 3) point clouds -> (B, ...) planes.
+        pcs (list): per-item point clouds.
+
+    Returns:
+        torch.Tensor: (B, ...) planes in the order of `pcs`.
+    """
+    groups = {}
+    for i, pc in enumerate(pcs):
+        groups.setdefault(len(pc), []).append(i)
+    planes = [None] * len(pcs)
+    for indices in groups.values():
+        out = encode(stack_point_clouds([pcs[i] for i in indices]))
+        for j, i in enumerate(indices):
+            planes[i] = out[j:j + 1]
+    return torch.cat(planes)
+
+def collate_meshes(items):
+    """
+    Collate for batched inference. Point clouds, vertices and faces stay lists of per-item
+    tensors since their sizes differ (the encoder stacks the clouds, see
+    encode_point_clouds). Items skipped by the memory budget are only listed in 'skipped_uids'.
+    """
+    batch = {'uid': [item['uid'] for item in items if 'skipped' not in item],
+             'skipped_uids': [item['uid'] for item in items if 'skipped' in item]}
+    items = [item for item in items if 'skipped' not in item]
+    if not items:
+        return batch
+
+    if 'pc' in items[0]:
+        batch['pc'] = [item['pc'] for item in items]
+    batch['pc_num_pts'] = torch.tensor([int(item['pc_num_pts']) for item in items])
+    if 'vertices' in items[0]:
+        batch['vertices'] = [torch.as_tensor(np.asarray(item['vertices'])) for item in items]
+        batch['faces'] = [torch.as_tensor(np.asarray(item['faces'])) for item in items]
+    return batch
+
+def build_inference_dataloader(cfg, dataset, collate_fn=collate_meshes):
+    num_workers = inference_num_workers(cfg.dataset.val_num_workers, dataset)
+    print("DataLoader workers:", num_workers)
+
+    kwargs = {}
+    if num_workers > 0:
+        ### keep workers (and their imports) alive across epochs/batches of a long-lived predictor
+        kwargs["persistent_workers"] = cfg.dataset.persistent_workers
+        kwargs["prefetch_factor"] = cfg.dataset.prefetch_factor
+
+    return torch.utils.data.DataLoader(dataset,
+                                       num_workers=num_workers,
+                                       batch_size=cfg.dataset.val_batch_size,
+                                       shuffle=False,
+                                       pin_memory=torch.cuda.is_available(),
+                                       drop_last=False,
+                                       collate_fn=collate_fn,
+                                       **kwargs)
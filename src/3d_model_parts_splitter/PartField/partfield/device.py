@@ -0,0 +1,63 @@
+import os
+
+import psutil
+import torch
+
+#########################
+## Inference device selection
+#########################
+## cfg.device picks where inference runs ("" = cuda when available, else cpu). On CPU the
+## intra-op pool is sized to the physical cores this process may use (hyper-threads only
+## add contention for the conv/GEMM kernels), the inter-op pool is kept small since the
+## forward pass is a single chain of ops, and the triplane readout uses cfg.cpu.n_sample_each.
+
+def resolve_device(cfg):
+    if cfg.device:
+        return torch.device(cfg.device)
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+def usable_cpus():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+def physical_cores():
+    ### physical cores among the CPUs this process may run on (cgroup/taskset limits)
+    logical = psutil.cpu_count(logical=True) or 1
+    physical = psutil.cpu_count(logical=False) or logical
+    return max(1, usable_cpus() * physical // logical)
+
+def configure_cpu_threads(cfg):
+    """
+    Apply cfg.cpu thread settings. Must run before the first parallel op, since the
+    inter-op pool cannot be resized once it is in use.
+
+    Returns:
+        tuple: (intra-op threads, inter-op threads) in effect.
+    """
+    num_threads = cfg.cpu.num_threads or physical_cores()
+    torch.set_num_threads(num_threads)
+    num_interop = cfg.cpu.num_interop_threads or min(2, num_threads)
+    try:
+        torch.set_num_interop_threads(num_interop)
+    except RuntimeError:
+        ### already started (e.g. an embedding process ran torch work before)
+        pass
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+def free_memory(device):
+    """
+    Bytes that can still be allocated on `device`.
+    """
+    device = torch.device(device)
+    if device.type == "cuda":
+        free, _ = torch.cuda.mem_get_info(device)
+        ### memory cached by the allocator is reusable as well
+        return free + torch.cuda.memory_reserved(device) - torch.cuda.memory_allocated(device)
+    return psutil.virtual_memory().available
+
+def sample_chunk_size(cfg, device):
+    """
+    Points per triplane readout chunk (n_sample_each) on `device`; 0 = sized from free memory.
+    """
+    if torch.device(device).type == "cpu" and cfg.cpu.n_sample_each > 0:
+        return cfg.cpu.n_sample_each
+    return cfg.n_sample_each
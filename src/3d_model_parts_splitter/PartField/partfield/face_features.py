@@ -0,0 +1,265 @@
+import itertools
+import os
+
+import numpy as np
+import torch
+import trimesh
+from plyfile import PlyData, PlyElement
+
+from partfield.model.PVCNN.encoder_pc import sample_triplane_feat
+from partfield.device import free_memory
+
+#########################
+## Triplane feature readout
+#########################
+## Turns the part triplanes produced by triplane_transformer into per-face, per-vertex or
+## per-point features, and writes the feature/PCA outputs. Shared by the Lightning
+## predict_step and PartFieldPredictor so both produce the same files.
+
+def sample_points(vertices, faces, n_point_per_face):
+    # Generate random barycentric coordinates
+    # borrowed from Kaolin https://github.com/NVIDIAGameWorks/kaolin/blob/master/kaolin/ops/mesh/trianglemesh.py#L43
+    n_f = faces.shape[0]
+    u = torch.sqrt(torch.rand((n_f, n_point_per_face, 1),
+                                device=vertices.device,
+                                dtype=vertices.dtype))
+    v = torch.rand((n_f, n_point_per_face, 1),
+                    device=vertices.device,
+                    dtype=vertices.dtype)
+    w0 = 1 - u
+    w1 = u * (1 - v)
+    w2 = u * v
+
+    face_v_0 = torch.index_select(vertices, 0, faces[:, 0].reshape(-1))
+    face_v_1 = torch.index_select(vertices, 0, faces[:, 1].reshape(-1))
+    face_v_2 = torch.index_select(vertices, 0, faces[:, 2].reshape(-1))
+    points = w0 * face_v_0.unsqueeze(dim=1) + w1 * face_v_1.unsqueeze(dim=1) + w2 * face_v_2.unsqueeze(dim=1)
+    return points
+
+#########################
+## Symmetric triangle quadrature
+#########################
+## Dunavant rules, exact for polynomials up to degree 1/2/5/6. The triplane feature is
+## smooth (bilinear per texel) over a face, so a few weighted points give the face mean
+## that the random samples only estimate, deterministically and with ~100x fewer queries.
+## Each entry: list of (barycentric orbit generator, weight); orbits are expanded to all
+## distinct permutations.
+
+QUADRATURE_RULES = {
+    1: [((1/3, 1/3, 1/3), 1.0)],
+    3: [((2/3, 1/6, 1/6), 1/3)],
+    7: [((1/3, 1/3, 1/3), 0.225),
+        ((0.059715871789770, 0.470142064105115, 0.470142064105115), 0.132394152788506),
+        ((0.797426985353087, 0.101286507323456, 0.101286507323456), 0.125939180544827)],
+    12: [((0.873821971016996, 0.063089014491502, 0.063089014491502), 0.050844906370207),
+         ((0.501426509658179, 0.249286745170910, 0.249286745170910), 0.116786275726379),
+         ((0.636502499121399, 0.310352451033785, 0.053145049844816), 0.082851075618374)],
+}
+
+def quadrature_rule(n_points, device=None, dtype=torch.float32):
+    """
+    Returns:
+        tuple: (n_points, 3) barycentric coordinates and (n_points,) weights summing to 1.
+    """
+    assert n_points in QUADRATURE_RULES, f"No {n_points}-point triangle rule, use one of {sorted(QUADRATURE_RULES)}"
+    bary, weights = [], []
+    for orbit, weight in QUADRATURE_RULES[n_points]:
+        for perm in sorted(set(itertools.permutations(orbit))):
+            bary.append(perm)
+            weights.append(weight)
+    return (torch.tensor(bary, device=device, dtype=dtype),
+            torch.tensor(weights, device=device, dtype=torch.float32))
+
+#########################
+## Chunked readout
+#########################
+## The readout walks the faces in chunks: points are generated per chunk and each chunk's
+## face means are written into a preallocated (F, C) output. With n_sample_each 0 the
+## chunk is sized from the free device (or host) memory and the feature width, so small
+## meshes run in one shot and large ones stay within memory.
+
+def readout_chunk_size(part_planes, n_points, n_sample_each=0, memory_fraction=0.25):
+    """
+    Triplane queries per chunk: n_sample_each if set, else what fits in memory_fraction of
+    the free memory, never more than n_points.
+    """
+    if n_sample_each > 0:
+        return n_sample_each
+    ### per query: three plane samples, their sum and the permuted copy (fp32), plus the point
+    bytes_per_point = 5 * part_planes.shape[2] * 4 + 2 * 3 * 8
+    chunk = int(free_memory(part_planes.device) * memory_fraction / bytes_per_point)
+    return max(1, min(chunk, n_points))
+
+def chunked_face_mean(part_planes, n_faces, n_point_per_face, make_points, n_sample_each, weights=None):
+    """
+    Mean (or `weights`-weighted sum) of the triplane feature over n_point_per_face points
+    per face.
+
+    Parameters:
+        make_points (callable): (f0, f1) -> (f1 - f0, n_point_per_face, 3) points of faces f0..f1.
+        n_sample_each (int): queries per chunk, rounded down to whole faces; 0 = automatic.
+
+    Returns:
+        torch.Tensor: (n_faces, C) float32.
+    """
+    out = torch.empty(n_faces, part_planes.shape[2], device=part_planes.device, dtype=torch.float32)
+    chunk = readout_chunk_size(part_planes, n_faces * n_point_per_face, n_sample_each)
+    faces_per_chunk = max(chunk // n_point_per_face, 1)
+    for f0 in range(0, n_faces, faces_per_chunk):
+        f1 = min(f0 + faces_per_chunk, n_faces)
+        points = make_points(f0, f1).reshape(1, -1, 3).to(torch.float32)
+        sampled_feature = sample_triplane_feat(part_planes, points).reshape(f1 - f0, n_point_per_face, -1)
+        if weights is None:
+            out[f0:f1] = torch.mean(sampled_feature, dim=1)
+        else:
+            out[f0:f1] = (sampled_feature * weights.view(1, -1, 1)).sum(dim=1)
+    return out
+
+#########################
+## Area-adaptive face sampling
+#########################
+## A face gets samples in proportion to the number of triplane texels it covers: its
+## largest axis-aligned projected area (the three planes are xy, yz and xz) over the texel
+## area, clamped to [min_points, max_points]. Slivers far below a texel get min_points,
+## large faces get enough to cover their texels, and the samples are reduced to a face
+## mean by a ragged segment sum.
+
+def face_sample_counts(vertices, faces, plane_res, points_per_texel=4.0, min_points=4, max_points=1000):
+    tri = vertices[faces]
+    cross = torch.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0], dim=-1)
+    projected_area = 0.5 * cross.abs().max(dim=-1).values
+    ### align_corners=True: plane_res samples span [-1, 1]
+    texel_area = (2.0 / (plane_res - 1)) ** 2
+    counts = torch.ceil(projected_area / texel_area * points_per_texel)
+    return counts.clamp(min_points, max_points).long()
+
+def sample_points_ragged(vertices, faces, counts):
+    """
+    `counts[f]` random points on every face f.
+
+    Returns:
+        tuple: (sum(counts), 3) points and the face index of every point.
+    """
+    face_index = torch.repeat_interleave(torch.arange(len(faces), device=faces.device), counts)
+    n = len(face_index)
+    u = torch.sqrt(torch.rand((n, 1), device=vertices.device, dtype=vertices.dtype))
+    v = torch.rand((n, 1), device=vertices.device, dtype=vertices.dtype)
+    face_v = faces[face_index]
+    points = (1 - u) * vertices[face_v[:, 0]] + u * (1 - v) * vertices[face_v[:, 1]] + u * v * vertices[face_v[:, 2]]
+    return points, face_index
+
+def sample_and_segment_mean(part_planes, vertices, faces, counts, n_sample_each):
+    """
+    Mean triplane feature per face over `counts[f]` random points on every face f, in
+    chunks of whole faces of about n_sample_each points (0 = automatic).
+    """
+    out = torch.zeros(len(faces), part_planes.shape[2], device=part_planes.device, dtype=torch.float32)
+    chunk = readout_chunk_size(part_planes, int(counts.sum()), n_sample_each)
+    ends = torch.cumsum(counts, 0)
+    f0 = 0
+    while f0 < len(faces):
+        start = int(ends[f0 - 1]) if f0 > 0 else 0
+        f1 = max(int(torch.searchsorted(ends, start + chunk, right=True)), f0 + 1)
+        points, face_index = sample_points_ragged(vertices, faces[f0:f1], counts[f0:f1])
+        sampled_feature = sample_triplane_feat(part_planes, points.reshape(1, -1, 3).to(torch.float32))[0]
+        out.index_add_(0, face_index + f0, sampled_feature.float())
+        f0 = f1
+    return out / counts.unsqueeze(-1).to(out.dtype)
+
+def mesh_features(part_planes, vertices, faces, n_point_per_face, n_sample_each, vertex_feature=False,
+                  face_sampling="random", quadrature_points_per_face=7, adaptive=None):
+    """
+    Mean triplane feature over every face, or the feature at every vertex if `vertex_feature`.
+    The face mean is estimated from `n_point_per_face` random points (face_sampling
+    "random"), from an area-dependent number of random points (face_sampling "adaptive",
+    with the face_sample_counts keyword arguments in `adaptive`), or integrated with a
+    symmetric rule of `quadrature_points_per_face` points (face_sampling "quadrature").
+
+    Parameters:
+        part_planes (torch.Tensor): (1, 3, C, H, W) part triplanes.
+        vertices (torch.Tensor): (V, 3) normalized vertices, on the planes' device.
+        faces (torch.Tensor): (F, 3) face indices.
+
+    Returns:
+        torch.Tensor: (F, C), or (V, C) for vertex features.
+    """
+    if vertex_feature:
+        point_feat = chunked_face_mean(part_planes, len(vertices), 1,
+                                       lambda f0, f1: vertices[f0:f1], n_sample_each)
+    elif face_sampling == "quadrature":
+        bary, weights = quadrature_rule(quadrature_points_per_face, device=vertices.device, dtype=vertices.dtype)
+        point_feat = chunked_face_mean(part_planes, len(faces), quadrature_points_per_face,
+                                       lambda f0, f1: torch.einsum('qk,fkd->fqd', bary, vertices[faces[f0:f1]]),
+                                       n_sample_each, weights=weights)
+    elif face_sampling == "adaptive":
+        counts = face_sample_counts(vertices, faces, part_planes.shape[-1], **(adaptive or {}))
+        point_feat = sample_and_segment_mean(part_planes, vertices, faces, counts, n_sample_each)
+    elif face_sampling == "random":
+        point_feat = chunked_face_mean(part_planes, len(faces), n_point_per_face,
+                                       lambda f0, f1: sample_points(vertices, faces[f0:f1], n_point_per_face),
+                                       n_sample_each)
+    else:
+        raise ValueError(f"Unknown face_sampling: {face_sampling}")
+    return point_feat.reshape(-1, point_feat.shape[-1])
+
+def adaptive_face_kwargs(cfg):
+    c = cfg.adaptive_face
+    return dict(points_per_texel=c.points_per_texel, min_points=c.min_points, max_points=c.max_points)
+
+def point_features(part_planes, points):
+    """
+    Triplane feature at every point of an (M, 3) or (1, M, 3) point cloud, as (M, C).
+    """
+    point_feat = sample_triplane_feat(part_planes, points.reshape(1, -1, 3).to(part_planes.dtype)) # N, M, C
+    return point_feat.reshape(-1, point_feat.shape[-1])
+
+def pca_colors(point_feat):
+    from sklearn.decomposition import PCA
+    data_scaled = point_feat / np.linalg.norm(point_feat, axis=-1, keepdims=True)
+
+    pca = PCA(n_components=3)
+
+    data_reduced = pca.fit_transform(data_scaled)
+    data_reduced = (data_reduced - data_reduced.min()) / (data_reduced.max() - data_reduced.min())
+    return (data_reduced * 255).astype(np.uint8)
+
+def export_mesh_pca(filename, vertices, faces, point_feat, vertex_feature=False):
+    colors_255 = pca_colors(point_feat)
+    if vertex_feature:
+        colored_mesh = trimesh.Trimesh(vertices=vertices, faces=faces, vertex_colors=colors_255, process=False)
+    else:
+        colored_mesh = trimesh.Trimesh(vertices=vertices, faces=faces, face_colors=colors_255, process=False)
+    colored_mesh.export(filename)
+
+def export_pc_pca(filename, points, point_feat):
+    colors_255 = pca_colors(point_feat)
+    assert colors_255.shape == points.shape, "Colors must have the same shape as points"
+
+    # Convert to structured array for PLY format
+    vertex_data = np.array(
+        [(*point, *color) for point, color in zip(points, colors_255)],
+        dtype=[("x", "f4"), ("y", "f4"), ("z", "f4"), ("red", "u1"), ("green", "u1"), ("blue", "u1")]
+    )
+
+    # Create PLY element
+    el = PlyElement.describe(vertex_data, "vertex")
+    PlyData([el], text=True).write(filename)
+    print(f"Saved PLY file: {filename}")
+
+def output_exists(save_dir, uid, view_id=0):
+    return os.path.exists(f'{save_dir}/part_feat_{uid}_{view_id}.npy') or os.path.exists(f'{save_dir}/part_feat_{uid}_{view_id}_batch.npy')
+
+def save_outputs(save_dir, uid, point_feat, vertices=None, faces=None, points=None, vertex_feature=False, view_id=0):
+    """
+    Writes the features of one item in the layout run_part_clustering.py reads: point cloud
+    features as part_feat_<uid>_0.npy, mesh features as part_feat_<uid>_0_batch.npy, plus
+    the feat_pca_<uid>_0.ply preview.
+    """
+    if points is not None:
+        np.save(f'{save_dir}/part_feat_{uid}_{view_id}.npy', point_feat)
+        print(f"Exported part_feat_{uid}_{view_id}.npy")
+        export_pc_pca(f'{save_dir}/feat_pca_{uid}_{view_id}.ply', points, point_feat)
+    else:
+        np.save(f'{save_dir}/part_feat_{uid}_{view_id}_batch.npy', point_feat)
+        print(f"Exported part_feat_{uid}_{view_id}.npy")
+        export_mesh_pca(f'{save_dir}/feat_pca_{uid}_{view_id}.ply', vertices, faces, point_feat, vertex_feature)
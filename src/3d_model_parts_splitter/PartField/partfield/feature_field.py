@@ -0,0 +1,120 @@
+import contextlib
+
+import numpy as np
+import torch
+
+from partfield.device import sample_chunk_size
+from partfield.face_features import adaptive_face_kwargs, mesh_features, point_features
+
+#########################
+## Persisted part triplanes
+#########################
+## With cfg.save_part_planes the inference engines also write the part triplanes of every
+## item as part_planes_<uid>_0.npz (fp16, about 44 MB for 3 x 448 x 128 x 128). They are
+## the whole feature field: TriplaneFeatureField loads them on CPU or GPU and returns
+## features for any points, faces or vertices without PVCNN or the transformer, e.g. for a
+## decimated or remeshed derivative of the asset.
+##
+## Queries take coordinates in the normalized frame the planes were computed in. The
+## datasets center the bounding box and scale its longest side to 1.8; `normalize` applies
+## the same to another mesh of the asset (its bounding box must match the original's).
+##
+##   field = TriplaneFeatureField.load("exp_results/demo/part_planes_chair_0.npz")
+##   face_feat = field.faces(field.normalize(vertices), faces)
+
+def part_planes_path(save_dir, uid, view_id=0):
+    return f'{save_dir}/part_planes_{uid}_{view_id}.npz'
+
+def save_part_planes(save_dir, uid, part_planes, view_id=0):
+    """
+    Writes the (1, 3, C, H, W) part planes of one item as fp16.
+    """
+    planes = part_planes.detach().reshape(part_planes.shape[-4:]).to("cpu", torch.float16).numpy()
+    np.savez(part_planes_path(save_dir, uid, view_id), part_planes=planes)
+    print(f"Exported part_planes_{uid}_{view_id}.npz")
+
+class TriplaneFeatureField:
+    def __init__(self, part_planes, device=None):
+        """
+        Parameters:
+            part_planes (array or torch.Tensor): (3, C, H, W) or (1, 3, C, H, W) part planes.
+            device (str, optional): defaults to cuda when available. The planes stay fp16
+                on cuda (queries run under fp16 autocast, as in inference) and are
+                converted to fp32 on CPU.
+        """
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        planes = torch.as_tensor(part_planes)
+        planes = planes.reshape(1, *planes.shape[-4:])
+        dtype = torch.float16 if self.device.type == "cuda" else torch.float32
+        self.part_planes = planes.to(self.device, dtype)
+
+    @classmethod
+    def load(cls, path, device=None):
+        with np.load(path) as data:
+            return cls(data["part_planes"], device=device)
+
+    @classmethod
+    def load_item(cls, save_dir, uid, view_id=0, device=None):
+        return cls.load(part_planes_path(save_dir, uid, view_id), device=device)
+
+    @staticmethod
+    def normalize(vertices):
+        """
+        Vertices centered and scaled the way the datasets normalize an input mesh.
+        """
+        vertices = np.asarray(vertices, dtype=np.float64)
+        bbmin = vertices.min(0)
+        bbmax = vertices.max(0)
+        center = (bbmin + bbmax) * 0.5
+        scale = 2.0 * 0.9 / (bbmax - bbmin).max()
+        return (vertices - center) * scale
+
+    def autocast(self):
+        if self.device.type == "cuda":
+            return torch.autocast("cuda", dtype=torch.float16)
+        return contextlib.nullcontext()
+
+    def as_tensor(self, x, dtype=torch.float32):
+        return torch.as_tensor(x).to(self.device, dtype)
+
+    @torch.no_grad()
+    def points(self, points):
+        """
+        Features at (M, 3) normalized points, as an (M, C) numpy array.
+        """
+        with self.autocast():
+            feat = point_features(self.part_planes, self.as_tensor(points))
+        return feat.float().cpu().numpy()
+
+    @torch.no_grad()
+    def faces(self, vertices, faces, cfg=None, n_point_per_face=2000, n_sample_each=0,
+              face_sampling="random", quadrature_points_per_face=7, adaptive=None):
+        """
+        Per-face features of a normalized mesh, read out like the inference engines do.
+        With `cfg` the readout settings (n_point_per_face, face_sampling, ...) are taken
+        from it, otherwise from the keyword arguments (see mesh_features).
+
+        Returns:
+            np.ndarray: (F, C) features.
+        """
+        if cfg is not None:
+            n_point_per_face = cfg.n_point_per_face
+            n_sample_each = sample_chunk_size(cfg, self.device)
+            face_sampling = cfg.face_sampling
+            quadrature_points_per_face = cfg.face_quadrature_points
+            adaptive = adaptive_face_kwargs(cfg)
+        with self.autocast():
+            feat = mesh_features(self.part_planes, self.as_tensor(vertices), self.as_tensor(faces, torch.int64),
+                                 n_point_per_face, n_sample_each, face_sampling=face_sampling,
+                                 quadrature_points_per_face=quadrature_points_per_face, adaptive=adaptive)
+        return feat.float().cpu().numpy()
+
+    @torch.no_grad()
+    def vertices(self, vertices, n_sample_each=0):
+        """
+        Features at the vertices of a normalized mesh, as a (V, C) numpy array.
+        """
+        vertices = self.as_tensor(vertices)
+        with self.autocast():
+            feat = mesh_features(self.part_planes, vertices, None, 1, n_sample_each, vertex_feature=True)
+        return feat.float().cpu().numpy()
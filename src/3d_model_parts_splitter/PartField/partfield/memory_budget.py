@@ -0,0 +1,173 @@
+import gc
+import json
+import os
+import resource
+import time
+
+import numpy as np
+import psutil
+
+from partfield.mesh_cleanup import remove_duplicate_faces, remove_unreferenced_vertices
+
+#########################
+## Per-item memory budget
+#########################
+## Replaces the unconditional gc.collect() at the start of every __getitem__.
+## Item memory is estimated from the file size before loading and from the face count once
+## the mesh is loaded. A full collection only runs when the process RSS plus that estimate
+## gets close to the limit, and meshes that would still exceed the ceiling are downsampled
+## (vertex clustering) or rejected. One JSON line of statistics is written per item.
+
+MB = 1 << 20
+
+class MemoryBudgetExceeded(MemoryError):
+    def __init__(self, uid, reason):
+        super().__init__(reason)
+        self.uid = uid
+
+def cluster_decimate(vertices, faces, target_faces):
+    """
+    Vertex-clustering decimation: snap vertices to a uniform grid, merge each cell into the
+    mean of its vertices, and drop faces that collapse. The cell size grows until the mesh
+    has at most `target_faces` faces.
+    """
+    extent = float((vertices.max(0) - vertices.min(0)).max())
+    ### start from the cell size at which the surface would hold about target_faces faces
+    area = 0.5 * np.linalg.norm(np.cross(vertices[faces[:, 1]] - vertices[faces[:, 0]],
+                                         vertices[faces[:, 2]] - vertices[faces[:, 0]]), axis=1).sum()
+    cell = max(np.sqrt(2.0 * area / max(target_faces, 1)), extent * 1e-4)
+
+    while True:
+        keys = np.floor((vertices - vertices.min(0)) / cell).astype(np.int64)
+        _, cluster, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        cluster = cluster.reshape(-1)
+        new_vertices = np.zeros((len(counts), 3))
+        np.add.at(new_vertices, cluster, vertices)
+        new_vertices /= counts[:, None]
+
+        new_faces = cluster[faces]
+        new_faces = new_faces[(new_faces[:, 0] != new_faces[:, 1]) &
+                              (new_faces[:, 1] != new_faces[:, 2]) &
+                              (new_faces[:, 2] != new_faces[:, 0])]
+        new_faces = remove_duplicate_faces(new_faces)
+        if len(new_faces) <= target_faces or cell > extent:
+            return remove_unreferenced_vertices(new_vertices, new_faces)
+        cell *= 1.25
+
+class MemoryBudget:
+    def __init__(self, ceiling_mb=0, gc_fraction=0.75, action="downsample", bytes_per_face=512,
+                 bytes_per_file_byte=8, extra_mb=0, min_faces=1000, stats_path=None):
+        """
+        Parameters:
+            ceiling_mb (float): process memory ceiling; 0 means no ceiling (only the
+                collection trigger is used, against available system memory).
+            gc_fraction (float): collect garbage once RSS + estimate exceeds this fraction
+                of the limit.
+            action (str): "downsample" or "reject" for items that exceed the ceiling.
+            bytes_per_face (float): estimated peak bytes per face while an item is processed.
+            bytes_per_file_byte (float): estimated peak bytes per input file byte while parsing.
+            extra_mb (float): fixed per-item overhead (e.g. the remesh grids).
+            min_faces (int): items that would have to be downsampled below this are rejected.
+            stats_path (str, optional): JSONL file the per-item statistics are appended to.
+        """
+        assert action in ("downsample", "reject"), f"Unknown memory budget action: {action}"
+        self.ceiling = ceiling_mb * MB
+        self.gc_fraction = gc_fraction
+        self.action = action
+        self.bytes_per_face = bytes_per_face
+        self.bytes_per_file_byte = bytes_per_file_byte
+        self.extra = extra_mb * MB
+        self.min_faces = min_faces
+        self.stats_path = stats_path
+        self.process = psutil.Process()
+
+    @classmethod
+    def from_cfg(cls, cfg, extra_mb=0):
+        c = cfg.memory_budget
+        return cls(ceiling_mb=c.ceiling_mb, gc_fraction=c.gc_fraction, action=c.action,
+                   bytes_per_face=c.bytes_per_face, bytes_per_file_byte=c.bytes_per_file_byte,
+                   extra_mb=extra_mb,
+                   stats_path=os.path.join(f"exp_results/{cfg.result_name}", "memory_stats.jsonl"))
+
+    def rss(self):
+        return self.process.memory_info().rss
+
+    def limit(self):
+        if self.ceiling > 0:
+            return self.ceiling
+        return self.rss() + psutil.virtual_memory().available
+
+    def estimate_file(self, path):
+        return os.path.getsize(path) * self.bytes_per_file_byte + self.extra
+
+    def estimate_faces(self, n_faces):
+        return n_faces * self.bytes_per_face + self.extra
+
+    def ensure_room(self, estimate, stats):
+        """
+        Collect garbage if RSS + `estimate` is close to the limit. Returns the headroom left.
+        """
+        limit = self.limit()
+        if self.rss() + estimate > self.gc_fraction * limit:
+            start = time.time()
+            gc.collect()
+            stats["gc_runs"] = stats.get("gc_runs", 0) + 1
+            stats["gc_time"] = stats.get("gc_time", 0.0) + time.time() - start
+        return limit - self.rss()
+
+    def begin(self, uid, path):
+        """
+        Before loading `path`: make room for it, or reject it if even its parse estimate
+        exceeds the ceiling. Returns the stats dict for this item.
+        """
+        stats = {"uid": uid, "file_mb": os.path.getsize(path) / MB, "rss_before_mb": self.rss() / MB,
+                 "action": "ok", "start": time.time()}
+        estimate = self.estimate_file(path)
+        stats["file_estimate_mb"] = estimate / MB
+        headroom = self.ensure_room(estimate, stats)
+        if self.ceiling > 0 and estimate > headroom and self.action == "reject":
+            self.reject(stats, f"{path}: estimated {estimate / MB:.0f} MB to load, {headroom / MB:.0f} MB left")
+        return stats
+
+    def fit_mesh(self, mesh, stats):
+        """
+        After loading: downsample or reject the mesh if its face-count estimate does not
+        fit under the ceiling. Returns the (possibly decimated) mesh.
+        """
+        n_faces = len(mesh.faces)
+        estimate = self.estimate_faces(n_faces)
+        stats["n_faces"] = n_faces
+        stats["face_estimate_mb"] = estimate / MB
+        headroom = self.ensure_room(estimate, stats)
+        if self.ceiling <= 0 or estimate <= headroom:
+            return mesh
+
+        target = int(max(headroom - self.extra, 0) / self.bytes_per_face)
+        if self.action == "reject" or target < self.min_faces:
+            self.reject(stats, f"{stats['uid']}: {n_faces} faces need an estimated {estimate / MB:.0f} MB, "
+                               f"{headroom / MB:.0f} MB left")
+
+        vertices, faces = cluster_decimate(np.asarray(mesh.vertices), np.asarray(mesh.faces), target)
+        mesh.vertices = vertices
+        mesh.faces = faces
+        stats["action"] = "downsampled"
+        stats["n_faces_downsampled"] = len(faces)
+        print(f"Downsampled {stats['uid']} from {n_faces} to {len(faces)} faces to fit the memory budget")
+        return mesh
+
+    def reject(self, stats, reason):
+        stats["action"] = "rejected"
+        stats["reason"] = reason
+        self.finish(stats)
+        raise MemoryBudgetExceeded(stats["uid"], reason)
+
+    def finish(self, stats):
+        stats["rss_after_mb"] = self.rss() / MB
+        # ru_maxrss is in kilobytes on Linux
+        stats["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        stats["time"] = time.time() - stats.pop("start")
+        if self.stats_path:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            with open(self.stats_path, "a") as f:
+                f.write(json.dumps(stats) + "\n")
+        return stats
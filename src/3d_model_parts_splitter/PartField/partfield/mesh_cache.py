@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+#########################
+## Preprocessed-mesh cache
+#########################
+## One .npz entry per input file, keyed by the sha256 of its bytes. An entry holds the
+## cleaned + normalized mesh, the encoder point cloud and the shared-edge face adjacency,
+## so inference, clustering and repeat requests skip cleanup and PLY parsing. Vertices are
+## stored in float64, so a cache hit gives the same mesh as the run that wrote the entry.
+
+def mesh_cache_params(cfg):
+    """
+    Preprocessing parameters of the inference config that a cache entry must match to be
+    reused (the dataloader and run_part_clustering.py look entries up with the same ones).
+    """
+    from partfield.point_budget import PointCountPolicy
+    return {
+        "preprocess_mesh": bool(cfg.preprocess_mesh),
+        "mesh_cleanup": cfg.mesh_cleanup,
+        "pc_num_pts": PointCountPolicy.from_cfg(cfg).describe() if cfg.adaptive_pc.enabled else int(cfg.pc_num_pts),
+        "pc_sampler": cfg.pc_sampler,
+        "pc_sample_on_device": bool(cfg.pc_sample_on_device),
+        "seed": int(cfg.seed),
+    }
+
+def mesh_cache_params_from_config(config_file, opts=()):
+    """
+    mesh_cache_params of the inference config built by partfield_inference.py
+    -c <config_file> --opts <opts>.
+    """
+    from partfield.config import setup
+    args = argparse.Namespace(config_file=config_file, opts=list(opts or []))
+    return mesh_cache_params(setup(args, freeze=False))
+
+def file_digest(filename, chunk_size=1 << 20):
+    """
+    sha256 hex digest of a file's content.
+    """
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def face_edge_adjacency(faces):
+    """
+    Pairs of faces that share an edge, computed with a sorted edge-key pass.
+
+    Parameters:
+        faces (numpy.ndarray): (M, 3) triangle indices.
+
+    Returns:
+        numpy.ndarray: (K, 2) int32 array of face pairs (fi < fj), one row per pair
+            of distinct faces sharing an edge.
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    n_f = len(faces)
+    if n_f == 0:
+        return np.zeros((0, 2), dtype=np.int32)
+
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    edge_face = np.repeat(np.arange(n_f), 3)
+    n_v = int(faces.max()) + 1
+    keys = edges[:, 0] * n_v + edges[:, 1]
+
+    order = np.argsort(keys, kind="stable")
+    keys, edge_face = keys[order], edge_face[order]
+
+    ### group equal edge keys; every pair inside a group is adjacent
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(keys)])
+
+    all_pairs = []
+    for size in np.unique(sizes[sizes > 1]):
+        group_starts = starts[sizes == size]
+        a, b = np.triu_indices(size, k=1)
+        fi = edge_face[group_starts[:, None] + a[None, :]].reshape(-1)
+        fj = edge_face[group_starts[:, None] + b[None, :]].reshape(-1)
+        all_pairs.append(np.stack([np.minimum(fi, fj), np.maximum(fi, fj)], axis=1))
+
+    if len(all_pairs) == 0:
+        return np.zeros((0, 2), dtype=np.int32)
+
+    pairs = np.concatenate(all_pairs)
+    ### a face pair can share several edges (or a face can repeat a vertex): keep it once
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    pairs = np.unique(pairs, axis=0)
+    return pairs.astype(np.int32)
+
+class MeshCache:
+    """
+    Directory of preprocessed mesh entries, one `<digest>.npz` per input file.
+    Writes go through a temporary file and os.replace, so concurrent workers never
+    read a partial entry.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key, params=None):
+        """
+        Load the entry for `key`. If `params` is given, the entry is only returned when
+        it was produced with the same preprocessing parameters.
+
+        Returns:
+            dict or None: vertices, faces, pc, face_adjacency and params.
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                entry = {k: data[k] for k in data.files}
+        except Exception as e:
+            print(f"Ignoring unreadable mesh cache entry {path}: {e}")
+            return None
+
+        entry["params"] = json.loads(str(entry["params"]))
+        if params is not None and entry["params"] != params:
+            return None
+        return entry
+
+    def save(self, key, vertices, faces, pc, params, face_adjacency=None):
+        if face_adjacency is None:
+            face_adjacency = face_edge_adjacency(faces)
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".npz", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f,
+                         vertices=np.asarray(vertices, dtype=np.float64),
+                         faces=np.asarray(faces, dtype=np.int32),
+                         pc=np.asarray(pc, dtype=np.float32),
+                         face_adjacency=np.asarray(face_adjacency, dtype=np.int32),
+                         params=np.array(json.dumps(params, sort_keys=True)))
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,223 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+#########################
+## Native mesh cleanup
+#########################
+## NumPy/SciPy equivalent of the pymeshlab filter chain used by the dataloaders:
+##   meshing_remove_duplicate_faces
+##   meshing_remove_duplicate_vertices
+##   meshing_merge_close_vertices
+##   meshing_remove_unreferenced_vertices
+## Works on the vertex/face arrays directly, without building a MeshSet copy.
+
+def remove_duplicate_faces(faces):
+    """
+    Drop faces that reference the same vertex set as an earlier face (orientation ignored).
+    The first occurrence is kept and the original face order is preserved.
+    """
+    if len(faces) == 0:
+        return faces
+    keys = np.sort(faces, axis=1)
+    n_v = int(keys.max()) + 1
+    if n_v < 2 ** 21:
+        ### pack the sorted triple into one int64 so the dedupe is a 1D sort
+        keys = (keys[:, 0] * n_v + keys[:, 1]) * n_v + keys[:, 2]
+        _, first = np.unique(keys, return_index=True)
+    else:
+        _, first = np.unique(keys, axis=0, return_index=True)
+    if len(first) == len(faces):
+        return faces
+    return faces[np.sort(first)]
+
+def remove_duplicate_vertices(vertices, faces):
+    """
+    Weld vertices with exactly identical coordinates and remap the faces.
+    """
+    if len(vertices) == 0:
+        return vertices, faces
+    ### compare rows as raw bytes: a 1D unique is much faster than np.unique(axis=0)
+    rows = np.ascontiguousarray(vertices) + 0.0  # folds -0.0 into 0.0
+    rows = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).reshape(-1)
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    if len(first) == len(vertices):
+        return vertices, faces
+    ### Keep survivors in their original order
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    vertices = vertices[first[order]]
+    faces = rank[inverse.reshape(-1)][faces]
+    return vertices, faces
+
+def greedy_radius_clusters(vertices, radius):
+    """
+    Assign every vertex to a representative, following the same greedy rule as
+    vcg's MergeCloseVertex: vertices are visited in index order and each surviving
+    vertex absorbs every not-yet-absorbed vertex within `radius`.
+
+    The sequential rule is resolved in vectorized rounds over the KD-tree pairs: a vertex
+    is decided once all of its lower-index neighbours are decided, and it joins the
+    lowest-index representative among them (or becomes a representative itself).
+
+    Returns:
+        numpy.ndarray: (N,) index of the representative of each vertex.
+    """
+    n_v = len(vertices)
+    rep = np.arange(n_v)
+    if n_v == 0 or radius <= 0:
+        return rep
+
+    pairs = cKDTree(vertices).query_pairs(radius, output_type='ndarray')
+    if len(pairs) == 0:
+        return rep
+
+    ### pairs are (i, j) with i < j: j can only be absorbed by a lower index i
+    lo, hi = pairs[:, 0], pairs[:, 1]
+    order = np.lexsort((lo, hi))
+    lo, hi = lo[order], hi[order]
+
+    UNDECIDED, REP, MERGED = 0, 1, 2
+    state = np.zeros(n_v, dtype=np.int8)
+    has_lower = np.zeros(n_v, dtype=bool)
+    has_lower[hi] = True
+    state[~has_lower] = REP
+
+    while True:
+        pending = state[hi] == UNDECIDED
+        if not pending.any():
+            break
+        lo_p, hi_p = lo[pending], hi[pending]
+
+        ### A pending vertex is ready once none of its lower neighbours is undecided
+        blocked = np.zeros(n_v, dtype=bool)
+        blocked[hi_p[state[lo_p] == UNDECIDED]] = True
+        ready = ~blocked[hi_p]
+
+        lo_r, hi_r = lo_p[ready], hi_p[ready]
+        absorbed = state[lo_r] == REP
+        ### lowest-index representative wins (pairs are sorted by lo within each hi)
+        tgt_hi, first = np.unique(hi_r[absorbed], return_index=True)
+        rep[tgt_hi] = lo_r[absorbed][first]
+        state[tgt_hi] = MERGED
+
+        new_reps = np.setdiff1d(np.unique(hi_r), tgt_hi, assume_unique=True)
+        state[new_reps] = REP
+
+    return rep
+
+def merge_close_vertices(vertices, faces, threshold):
+    """
+    Merge vertices closer than `threshold` (absolute distance) into their greedy
+    representative. Faces are remapped and the ones that collapse (a repeated vertex)
+    are dropped, as MeshLab's filter does.
+    """
+    rep = greedy_radius_clusters(vertices, threshold)
+    if np.all(rep == np.arange(len(rep))):
+        return vertices, faces
+    faces = rep[faces]
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])
+    return vertices, faces[keep]
+
+def remove_unreferenced_vertices(vertices, faces):
+    """
+    Drop vertices that no face references and compact the face indices.
+    """
+    used = np.zeros(len(vertices), dtype=bool)
+    used[faces.reshape(-1)] = True
+    if used.all():
+        return vertices, faces
+    remap = np.cumsum(used) - 1
+    return vertices[used], remap[faces]
+
+def clean_mesh(vertices, faces, merge_percentage=0.5):
+    """
+    Native replacement for the pymeshlab cleanup chain.
+
+    Parameters:
+        vertices (numpy.ndarray): (N, 3) vertex positions.
+        faces (numpy.ndarray): (M, 3) triangle indices.
+        merge_percentage (float): merge radius, same value as the pymeshlab.PercentageValue
+            passed to meshing_merge_close_vertices.
+
+    Returns:
+        tuple: cleaned (vertices, faces).
+    """
+    vertices = np.asarray(vertices)
+    faces = np.asarray(faces, dtype=np.int64)
+
+    faces = remove_duplicate_faces(faces)
+    vertices, faces = remove_duplicate_vertices(vertices, faces)
+
+    if len(vertices) > 0:
+        ### pymeshlab resolves PercentageValue(p) for this filter to p / 10000 of the bbox diagonal
+        diag = np.linalg.norm(vertices.max(0) - vertices.min(0))
+        vertices, faces = merge_close_vertices(vertices, faces, diag * merge_percentage / 10000.0)
+
+    vertices, faces = remove_unreferenced_vertices(vertices, faces)
+    return vertices, faces
+
+def clean_mesh_pymeshlab(vertices, faces, merge_percentage=0.5):
+    """
+    Reference cleanup through a pymeshlab.MeshSet round-trip.
+    """
+    import pymeshlab
+
+    # Create a PyMeshLab mesh directly from vertices and faces
+    ml_mesh = pymeshlab.Mesh(vertex_matrix=vertices, face_matrix=faces)
+
+    # Create a MeshSet and add your mesh
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(ml_mesh, "from_trimesh")
+
+    # Apply filters
+    ms.apply_filter('meshing_remove_duplicate_faces')
+    ms.apply_filter('meshing_remove_duplicate_vertices')
+    percentageMerge = pymeshlab.PercentageValue(merge_percentage)
+    ms.apply_filter('meshing_merge_close_vertices', threshold=percentageMerge)
+    ms.apply_filter('meshing_remove_unreferenced_vertices')
+
+    # Save or extract mesh
+    processed = ms.current_mesh()
+    return processed.vertex_matrix(), processed.face_matrix()
+
+def compare_cleanup(vertices, faces, ref_vertices, ref_faces):
+    """
+    Compare a cleaned mesh against the pymeshlab reference and print a short report.
+
+    Returns:
+        dict: vertex/face counts of both meshes and the symmetric max vertex distance.
+    """
+    report = {
+        "n_vertices": len(vertices),
+        "n_faces": len(faces),
+        "ref_n_vertices": len(ref_vertices),
+        "ref_n_faces": len(ref_faces),
+        "max_vertex_dist": 0.0,
+    }
+    if len(vertices) > 0 and len(ref_vertices) > 0:
+        d_ab, _ = cKDTree(ref_vertices).query(vertices)
+        d_ba, _ = cKDTree(vertices).query(ref_vertices)
+        report["max_vertex_dist"] = float(max(d_ab.max(), d_ba.max()))
+
+    print("cleanup comparison (native vs pymeshlab):")
+    print("  vertices: %d vs %d" % (report["n_vertices"], report["ref_n_vertices"]))
+    print("  faces: %d vs %d" % (report["n_faces"], report["ref_n_faces"]))
+    print("  max vertex distance: %.3e" % report["max_vertex_dist"])
+    return report
+
+def preprocess_mesh_arrays(vertices, faces, backend="native", compare=False, merge_percentage=0.5):
+    """
+    Run the configured cleanup backend ("native" | "pymeshlab"). With `compare`,
+    the native result is also checked against pymeshlab.
+    """
+    if backend == "pymeshlab":
+        return clean_mesh_pymeshlab(vertices, faces, merge_percentage)
+    elif backend != "native":
+        raise ValueError(f"Unknown mesh cleanup backend: {backend}")
+
+    new_vertices, new_faces = clean_mesh(vertices, faces, merge_percentage)
+    if compare:
+        ref_vertices, ref_faces = clean_mesh_pymeshlab(vertices, faces, merge_percentage)
+        compare_cleanup(new_vertices, new_faces, ref_vertices, ref_faces)
+    return new_vertices, new_faces
@@ -13,7 +13,6 @@ import numpy as np
 import torch
 from torch import nn
 import torch.nn.functional as F
-from torch_scatter import scatter_mean #, scatter_max
 
 from .unet_3daware import setup_unet #UNetTriplane3dAware
 from .conv_pointnet import ConvPointnet
@@ -23,6 +22,7 @@ from .pc_encoder import PVCNNEncoder #PointNet
 import einops
 
 from .dnnlib_util import ScopedTorchProfiler, printarr
+from partfield.model.plane_sampling import fused_plane_sample, TRIPLANE_FEAT_PAIRS
 
 def generate_plane_features(p, c, resolution, plane='xz'):
     """
@@ -37,11 +37,21 @@ def generate_plane_features(p, c, resolution, plane='xz'):
     index = coordinate2index(xy, resolution)
 
     # scatter plane features from points
-    fea_plane = c.new_zeros(p.size(0), c_dim, resolution**2)
-    fea_plane = scatter_mean(c, index, out=fea_plane) # B x 512 x reso^2
+    fea_plane = scatter_mean(c, index, resolution**2) # B x 512 x reso^2
     fea_plane = fea_plane.reshape(p.size(0), c_dim, resolution, resolution) # sparce matrix (B x 512 x reso x reso)
     return fea_plane
 
+def scatter_mean(src, index, dim_size):
+    '''
+    Mean of src (B, C, n_p) over the points of every cell index (B, 1, n_p) in [0, dim_size),
+    0 for empty cells. Same as torch_scatter.scatter_mean(src, index, out=zeros), in plain
+    torch ops so that torch.compile and ONNX export can trace it.
+    '''
+    B, C, _ = src.shape
+    out = src.new_zeros(B, C, dim_size).scatter_add_(2, index.expand(-1, C, -1), src)
+    count = src.new_zeros(B, 1, dim_size).scatter_add_(2, index, src.new_ones(index.shape))
+    return out / count.clamp(min=1)
+
 def normalize_coordinate(p, padding=0.1, plane='xz'):
     ''' Normalize coordinate to [0, 1] for unit cube experiments
 
@@ -60,11 +70,9 @@ def normalize_coordinate(p, padding=0.1, plane='xz'):
     xy_new = xy / (1 + padding + 10e-6) # (-0.5, 0.5)
     xy_new = xy_new + 0.5 # range (0, 1)
 
-    # if there are outliers out of the range
-    if xy_new.max() >= 1:
-        xy_new[xy_new >= 1] = 1 - 10e-6
-    if xy_new.min() < 0:
-        xy_new[xy_new < 0] = 0.0
+    # if there are outliers out of the range (branchless, so that torch.compile does not break the graph)
+    xy_new = torch.where(xy_new >= 1, 1 - 10e-6, xy_new)
+    xy_new = xy_new.clamp(min=0.0)
     return xy_new
 
 
@@ -90,6 +98,15 @@ def softclip(x, min, max, hardness=5):
 
 
 def sample_triplane_feat(feature_triplane, normalized_pos):
+    '''
+        normalized_pos [-1, 1]
+        Single grid_sample over the stacked planes, see plane_sampling.py.
+    '''
+    return fused_plane_sample(feature_triplane, normalized_pos, TRIPLANE_FEAT_PAIRS,
+                              padding_mode='border', align_corners=True)
+
+
+def sample_triplane_feat_unfused(feature_triplane, normalized_pos):
     '''
         normalized_pos [-1, 1]
     '''
@@ -125,7 +142,7 @@ class TriPlanePC2Encoder(torch.nn.Module):
     def __init__(
             self,
             cfg,
-            device='cuda',
+            device=None,
             shape_min=-1.0,
             shape_length=2.0,
             use_2d_feat=False,
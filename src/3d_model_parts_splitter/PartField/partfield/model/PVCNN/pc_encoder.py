@@ -7,7 +7,7 @@ from .pv_module import SharedMLP, PVConv
 
 def create_pointnet_components(
         blocks, in_channels, with_se=False, normalize=True, eps=0,
-        width_multiplier=1, voxel_resolution_multiplier=1, scale_pvcnn=False, device='cuda'):
+        width_multiplier=1, voxel_resolution_multiplier=1, scale_pvcnn=False, device=None):
     r, vr = width_multiplier, voxel_resolution_multiplier
     layers, concat_channels = [], 0
     for out_channels, num_blocks, voxel_resolution in blocks:
@@ -26,7 +26,7 @@ def create_pointnet_components(
 
 class PCMerger(nn.Module):
 # merge surface sampled PC and rendering backprojected PC (w/ 2D features):
-    def __init__(self, in_channels=204, device="cuda"):
+    def __init__(self, in_channels=204, device=None):
         super(PCMerger, self).__init__()
         self.mlp_normal = SharedMLP(3, [128, 128], device=device)
         self.mlp_rgb = SharedMLP(3, [128, 128], device=device)
@@ -51,7 +51,7 @@ class PCMerger(nn.Module):
 
 
 class PVCNNEncoder(nn.Module):
-    def __init__(self, pvcnn_feat_dim, device='cuda', in_channels=3, use_2d_feat=False):
+    def __init__(self, pvcnn_feat_dim, device=None, in_channels=3, use_2d_feat=False):
         super(PVCNNEncoder, self).__init__()
         self.device = device
         self.blocks = ((pvcnn_feat_dim, 1, 32), (128, 2, 16), (256, 1, 8))
@@ -81,8 +81,10 @@ class PVCNNEncoder(nn.Module):
         zero_padding = torch.zeros(features.shape[0], self.append_channel, features.shape[-1], device=features.device, dtype=torch.float)
         features = torch.cat([features, zero_padding], dim=1)##################
 
+        ### voxel grids per resolution, shared by the blocks (the coords are the same for all)
+        grids = {}
         for i in range(len(self.encoder)):
-            features, _, voxel_feature = self.encoder[i]((features, coords))
+            features, _, voxel_feature = self.encoder[i]((features, coords), grids)
             if i == 0 and mv_feat is not None:
                features = self.merger(features, mv_feat.permute(0, 2, 1), pc2pc_idx)
             out_features_list.append(features)
@@ -11,7 +11,7 @@ __all__ = ['PVConv']
 class PVConv(nn.Module):
     def __init__(
             self, in_channels, out_channels, kernel_size, resolution, with_se=False, normalize=True, eps=0, scale_pvcnn=False,
-            device='cuda'):
+            device=None):
         super().__init__()
         self.in_channels = in_channels
         self.out_channels = out_channels
@@ -29,9 +29,9 @@ class PVConv(nn.Module):
         self.voxel_layers = nn.Sequential(*voxel_layers)
         self.point_features = SharedMLP(in_channels, out_channels, device=device)
 
-    def forward(self, inputs):
+    def forward(self, inputs, grids=None):
         features, coords = inputs
-        voxel_features, voxel_coords = self.voxelization(features, coords)
+        voxel_features, voxel_coords = self.voxelization(features, coords, grids)
         voxel_features = self.voxel_layers(voxel_features)
         devoxel_features = F.trilinear_devoxelize(voxel_features, voxel_coords, self.resolution, self.training)
         fused_features = devoxel_features + self.point_features(features)
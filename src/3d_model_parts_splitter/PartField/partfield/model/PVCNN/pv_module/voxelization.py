@@ -3,23 +3,45 @@ import torch.nn as nn
 
 from . import functional as F
 
-__all__ = ['Voxelization']
-
-
-def my_voxelization(features, coords, resolution):
-    b, c, _ = features.shape
-    result = torch.zeros(b, c + 1, resolution * resolution * resolution, device=features.device, dtype=torch.float)
-    r = resolution
-    r2 = resolution * resolution
-    indices = coords[:, 0] * r2 + coords[:, 1] * r + coords[:, 2]
-    indices = indices.unsqueeze(dim=1).expand(-1, result.shape[1], -1)
-    features = torch.cat([features, torch.ones(features.shape[0], 1, features.shape[2], device=features.device, dtype=features.dtype)], dim=1)
-    out_feature = result.scatter_(index=indices.long(), src=features, dim=2, reduce='add')
-    cnt = out_feature[:, -1:, :]
-    zero_mask = (cnt == 0).float()
-    cnt = cnt * (1 - zero_mask) + zero_mask * 1e-5
-    vox_feature = out_feature[:, :-1, :] / cnt
-    return vox_feature.view(b, c, resolution, resolution, resolution)
+__all__ = ['Voxelization', 'VoxelGrid']
+
+
+class VoxelGrid:
+    """
+    Voxel assignment of the points at one resolution. The points don't move between the
+    PVConv blocks, so the encoder builds it once per resolution and forward pass and the
+    blocks of that resolution share it.
+    """
+    def __init__(self, norm_coords, resolution):
+        """
+        Parameters:
+            norm_coords (Tensor): (B, 3, N) point coordinates in voxel units, in [0, resolution - 1].
+            resolution (int): voxels per side.
+        """
+        b, _, n = norm_coords.shape
+        r = resolution
+        vox_coords = torch.round(norm_coords).long()
+        index = vox_coords[:, 0] * (r * r) + vox_coords[:, 1] * r + vox_coords[:, 2]
+        ### flat voxel of every point over the batch: (B * N,) in [0, B * r^3)
+        self.index = (index + torch.arange(b, device=index.device).unsqueeze(1) * r ** 3).reshape(-1)
+        ### points per voxel, 1 for empty voxels (their sum is 0)
+        self.count = torch.zeros(b * r ** 3, device=norm_coords.device).scatter_add_(
+            0, self.index, torch.ones(b * n, device=norm_coords.device)).clamp(min=1)
+        self.norm_coords = norm_coords
+        self.resolution = r
+
+def my_voxelization(features, grid):
+    """
+    Mean of the point features (B, C, N) in every voxel of `grid`: (B, C, r, r, r), 0 for empty voxels.
+    One scatter_add_ over the points with the channels as rows (a view for B = 1); the index
+    is broadcast over the channels (expand, stride 0), never copied per channel.
+    """
+    b, c, n = features.shape
+    r = grid.resolution
+    ### the scatter mean stays fp32 in bf16 stages (see precision.py)
+    src = features.float().transpose(0, 1).reshape(c, b * n)
+    vox_feature = src.new_zeros(c, b * r ** 3).scatter_add_(1, grid.index.expand(c, -1), src) / grid.count
+    return vox_feature.view(c, b, r, r, r).transpose(0, 1)
 
 class Voxelization(nn.Module):
     def __init__(self, resolution, normalize=True, eps=0, scale_pvcnn=False):
@@ -30,7 +52,7 @@ class Voxelization(nn.Module):
         self.scale_pvcnn = scale_pvcnn
         assert not normalize
 
-    def forward(self, features, coords):
+    def grid(self, coords):
         with torch.no_grad():
             coords = coords.detach()
 
@@ -42,9 +64,22 @@ class Voxelization(nn.Module):
                 else:
                     norm_coords = (norm_coords + 1) / 2.0
             norm_coords = torch.clamp(norm_coords * self.r, 0, self.r - 1)
-            vox_coords = torch.round(norm_coords)
-        new_vox_feat = my_voxelization(features, vox_coords, self.r)
-        return new_vox_feat, norm_coords
+            return VoxelGrid(norm_coords, self.r)
+
+    def forward(self, features, coords, grids=None):
+        """
+        Parameters:
+            grids (dict): {resolution: VoxelGrid} shared by the blocks of one forward pass;
+                the grid of this resolution is built on first use. None builds it for this call.
+        """
+        if grids is None:
+            grid = self.grid(coords)
+        else:
+            if self.r not in grids:
+                grids[self.r] = self.grid(coords)
+            grid = grids[self.r]
+        new_vox_feat = my_voxelization(features, grid)
+        return new_vox_feat, grid.norm_coords
 
     def extra_repr(self):
         return 'resolution={}{}'.format(self.r, ', normalized eps = {}'.format(self.eps) if self.normalize else '')
@@ -0,0 +1,99 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+#########################
+## Scaled-dot-product attention
+#########################
+## Drop-in for the nn.MultiheadAttention layers of the transformer blocks (attention
+## backend "sdpa"). The parameters have the same names and layouts as in
+## nn.MultiheadAttention (packed in_proj_weight for self-attention, q/k/v_proj_weight when
+## kdim/vdim differ, out_proj), so existing checkpoints load as they are. Self-attention
+## projects q, k and v with one matmul, and the attention itself is a single
+## F.scaled_dot_product_attention call, which dispatches to the flash/memory-efficient
+## kernels on GPU and the fused flash kernel on CPU, so the L x L weights are never
+## materialized.
+
+ATTENTION_BACKENDS = ("mha", "sdpa")
+
+class SDPAttention(nn.Module):
+    def __init__(self, embed_dim, num_heads, dropout=0., bias=True, kdim=None, vdim=None, batch_first=True):
+        super().__init__()
+        assert batch_first, "SDPAttention only supports batch_first inputs"
+        assert embed_dim % num_heads == 0, "embed_dim must be divisible by num_heads"
+        self.embed_dim = embed_dim
+        self.kdim = kdim if kdim is not None else embed_dim
+        self.vdim = vdim if vdim is not None else embed_dim
+        self._qkv_same_embed_dim = self.kdim == embed_dim and self.vdim == embed_dim
+        self.num_heads = num_heads
+        self.dropout = dropout
+
+        if self._qkv_same_embed_dim:
+            self.in_proj_weight = nn.Parameter(torch.empty(3 * embed_dim, embed_dim))
+            self.register_parameter('q_proj_weight', None)
+            self.register_parameter('k_proj_weight', None)
+            self.register_parameter('v_proj_weight', None)
+        else:
+            self.q_proj_weight = nn.Parameter(torch.empty(embed_dim, embed_dim))
+            self.k_proj_weight = nn.Parameter(torch.empty(embed_dim, self.kdim))
+            self.v_proj_weight = nn.Parameter(torch.empty(embed_dim, self.vdim))
+            self.register_parameter('in_proj_weight', None)
+        if bias:
+            self.in_proj_bias = nn.Parameter(torch.empty(3 * embed_dim))
+        else:
+            self.register_parameter('in_proj_bias', None)
+        self.out_proj = nn.Linear(embed_dim, embed_dim, bias=bias)
+        self._reset_parameters()
+
+    def _reset_parameters(self):
+        ### same initialization as nn.MultiheadAttention
+        if self._qkv_same_embed_dim:
+            nn.init.xavier_uniform_(self.in_proj_weight)
+        else:
+            nn.init.xavier_uniform_(self.q_proj_weight)
+            nn.init.xavier_uniform_(self.k_proj_weight)
+            nn.init.xavier_uniform_(self.v_proj_weight)
+        if self.in_proj_bias is not None:
+            nn.init.constant_(self.in_proj_bias, 0.)
+            nn.init.constant_(self.out_proj.bias, 0.)
+
+    def project(self, query, key, value):
+        b = self.in_proj_bias
+        if self._qkv_same_embed_dim and query is key and key is value:
+            ### self-attention: one (3D, D) projection
+            return F.linear(query, self.in_proj_weight, b).chunk(3, dim=-1)
+        b_q, b_k, b_v = b.chunk(3) if b is not None else (None, None, None)
+        if self._qkv_same_embed_dim:
+            w_q, w_k, w_v = self.in_proj_weight.chunk(3)
+        else:
+            w_q, w_k, w_v = self.q_proj_weight, self.k_proj_weight, self.v_proj_weight
+        return F.linear(query, w_q, b_q), F.linear(key, w_k, b_k), F.linear(value, w_v, b_v)
+
+    def forward(self, query, key, value, need_weights=False):
+        """
+        Parameters:
+            query (torch.Tensor): [N, L, D]
+            key, value (torch.Tensor): [N, S, kdim], [N, S, vdim]
+
+        Returns:
+            tuple: [N, L, D] output and None (attention weights are never returned).
+        """
+        assert not need_weights, "SDPAttention does not return attention weights"
+        N, L, _ = query.shape
+        q, k, v = self.project(query, key, value)
+        ### [N, L, D] -> [N, heads, L, D / heads]
+        q, k, v = (t.view(N, -1, self.num_heads, self.embed_dim // self.num_heads).transpose(1, 2) for t in (q, k, v))
+        out = F.scaled_dot_product_attention(q, k, v, dropout_p=self.dropout if self.training else 0.)
+        out = out.transpose(1, 2).reshape(N, L, self.embed_dim)
+        return self.out_proj(out), None
+
+def build_attention(attention, embed_dim, num_heads, **kwargs):
+    """
+    Attention layer of the given backend: "mha" (nn.MultiheadAttention) or "sdpa"
+    (SDPAttention); both take nn.MultiheadAttention's arguments and checkpoints.
+    """
+    if attention == "mha":
+        return nn.MultiheadAttention(embed_dim=embed_dim, num_heads=num_heads, **kwargs)
+    elif attention == "sdpa":
+        return SDPAttention(embed_dim=embed_dim, num_heads=num_heads, **kwargs)
+    raise ValueError(f"Unknown attention backend: {attention}, use one of {ATTENTION_BACKENDS}")
@@ -37,7 +37,7 @@ class VanillaMLP(nn.Module):
         self.layers = nn.Sequential(*layers)
 
     def forward(self, x, split_size=100000):
-        with torch.cuda.amp.autocast(enabled=False):
+        with torch.autocast(device_type=x.device.type, enabled=False):
             out = self.layers(x)
         return out
 
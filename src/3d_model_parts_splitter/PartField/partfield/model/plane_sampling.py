@@ -0,0 +1,67 @@
+import torch
+import torch.nn.functional as F
+
+#########################
+## Fused triplane sampling
+#########################
+## Sampling a triplane means reading each of the three planes at the point's projection
+## onto it. Instead of one grid_sample per plane (each with its own torch.cat of the
+## coordinate pair), the planes are viewed as a batch of 3*N images and every point's three
+## 2D coordinates are gathered with one precomputed index, so a single grid_sample reads all
+## planes and the per-plane results are summed in place.
+##
+## The plane/coordinate layouts of the two samplers in the code base:
+##   sample_triplane_feat (encoder_pc.py): planes (x, y), (y, z), (x, z), summed
+##   sample_from_planes (triplane.py, default plane axes): projections (x, y), (x, z), (z, y)
+
+TRIPLANE_FEAT_PAIRS = ((0, 1), (1, 2), (0, 2))
+PLANE_AXES_PAIRS = ((0, 1), (0, 2), (2, 1))
+
+_pair_index = {}
+
+def pair_index(pairs, device):
+    """
+    (n_planes * 2,) index of the coordinates read by every plane, cached per device.
+    """
+    key = (pairs, str(device))
+    if key not in _pair_index:
+        _pair_index[key] = torch.tensor(pairs, device=device).reshape(-1)
+    return _pair_index[key]
+
+def plane_axes_pairs(plane_axes):
+    """
+    Coordinate pairs equivalent to projecting onto `plane_axes` (n_planes, 3, 3) when every
+    plane's axes are a permutation of x, y, z (the inverse then just reorders coordinates).
+    Returns None for general axes.
+    """
+    plane_axes = torch.as_tensor(plane_axes).cpu()
+    if not ((plane_axes == 0) | (plane_axes == 1)).all() or not (plane_axes.sum(1) == 1).all():
+        return None
+    ### projection = coords @ inv(P) = coords @ P^T for a permutation P: column j reads coordinate argmax P[j]
+    return tuple(tuple(int(plane[j].argmax()) for j in range(2)) for plane in plane_axes)
+
+def fused_plane_sample(planes, coordinates, pairs, mode='bilinear', padding_mode='border', align_corners=True, reduce=True):
+    """
+    Parameters:
+        planes (torch.Tensor): (N, n_planes, C, H, W) plane features.
+        coordinates (torch.Tensor): (N, M, 3) points in [-1, 1].
+        pairs (tuple): per plane, the two coordinate indices it is sampled at.
+        reduce (bool): sum over the planes.
+
+    Returns:
+        torch.Tensor: (N, M, C) if reduce, else (N, n_planes, M, C).
+    """
+    N, n_planes, C, H, W = planes.shape
+    M = coordinates.shape[1]
+    grid = coordinates.index_select(-1, pair_index(pairs, coordinates.device))  # N, M, n_planes * 2
+    grid = grid.view(N, M, n_planes, 2).transpose(1, 2).reshape(N * n_planes, 1, M, 2)
+    feat = F.grid_sample(planes.reshape(N * n_planes, C, H, W), grid, mode=mode,
+                         padding_mode=padding_mode, align_corners=align_corners)  # N * n_planes, C, 1, M
+    feat = feat.view(N, n_planes, C, M)
+    if reduce:
+        ### accumulate into the first plane's slice of the grid_sample output (no new buffer)
+        acc = feat[:, 0]
+        for i in range(1, n_planes):
+            acc.add_(feat[:, i])
+        return acc.permute(0, 2, 1)
+    return feat.permute(0, 1, 3, 2)
@@ -16,6 +16,8 @@
 import torch
 import torch.nn as nn
 from functools import partial
+from partfield.model.plane_sampling import fused_plane_sample, PLANE_AXES_PAIRS
+from partfield.model.attention import build_attention
 
 def project_onto_planes(planes, coordinates):
     """
@@ -34,6 +36,12 @@ def project_onto_planes(planes, coordinates):
     return projections[..., :2]
 
 def sample_from_planes(plane_features, coordinates, mode='bilinear', padding_mode='zeros', box_warp=None):
+    # the default plane axes only permute x, y, z: one grid_sample over all planes, see plane_sampling.py
+    assert padding_mode == 'zeros'
+    return fused_plane_sample(plane_features, coordinates.float(), PLANE_AXES_PAIRS, mode=mode,
+                              padding_mode=padding_mode, align_corners=False, reduce=False)
+
+def sample_from_planes_unfused(plane_features, coordinates, mode='bilinear', padding_mode='zeros', box_warp=None):
     plane_axes = torch.tensor([[[1, 0, 0],
                                 [0, 1, 0],
                                 [0, 0, 1]],
@@ -42,7 +50,7 @@ def sample_from_planes(plane_features, coordinates, mode='bilinear', padding_mod
                                 [0, 1, 0]],
                                 [[0, 0, 1],
                                 [0, 1, 0],
-                                [1, 0, 0]]], dtype=torch.float32).cuda()
+                                [1, 0, 0]]], dtype=torch.float32, device=coordinates.device)
     
     assert padding_mode == 'zeros'
     N, n_planes, C, H, W = plane_features.shape
@@ -70,11 +78,11 @@ class BasicBlock(nn.Module):
     # Block contains a self-attention layer and an MLP
     def __init__(self, inner_dim: int, num_heads: int, eps: float,
                  attn_drop: float = 0., attn_bias: bool = False,
-                 mlp_ratio: float = 4., mlp_drop: float = 0.):
+                 mlp_ratio: float = 4., mlp_drop: float = 0., attention: str = "mha"):
         super().__init__()
         self.norm1 = nn.LayerNorm(inner_dim, eps=eps)
-        self.self_attn = nn.MultiheadAttention(
-            embed_dim=inner_dim, num_heads=num_heads,
+        self.self_attn = build_attention(
+            attention, embed_dim=inner_dim, num_heads=num_heads,
             dropout=attn_drop, bias=attn_bias, batch_first=True)
         self.norm2 = nn.LayerNorm(inner_dim, eps=eps)
         self.mlp = nn.Sequential(
@@ -100,15 +108,15 @@ class ConditionBlock(nn.Module):
     # Block contains a cross-attention layer, a self-attention layer, and an MLP
     def __init__(self, inner_dim: int, cond_dim: int, num_heads: int, eps: float,
                  attn_drop: float = 0., attn_bias: bool = False,
-                 mlp_ratio: float = 4., mlp_drop: float = 0.):
+                 mlp_ratio: float = 4., mlp_drop: float = 0., attention: str = "mha"):
         super().__init__()
         self.norm1 = nn.LayerNorm(inner_dim, eps=eps)
-        self.cross_attn = nn.MultiheadAttention(
-            embed_dim=inner_dim, num_heads=num_heads, kdim=cond_dim, vdim=cond_dim,
+        self.cross_attn = build_attention(
+            attention, embed_dim=inner_dim, num_heads=num_heads, kdim=cond_dim, vdim=cond_dim,
             dropout=attn_drop, bias=attn_bias, batch_first=True)
         self.norm2 = nn.LayerNorm(inner_dim, eps=eps)
-        self.self_attn = nn.MultiheadAttention(
-            embed_dim=inner_dim, num_heads=num_heads,
+        self.self_attn = build_attention(
+            attention, embed_dim=inner_dim, num_heads=num_heads,
             dropout=attn_drop, bias=attn_bias, batch_first=True)
         self.norm3 = nn.LayerNorm(inner_dim, eps=eps)
         self.mlp = nn.Sequential(
@@ -132,13 +140,14 @@ class TransformerDecoder(nn.Module):
     def __init__(self, block_type: str,
                  num_layers: int, num_heads: int,
                  inner_dim: int, cond_dim: int = None,
-                 eps: float = 1e-6):
+                 eps: float = 1e-6, attention: str = "mha"):
         super().__init__()
         self.block_type = block_type
         self.layers = nn.ModuleList([
             self._block_fn(inner_dim, cond_dim)(
                 num_heads=num_heads,
                 eps=eps,
+                attention=attention,
             )
             for _ in range(num_layers)
         ])
@@ -186,7 +195,8 @@ class Voxel2Triplane(nn.Module):
     Full model of the basic single-view large reconstruction model.
     """
     def __init__(self, transformer_dim: int, transformer_layers: int, transformer_heads: int,
-                 triplane_low_res: int, triplane_high_res: int, triplane_dim: int, voxel_feat_dim: int, normalize_vox_feat=False, voxel_dim=16):
+                 triplane_low_res: int, triplane_high_res: int, triplane_dim: int, voxel_feat_dim: int, normalize_vox_feat=False, voxel_dim=16,
+                 attention: str = "mha"):
         super().__init__()
         
         # attributes
@@ -200,7 +210,8 @@ class Voxel2Triplane(nn.Module):
         self.transformer = TransformerDecoder(
             block_type='cond',
             num_layers=transformer_layers, num_heads=transformer_heads,
-            inner_dim=transformer_dim, cond_dim=voxel_feat_dim
+            inner_dim=transformer_dim, cond_dim=voxel_feat_dim,
+            attention=attention,
         )
         self.upsampler = nn.ConvTranspose2d(transformer_dim, triplane_dim, kernel_size=8, stride=8, padding=0)
 
@@ -254,7 +265,7 @@ class TriplaneTransformer(nn.Module):
     Full model of the basic single-view large reconstruction model.
     """
     def __init__(self, input_dim: int, transformer_dim: int, transformer_layers: int, transformer_heads: int,
-                 triplane_low_res: int, triplane_high_res: int, triplane_dim: int):
+                 triplane_low_res: int, triplane_high_res: int, triplane_dim: int, attention: str = "mha"):
         super().__init__()
         
         # attributes
@@ -268,6 +279,7 @@ class TriplaneTransformer(nn.Module):
             block_type='basic',
             num_layers=transformer_layers, num_heads=transformer_heads,
             inner_dim=transformer_dim,
+            attention=attention,
         )
       
         self.downsampler = nn.Sequential(
@@ -1,6 +1,7 @@
 import torch
 import lightning.pytorch as pl
-from .dataloader import Demo_Dataset, Demo_Remesh_Dataset, Correspondence_Demo_Dataset
+from .dataloader import build_inference_dataloader, encode_point_clouds
+from .predictor import build_predict_dataset, build_pvcnn, build_triplane_transformer
 from torch.utils.data import DataLoader
 from partfield.model.UNet.model import ResidualUNet3D
 from partfield.model.triplane import TriplaneTransformer, get_grid_coord #, sample_from_planes, Voxel2Triplane
@@ -14,10 +15,15 @@ import numpy as np
 import h5py
 import torch.distributed as dist
 from partfield.model.PVCNN.encoder_pc import TriPlanePC2Encoder, sample_triplane_feat
+from partfield.surface_sampler import SurfaceSampler
+from partfield.device import resolve_device, sample_chunk_size
+from partfield.precision import enable_cpu_bf16
+from partfield.compile import compile_encoder_stack
+from partfield.face_features import adaptive_face_kwargs, mesh_features, point_features, save_outputs, output_exists, export_mesh_pca
+from partfield.feature_field import save_part_planes
 import json
 import gc
 import time
-from plyfile import PlyData, PlyElement
 
 
 class Model(pl.LightningModule):
@@ -29,206 +35,166 @@ class Model(pl.LightningModule):
         self.automatic_optimization = False
         self.triplane_resolution = cfg.triplane_resolution
         self.triplane_channels_low = cfg.triplane_channels_low
-        self.triplane_transformer = TriplaneTransformer(
-            input_dim=cfg.triplane_channels_low * 2,
-            transformer_dim=1024,
-            transformer_layers=6,
-            transformer_heads=8,
-            triplane_low_res=32,
-            triplane_high_res=128,
-            triplane_dim=cfg.triplane_channels_high,
-        )
+        self.triplane_transformer = build_triplane_transformer(cfg)
+        self.use_pvcnn = cfg.use_pvcnnonly
+        self.use_2d_feat = cfg.use_2d_feat
+        if self.use_pvcnn:
+            self.pvcnn = build_pvcnn(cfg)
+        self.logit_scale = nn.Parameter(torch.tensor([1.0], requires_grad=True))
+        self._grid_coord = None
+
+        ### predict only needs pvcnn and triplane_transformer (cfg.inference_only)
+        if not cfg.inference_only:
+            self.build_training_modules()
+        if self.use_pvcnn:
+            if resolve_device(cfg).type == "cpu":
+                enable_cpu_bf16(cfg, self.pvcnn, self.triplane_transformer)
+            compile_encoder_stack(cfg, self.pvcnn, self.triplane_transformer)
+
+    def build_training_modules(self):
+        """
+        sdf/feature decoders and losses, which the predict path does not use.
+        """
         self.sdf_decoder = VanillaMLP(input_dim=64,
                                       output_dim=1, 
                                       out_activation="tanh", 
                                       n_neurons=64, #64
                                       n_hidden_layers=6) #6
-        self.use_pvcnn = cfg.use_pvcnnonly
-        self.use_2d_feat = cfg.use_2d_feat
-        if self.use_pvcnn:
-            self.pvcnn = TriPlanePC2Encoder(
-                cfg.pvcnn,
-                device="cuda",
-                shape_min=-1, 
-                shape_length=2,
-                use_2d_feat=self.use_2d_feat) #.cuda()
-        self.logit_scale = nn.Parameter(torch.tensor([1.0], requires_grad=True))
-        self.grid_coord = get_grid_coord(256)
         self.mse_loss = torch.nn.MSELoss()
         self.l1_loss = torch.nn.L1Loss(reduction='none')
 
-        if cfg.regress_2d_feat:
+        if self.cfg.regress_2d_feat:
             self.feat_decoder = VanillaMLP(input_dim=64,
                                 output_dim=192, 
                                 out_activation="GELU", 
                                 n_neurons=64, #64
                                 n_hidden_layers=6) #6
 
+    @property
+    def grid_coord(self):
+        ### 256^3 x 3 floats (~200 MB), built on first use
+        if self._grid_coord is None:
+            self._grid_coord = get_grid_coord(256)
+        return self._grid_coord
+
+    def on_load_checkpoint(self, checkpoint):
+        ### checkpoints carry the decoder weights: drop those of modules that were not built
+        if self.cfg.inference_only:
+            state_dict = checkpoint["state_dict"]
+            for key in [k for k in state_dict if k.split(".")[0] in ("sdf_decoder", "feat_decoder")]:
+                del state_dict[key]
+
     def predict_dataloader(self):
-        if self.cfg.remesh_demo:
-            dataset = Demo_Remesh_Dataset(self.cfg)        
-        elif self.cfg.correspondence_demo:
-            dataset = Correspondence_Demo_Dataset(self.cfg)
-        else:
-            dataset = Demo_Dataset(self.cfg)
+        dataset = build_predict_dataset(self.cfg)
+        ### manifest runs record finished uids for exact resume
+        self.progress_ledger = getattr(dataset, "ledger", None)
 
-        dataloader = DataLoader(dataset, 
-                            num_workers=self.cfg.dataset.val_num_workers,
-                            batch_size=self.cfg.dataset.val_batch_size,
-                            shuffle=False, 
-                            pin_memory=True,
-                            drop_last=False)
+        dataloader = build_inference_dataloader(self.cfg, dataset)
         
         return dataloader           
 
+    def on_predict_batch_end(self, outputs, batch, batch_idx, dataloader_idx=0):
+        ### outputs of these items are written: record them for exact resume of manifest runs
+        if getattr(self, "progress_ledger", None) is not None:
+            for uid in batch['uid']:
+                self.progress_ledger.mark_done(uid, status="done")
+            for uid in batch['skipped_uids']:
+                self.progress_ledger.mark_done(uid, status="skipped")
+
 
     @torch.no_grad()
     def predict_step(self, batch, batch_idx):
         save_dir = f"exp_results/{self.cfg.result_name}"
         os.makedirs(save_dir, exist_ok=True)
 
-        uid = batch['uid'][0]
         view_id = 0
         starttime = time.time()
-        
-        if uid == "car" or uid == "complex_car":
-        # if uid == "complex_car":
-            print("Skipping this for now.")
-            print(uid)
-            return
 
-        ### Skip if model already processed
-        if os.path.exists(f'{save_dir}/part_feat_{uid}_{view_id}.npy') or os.path.exists(f'{save_dir}/part_feat_{uid}_{view_id}_batch.npy'):
-            print("Already processed "+uid)
+        for uid in batch['skipped_uids']:
+            print("Skipping " + uid + ", it does not fit the memory budget.")
+
+        todo = []
+        for i, uid in enumerate(batch['uid']):
+            if uid == "car" or uid == "complex_car":
+            # if uid == "complex_car":
+                print("Skipping this for now.")
+                print(uid)
+            ### Skip if model already processed
+            elif output_exists(save_dir, uid, view_id):
+                print("Already processed "+uid)
+            else:
+                todo.append(i)
+        if not todo:
             return
 
-        N = batch['pc'].shape[0]
-        assert N == 1
+        if 'pc' in batch:
+            pcs = [batch['pc'][i] for i in todo]
+        else:
+            ### Encoder point clouds sampled here, on the inference device (pc_sample_on_device)
+            pcs = []
+            for i in todo:
+                sampler = SurfaceSampler(batch['vertices'][i], batch['faces'][i], device=batch['vertices'][i].device)
+                pcs.append(sampler.sample(int(batch['pc_num_pts'][i]), seed=self.cfg.seed))
 
         if self.use_2d_feat: 
             print("ERROR. Dataloader not implemented with input 2d feat.")
             exit()
         else:
-            pc_feat = self.pvcnn(batch['pc'], batch['pc'])
-
-        planes = pc_feat
-        planes = self.triplane_transformer(planes)
-        sdf_planes, part_planes = torch.split(planes, [64, planes.shape[2] - 64], dim=2)
-
-        if self.cfg.is_pc:
-            tensor_vertices = batch['pc'].reshape(1, -1, 3).cuda().to(torch.float16)
-            point_feat = sample_triplane_feat(part_planes, tensor_vertices) # N, M, C
-            point_feat = point_feat.cpu().detach().numpy().reshape(-1, 448)
-
-            np.save(f'{save_dir}/part_feat_{uid}_{view_id}.npy', point_feat)
-            print(f"Exported part_feat_{uid}_{view_id}.npy")
+            ### meshes of the batch with the same point count go through the encoder and transformer together
+            part_planes = encode_point_clouds(self.encode_part_planes, pcs)
 
-            ###########
-            from sklearn.decomposition import PCA
-            data_scaled = point_feat / np.linalg.norm(point_feat, axis=-1, keepdims=True)
+        for j, i in enumerate(todo):
+            self.save_item_features(batch, i, pcs[j], part_planes[j:j + 1], save_dir, view_id, starttime)
 
-            pca = PCA(n_components=3)
-
-            data_reduced = pca.fit_transform(data_scaled)
-            data_reduced = (data_reduced - data_reduced.min()) / (data_reduced.max() - data_reduced.min())
-            colors_255 = (data_reduced * 255).astype(np.uint8)
-
-            points = batch['pc'].squeeze().detach().cpu().numpy()
-
-            if colors_255 is None:
-                colors_255 = np.full_like(points, 255)  # Default to white color (255,255,255)
-            else:
-                assert colors_255.shape == points.shape, "Colors must have the same shape as points"
+        print("Time elapsed: " + str(time.time()-starttime))
             
-            # Convert to structured array for PLY format
-            vertex_data = np.array(
-                [(*point, *color) for point, color in zip(points, colors_255)],
-                dtype=[("x", "f4"), ("y", "f4"), ("z", "f4"), ("red", "u1"), ("green", "u1"), ("blue", "u1")]
-            )
+        return
 
-            # Create PLY element
-            el = PlyElement.describe(vertex_data, "vertex")
-            # Write to file
-            filename = f'{save_dir}/feat_pca_{uid}_{view_id}.ply'
-            PlyData([el], text=True).write(filename)
-            print(f"Saved PLY file: {filename}")
-            ############
+    def encode_part_planes(self, pc):
+        """
+        (B, 3, C, H, W) part planes of a (B, N, 3) stack of point clouds.
+        """
+        planes = self.triplane_transformer(self.pvcnn(pc, pc))
+        sdf_planes, part_planes = torch.split(planes, [64, planes.shape[2] - 64], dim=2)
+        return part_planes
+
+    def save_item_features(self, batch, i, pc, part_planes, save_dir, view_id, starttime):
+        """
+        Feature readout and export for mesh i of the batch, from its (1, 3, C, H, W) part planes.
+        """
+        uid = batch['uid'][i]
+        if self.cfg.save_part_planes:
+            save_part_planes(save_dir, uid, part_planes, view_id)
+        if self.cfg.is_pc:
+            tensor_vertices = pc.reshape(1, -1, 3)
+            point_feat = point_features(part_planes, tensor_vertices).cpu().numpy()
+            points = pc.detach().cpu().numpy()
+            save_outputs(save_dir, uid, point_feat, points=points, view_id=view_id)
         
         else:
             use_cuda_version = True
             if use_cuda_version:
-
-                def sample_points(vertices, faces, n_point_per_face):
-                    # Generate random barycentric coordinates
-                    # borrowed from Kaolin https://github.com/NVIDIAGameWorks/kaolin/blob/master/kaolin/ops/mesh/trianglemesh.py#L43
-                    n_f = faces.shape[0]
-                    u = torch.sqrt(torch.rand((n_f, n_point_per_face, 1),
-                                                device=vertices.device,
-                                                dtype=vertices.dtype))
-                    v = torch.rand((n_f, n_point_per_face, 1),
-                                    device=vertices.device,
-                                    dtype=vertices.dtype)
-                    w0 = 1 - u
-                    w1 = u * (1 - v)
-                    w2 = u * v
-
-                    face_v_0 = torch.index_select(vertices, 0, faces[:, 0].reshape(-1))
-                    face_v_1 = torch.index_select(vertices, 0, faces[:, 1].reshape(-1))
-                    face_v_2 = torch.index_select(vertices, 0, faces[:, 2].reshape(-1))
-                    points = w0 * face_v_0.unsqueeze(dim=1) + w1 * face_v_1.unsqueeze(dim=1) + w2 * face_v_2.unsqueeze(dim=1)
-                    return points
-
-                def sample_and_mean_memory_save_version(part_planes, tensor_vertices, n_point_per_face):
-                    n_sample_each = self.cfg.n_sample_each # we iterate over this to avoid OOM
-                    n_v = tensor_vertices.shape[1]
-                    n_sample = n_v // n_sample_each + 1
-                    all_sample = []
-                    for i_sample in range(n_sample):
-                        sampled_feature = sample_triplane_feat(part_planes, tensor_vertices[:, i_sample * n_sample_each: i_sample * n_sample_each + n_sample_each,])
-                        assert sampled_feature.shape[1] % n_point_per_face == 0
-                        sampled_feature = sampled_feature.reshape(1, -1, n_point_per_face, sampled_feature.shape[-1])
-                        sampled_feature = torch.mean(sampled_feature, axis=-2)
-                        all_sample.append(sampled_feature)
-                    return torch.cat(all_sample, dim=1)
-                
-                if self.cfg.vertex_feature:
-                    tensor_vertices = batch['vertices'][0].reshape(1, -1, 3).to(torch.float32)
-                    point_feat = sample_and_mean_memory_save_version(part_planes, tensor_vertices, 1)
-                else:
-                    n_point_per_face = self.cfg.n_point_per_face
-                    tensor_vertices = sample_points(batch['vertices'][0], batch['faces'][0], n_point_per_face)
-                    tensor_vertices = tensor_vertices.reshape(1, -1, 3).to(torch.float32)
-                    point_feat = sample_and_mean_memory_save_version(part_planes, tensor_vertices, n_point_per_face)  # N, M, C
+                point_feat = mesh_features(part_planes, batch['vertices'][i], batch['faces'][i],
+                                           self.cfg.n_point_per_face, sample_chunk_size(self.cfg, self.device),
+                                           vertex_feature=self.cfg.vertex_feature,
+                                           face_sampling=self.cfg.face_sampling,
+                                           quadrature_points_per_face=self.cfg.face_quadrature_points,
+                                           adaptive=adaptive_face_kwargs(self.cfg))
 
                 #### Take mean feature in the triangle
                 print("Time elapsed for feature prediction: " + str(time.time() - starttime))
-                point_feat = point_feat.reshape(-1, 448).cpu().numpy()
-                np.save(f'{save_dir}/part_feat_{uid}_{view_id}_batch.npy', point_feat)
-                print(f"Exported part_feat_{uid}_{view_id}.npy")
-
-                ###########
-                from sklearn.decomposition import PCA
-                data_scaled = point_feat / np.linalg.norm(point_feat, axis=-1, keepdims=True)
-
-                pca = PCA(n_components=3)
-
-                data_reduced = pca.fit_transform(data_scaled)
-                data_reduced = (data_reduced - data_reduced.min()) / (data_reduced.max() - data_reduced.min())
-                colors_255 = (data_reduced * 255).astype(np.uint8)
-                V = batch['vertices'][0].cpu().numpy()
-                F = batch['faces'][0].cpu().numpy()
-                if self.cfg.vertex_feature:
-                    colored_mesh = trimesh.Trimesh(vertices=V, faces=F, vertex_colors=colors_255, process=False)
-                else:
-                    colored_mesh = trimesh.Trimesh(vertices=V, faces=F, face_colors=colors_255, process=False)
-                colored_mesh.export(f'{save_dir}/feat_pca_{uid}_{view_id}.ply')
-                ############
-                torch.cuda.empty_cache()
+                point_feat = point_feat.cpu().numpy()
+                V = batch['vertices'][i].cpu().numpy()
+                F = batch['faces'][i].cpu().numpy()
+                save_outputs(save_dir, uid, point_feat, vertices=V, faces=F,
+                             vertex_feature=self.cfg.vertex_feature, view_id=view_id)
+                if part_planes.is_cuda:
+                    torch.cuda.empty_cache()
 
             else:
                 ### Mesh input (obj file)
-                V = batch['vertices'][0].cpu().numpy()
-                F = batch['faces'][0].cpu().numpy()
+                V = batch['vertices'][i].cpu().numpy()
+                F = batch['faces'][i].cpu().numpy()
 
                 ##### Loop through faces #####
                 num_samples_per_face = self.cfg.n_point_per_face
@@ -249,7 +215,7 @@ class Model(pl.LightningModule):
                     # Calculate points in Cartesian coordinates
                     points = u * v0 + v * v1 + w * v2 
 
-                    tensor_vertices = torch.from_numpy(points.copy()).reshape(1, -1, 3).cuda().to(torch.float32)
+                    tensor_vertices = torch.from_numpy(points.copy()).reshape(1, -1, 3).to(part_planes.device, torch.float32)
                     point_feat = sample_triplane_feat(part_planes, tensor_vertices) # N, M, C 
 
                     #### Take mean feature in the triangle
@@ -264,20 +230,4 @@ class Model(pl.LightningModule):
                 np.save(f'{save_dir}/part_feat_{uid}_{view_id}.npy', point_feat)
                 print(f"Exported part_feat_{uid}_{view_id}.npy")
                 
-                ###########
-                from sklearn.decomposition import PCA
-                data_scaled = point_feat / np.linalg.norm(point_feat, axis=-1, keepdims=True)
-
-                pca = PCA(n_components=3)
-
-                data_reduced = pca.fit_transform(data_scaled)
-                data_reduced = (data_reduced - data_reduced.min()) / (data_reduced.max() - data_reduced.min())
-                colors_255 = (data_reduced * 255).astype(np.uint8)
-
-                colored_mesh = trimesh.Trimesh(vertices=V, faces=F, face_colors=colors_255, process=False)
-                colored_mesh.export(f'{save_dir}/feat_pca_{uid}_{view_id}.ply')
-                ############
-
-        print("Time elapsed: " + str(time.time()-starttime))
-            
-        return 
\ No newline at end of file
+                export_mesh_pca(f'{save_dir}/feat_pca_{uid}_{view_id}.ply', V, F, point_feat)
@@ -0,0 +1,85 @@
+import os
+import time
+
+import torch
+import torch.nn as nn
+
+#########################
+## ONNX encoder backend
+#########################
+## With encoder_backend "onnx" (PartFieldPredictor on CPU) pvcnn + triplane_transformer
+## run as one onnxruntime session: the stack is exported once per checkpoint (opset 20,
+## dynamic batch and point count) to onnx.model_path, by default next to the checkpoint,
+## and re-exported when the checkpoint is newer. onnxruntime applies its full graph
+## optimizations (constant folding, conv/norm/GELU/attention fusions) and runs with the
+## intra-op threads configured for torch (cfg.cpu). The triplane readout stays in torch.
+##
+## The scatter means of the encoder (generate_plane_features, my_voxelization) are plain
+## scatter_add_ ops, exported as ScatterElements(reduction="add").
+
+class EncoderStack(nn.Module):
+    """
+    pvcnn -> triplane_transformer -> part planes, as one module for export.
+    """
+    def __init__(self, pvcnn, triplane_transformer):
+        super().__init__()
+        self.pvcnn = pvcnn
+        self.triplane_transformer = triplane_transformer
+
+    def forward(self, pc):
+        planes = self.triplane_transformer(self.pvcnn(pc, pc))
+        return planes[:, :, 64:]
+
+def onnx_model_path(cfg, ckpt_path):
+    if cfg.onnx.model_path:
+        return cfg.onnx.model_path
+    return os.path.splitext(ckpt_path)[0] + ".encoder.onnx"
+
+def export_encoder(pvcnn, triplane_transformer, path, opset=20, n_points=20000):
+    """
+    Exports the encoder stack to `path` (written to a temporary file first, so that
+    concurrent workers never read a partial model).
+    """
+    stack = EncoderStack(pvcnn, triplane_transformer).cpu().eval()
+    pc = torch.rand(1, n_points, 3) * 2 - 1
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    start = time.time()
+    with torch.no_grad():
+        torch.onnx.export(stack, (pc,), tmp_path, input_names=["pc"], output_names=["part_planes"],
+                          dynamic_axes={"pc": {0: "batch", 1: "n_points"}, "part_planes": {0: "batch"}},
+                          opset_version=opset, dynamo=False)
+    os.replace(tmp_path, path)
+    print(f"Exported the encoder to {path} in {time.time() - start:.1f}s")
+
+class OnnxEncoder:
+    def __init__(self, path, num_threads=0):
+        """
+        Parameters:
+            path (str): exported encoder stack.
+            num_threads (int): intra-op threads; 0 = torch.get_num_threads().
+        """
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        options.inter_op_num_threads = 1
+        start = time.time()
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        print(f"Loaded {path} in {time.time() - start:.2f}s")
+
+    def __call__(self, pc):
+        """
+        (B, 3, C, H, W) part planes of (B, N, 3) point clouds.
+        """
+        pc = pc.detach().to("cpu", torch.float32).contiguous().numpy()
+        return torch.from_numpy(self.session.run(None, {"pc": pc})[0])
+
+def load_onnx_encoder(cfg, ckpt_path, pvcnn, triplane_transformer):
+    """
+    OnnxEncoder of the checkpoint's encoder stack, exported first if needed.
+    """
+    path = onnx_model_path(cfg, ckpt_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(ckpt_path):
+        export_encoder(pvcnn, triplane_transformer, path, opset=cfg.onnx.opset, n_points=cfg.onnx.export_points)
+    return OnnxEncoder(path, num_threads=cfg.cpu.num_threads)
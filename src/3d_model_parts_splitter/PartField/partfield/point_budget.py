@@ -0,0 +1,70 @@
+import math
+
+#########################
+## Adaptive encoder point count
+#########################
+## Meshes are normalized to a 1.8-wide box before encoding, so surface area is comparable
+## across inputs. The policy asks for enough points to cover the PVCNN voxel grid at the
+## mesh's surface area, enough per face to resolve fine tessellation, caps that by a latency
+## budget, clamps to [min_pts, max_pts] and rounds up to a bucket so batch/compiled shapes
+## stay few.
+
+class PointCountPolicy:
+    def __init__(self, min_pts=10000, max_pts=100000, pts_per_voxel=4.0, voxel_resolution=32,
+                 pts_per_face=2.0, latency_budget_ms=0.0, base_latency_ms=0.0, ms_per_kpt=0.0,
+                 bucket=10000):
+        """
+        Parameters:
+            min_pts, max_pts (int): floor and ceiling of the chosen count.
+            pts_per_voxel (float): target points per surface voxel of the encoder grid.
+            voxel_resolution (int): encoder voxel grid resolution over [-1, 1].
+            pts_per_face (float): target points per mesh face.
+            latency_budget_ms (float): encoder latency budget; 0 disables the cap.
+            base_latency_ms (float): fixed encoder latency independent of the point count.
+            ms_per_kpt (float): encoder latency per 1000 points.
+            bucket (int): the count is rounded up to a multiple of this.
+        """
+        assert 0 < min_pts <= max_pts
+        self.min_pts = int(min_pts)
+        self.max_pts = int(max_pts)
+        self.pts_per_voxel = pts_per_voxel
+        self.voxel_resolution = voxel_resolution
+        self.pts_per_face = pts_per_face
+        self.latency_budget_ms = latency_budget_ms
+        self.base_latency_ms = base_latency_ms
+        self.ms_per_kpt = ms_per_kpt
+        self.bucket = max(int(bucket), 1)
+
+    @classmethod
+    def from_cfg(cls, cfg):
+        c = cfg.adaptive_pc
+        return cls(min_pts=c.min_pts, max_pts=c.max_pts,
+                   pts_per_voxel=c.pts_per_voxel, voxel_resolution=c.voxel_resolution,
+                   pts_per_face=c.pts_per_face, latency_budget_ms=c.latency_budget_ms,
+                   base_latency_ms=c.base_latency_ms, ms_per_kpt=c.ms_per_kpt,
+                   bucket=c.bucket)
+
+    def choose(self, surface_area, n_faces):
+        """
+        Point count for a normalized mesh.
+
+        Parameters:
+            surface_area (float): surface area of the normalized mesh.
+            n_faces (int): number of faces.
+
+        Returns:
+            int: encoder point count.
+        """
+        voxel_area = (2.0 / self.voxel_resolution) ** 2
+        n_pts = max(surface_area / voxel_area * self.pts_per_voxel, n_faces * self.pts_per_face)
+
+        if self.latency_budget_ms > 0 and self.ms_per_kpt > 0:
+            budget_pts = (self.latency_budget_ms - self.base_latency_ms) / self.ms_per_kpt * 1000
+            n_pts = min(n_pts, budget_pts)
+
+        n_pts = min(max(n_pts, self.min_pts), self.max_pts)
+        n_pts = int(math.ceil(n_pts / self.bucket) * self.bucket)
+        return min(n_pts, self.max_pts)
+
+    def describe(self):
+        return dict(vars(self))
@@ -0,0 +1,68 @@
+import torch
+import torch.nn as nn
+
+#########################
+## Per-stage bf16 on CPU
+#########################
+## cfg.cpu.bf16_stages runs the listed encoder stages under CPU bf16 autocast: convs,
+## linears and attention use bf16 (AMX / AVX512-BF16 kernels on recent Xeons), everything
+## else stays fp32:
+##   - the normalization layers (InstanceNorm3d / GroupNorm / LayerNorm) inside a bf16
+##     stage are run in fp32 with autocast disabled (CPU autocast would keep them in bf16),
+##   - every stage returns fp32 tensors, so the scatter means between the stages
+##     (my_voxelization, generate_plane_features) and the triplane readout stay fp32,
+##   - grid_sample (devoxelization) is on autocast's fp32 list.
+## The stages are patched per instance (forward attribute), parameters and checkpoint keys
+## are unchanged.
+
+BF16_STAGES = ("pc_encoder", "unet", "transformer")
+FP32_NORMS = (nn.LayerNorm, nn.GroupNorm, nn.InstanceNorm1d, nn.InstanceNorm2d, nn.InstanceNorm3d,
+              nn.BatchNorm1d, nn.BatchNorm2d, nn.BatchNorm3d)
+
+def to_float(x):
+    if torch.is_tensor(x):
+        return x.float() if x.is_floating_point() else x
+    if isinstance(x, (list, tuple)):
+        return type(x)(to_float(v) for v in x)
+    return x
+
+def wrap_forward(module, dtype):
+    """
+    Runs `module` under CPU autocast to `dtype` (fp32: autocast disabled), with fp32 inputs
+    for fp32 and fp32 outputs for both.
+    """
+    forward = module.forward
+    enabled = dtype != torch.float32
+
+    def autocast_forward(*args, **kwargs):
+        if not enabled:
+            args = to_float(args)
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=enabled):
+            return to_float(forward(*args, **kwargs))
+    module.forward = autocast_forward
+
+def enable_bf16_stage(module):
+    for child in module.modules():
+        if isinstance(child, FP32_NORMS):
+            wrap_forward(child, torch.float32)
+    wrap_forward(module, torch.bfloat16)
+
+def stage_modules(pvcnn, triplane_transformer):
+    return {"pc_encoder": pvcnn.pc_encoder, "unet": pvcnn.unet_encoder, "transformer": triplane_transformer}
+
+def enable_cpu_bf16(cfg, pvcnn, triplane_transformer):
+    """
+    Switches the stages listed in cfg.cpu.bf16_stages to bf16, in place.
+
+    Returns:
+        list: the bf16 stages.
+    """
+    stages = list(cfg.cpu.bf16_stages)
+    modules = stage_modules(pvcnn, triplane_transformer)
+    for stage in stages:
+        assert stage in BF16_STAGES, f"Unknown bf16 stage: {stage}, use some of {BF16_STAGES}"
+        if modules[stage] is not None:
+            enable_bf16_stage(modules[stage])
+    if stages:
+        print("bf16 stages:", stages)
+    return stages
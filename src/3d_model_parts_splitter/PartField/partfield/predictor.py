@@ -0,0 +1,270 @@
+import contextlib
+import os
+import time
+
+import numpy as np
+import torch
+
+from partfield.dataloader import Demo_Dataset, Demo_Remesh_Dataset, Correspondence_Demo_Dataset, build_inference_dataloader, encode_point_clouds
+from partfield.streaming_dataset import Manifest_Dataset
+from partfield.model.triplane import TriplaneTransformer
+from partfield.model.PVCNN.encoder_pc import TriPlanePC2Encoder
+from partfield.surface_sampler import SurfaceSampler
+from partfield.device import resolve_device, configure_cpu_threads, sample_chunk_size
+from partfield.compile import compile_encoder_stack
+from partfield.quantization import load_quantized, quantized_path
+from partfield.precision import enable_cpu_bf16
+from partfield.face_features import adaptive_face_kwargs, mesh_features, point_features, save_outputs, output_exists
+from partfield.feature_field import save_part_planes
+
+#########################
+## Plain inference engine
+#########################
+## PartFieldPredictor runs pvcnn -> triplane_transformer -> feature readout on one device
+## without the Lightning Trainer, DDP or checkpoint callbacks: it loads only the weights the
+## forward pass needs and returns numpy arrays, so it can be embedded in a handler or a
+## benchmark and kept alive between requests. `run` writes the same files as
+## Model.predict_step for use from partfield_inference.py (inference_engine "predictor").
+
+def build_predict_dataset(cfg):
+    if cfg.dataset.manifest:
+        return Manifest_Dataset(cfg)
+    elif cfg.remesh_demo:
+        return Demo_Remesh_Dataset(cfg)
+    elif cfg.correspondence_demo:
+        return Correspondence_Demo_Dataset(cfg)
+    return Demo_Dataset(cfg)
+
+def build_pvcnn(cfg, device=None):
+    return TriPlanePC2Encoder(
+        cfg.pvcnn,
+        device=device,
+        shape_min=-1,
+        shape_length=2,
+        use_2d_feat=cfg.use_2d_feat)
+
+def build_triplane_transformer(cfg):
+    return TriplaneTransformer(
+        input_dim=cfg.triplane_channels_low * 2,
+        transformer_dim=1024,
+        transformer_layers=6,
+        transformer_heads=8,
+        triplane_low_res=32,
+        triplane_high_res=128,
+        triplane_dim=cfg.triplane_channels_high,
+        attention=cfg.attention_backend,
+    )
+
+def load_module_weights(module, state_dict, prefix):
+    weights = {k[len(prefix):]: v for k, v in state_dict.items() if k.startswith(prefix)}
+    if not weights:
+        raise KeyError(f"No '{prefix}' weights in the checkpoint")
+    module.load_state_dict(weights)
+
+class PartFieldPredictor:
+    def __init__(self, cfg, ckpt_path=None, device=None):
+        """
+        Parameters:
+            cfg (CfgNode): the inference config (same as for partfield_inference.py).
+            ckpt_path (str, optional): Lightning checkpoint; defaults to cfg.continue_ckpt.
+            device (str, optional): defaults to cfg.device (cuda when available).
+        """
+        self.cfg = cfg
+        self.device = torch.device(device) if device else resolve_device(cfg)
+        if self.device.type == "cpu":
+            print("CPU threads (intra-op, inter-op):", configure_cpu_threads(cfg))
+        self.n_sample_each = sample_chunk_size(cfg, self.device)
+        assert not cfg.use_2d_feat, "PartFieldPredictor does not support 2d feature input"
+
+        self.pvcnn = build_pvcnn(cfg, device=self.device)
+        self.triplane_transformer = build_triplane_transformer(cfg)
+
+        ckpt_path = ckpt_path or cfg.continue_ckpt
+        start = time.time()
+        checkpoint = torch.load(ckpt_path, map_location="cpu", weights_only=False)
+        state_dict = checkpoint.get("state_dict", checkpoint)
+        load_module_weights(self.pvcnn, state_dict, "pvcnn.")
+        load_module_weights(self.triplane_transformer, state_dict, "triplane_transformer.")
+        del checkpoint, state_dict
+        print(f"Loaded {ckpt_path} in {time.time() - start:.2f}s")
+
+        if cfg.quantization.mode:
+            assert cfg.quantization.mode == "dynamic_int8", f"Unknown quantization mode: {cfg.quantization.mode}"
+            assert self.device.type == "cpu" and cfg.encoder_backend == "torch", "dynamic_int8 runs on the torch CPU backend"
+            load_quantized(quantized_path(cfg, ckpt_path), self.triplane_transformer)
+
+        self.pvcnn.to(self.device).eval()
+        self.triplane_transformer.to(self.device).eval()
+
+        self.onnx_encoder = None
+        if cfg.encoder_backend == "onnx":
+            ### onnxruntime runs the encoder stack, see onnx_backend.py
+            from partfield.onnx_backend import load_onnx_encoder
+            assert self.device.type == "cpu", "encoder_backend onnx runs on CPU"
+            self.onnx_encoder = load_onnx_encoder(cfg, ckpt_path, self.pvcnn, self.triplane_transformer)
+            ### the session holds its own copy of the weights
+            self.pvcnn = self.triplane_transformer = None
+        else:
+            assert cfg.encoder_backend == "torch", f"Unknown encoder_backend: {cfg.encoder_backend}"
+            if self.device.type == "cpu":
+                enable_cpu_bf16(cfg, self.pvcnn, self.triplane_transformer)
+            compile_encoder_stack(cfg, self.pvcnn, self.triplane_transformer)
+
+    def autocast(self):
+        ### same numerics as the Trainer's precision="16-mixed"
+        if self.device.type == "cuda":
+            return torch.autocast("cuda", dtype=torch.float16)
+        return contextlib.nullcontext()
+
+    def sample_pc(self, vertices, faces, n_pts=None):
+        n_pts = n_pts or self.cfg.pc_num_pts
+        sampler = SurfaceSampler(vertices, faces, device=self.device)
+        return sampler.sample(int(n_pts), seed=self.cfg.seed).unsqueeze(0)
+
+    def as_tensor(self, x, dtype=None):
+        return torch.as_tensor(x, dtype=dtype).to(self.device)
+
+    @torch.no_grad()
+    def encode(self, pc):
+        """
+        Part triplanes of normalized point clouds.
+
+        Parameters:
+            pc (array or torch.Tensor): (N, 3) points in [-1, 1], or a (B, N, 3) batch.
+
+        Returns:
+            torch.Tensor: (B, 3, C, H, W) part planes (the sdf planes are dropped).
+        """
+        pc = self.as_tensor(pc, torch.float32)
+        if pc.dim() == 2:
+            pc = pc.unsqueeze(0)
+        if self.onnx_encoder is not None:
+            return self.onnx_encoder(pc)
+        with self.autocast():
+            planes = self.triplane_transformer(self.pvcnn(pc, pc))
+        _, part_planes = torch.split(planes, [64, planes.shape[2] - 64], dim=2)
+        return part_planes
+
+    @torch.no_grad()
+    def predict_points(self, pc, return_planes=False):
+        """
+        Features at the points of normalized point clouds: an (N, C) numpy array for an
+        (N, 3) cloud, a list of them for a (B, N, 3) batch or a list of clouds (their sizes
+        can differ, every point gets a feature). With `return_planes` the part planes are
+        returned as well.
+        """
+        single = not isinstance(pc, (list, tuple)) and np.ndim(pc) == 2
+        pcs = [self.as_tensor(points, torch.float32).reshape(-1, 3) for points in ([pc] if single else pc)]
+        part_planes = encode_point_clouds(self.encode, pcs)
+        with self.autocast():
+            feats = [point_features(part_planes[b:b + 1], points).float().cpu().numpy()
+                     for b, points in enumerate(pcs)]
+        feats = feats[0] if single else feats
+        return (feats, part_planes) if return_planes else feats
+
+    @torch.no_grad()
+    def predict(self, vertices, faces, pc=None, n_pts=None):
+        """
+        Per-face (or per-vertex, with cfg.vertex_feature) features of a normalized mesh.
+
+        Parameters:
+            vertices (array or torch.Tensor): (V, 3) vertices in [-1, 1].
+            faces (array or torch.Tensor): (F, 3) face indices.
+            pc (array or torch.Tensor, optional): encoder point cloud; sampled from the
+                mesh with n_pts (default cfg.pc_num_pts) points if not given.
+
+        Returns:
+            np.ndarray: (F, C) features, or (V, C) with cfg.vertex_feature.
+        """
+        pcs = None if pc is None else [pc]
+        return self.predict_batch([vertices], [faces], pcs=pcs, n_pts=n_pts)[0]
+
+    @torch.no_grad()
+    def predict_batch(self, vertices, faces, pcs=None, n_pts=None, return_planes=False):
+        """
+        Batched `predict`: the encoder and transformer run once over all meshes, the face
+        readout per mesh.
+
+        Parameters:
+            vertices, faces (list): per-mesh (V, 3) vertices and (F, 3) faces.
+            pcs (list or torch.Tensor, optional): per-mesh point clouds (sizes can differ), or a
+                (B, N, 3) stack.
+            n_pts (int or list, optional): point counts when the clouds are sampled here.
+            return_planes (bool): also return the (B, 3, C, H, W) part planes.
+
+        Returns:
+            list: (F, C) numpy features of every mesh.
+        """
+        vertices = [self.as_tensor(v) for v in vertices]
+        faces = [self.as_tensor(f, torch.int64) for f in faces]
+        if pcs is None:
+            n_pts = n_pts if isinstance(n_pts, (list, tuple)) else [n_pts] * len(vertices)
+            pcs = [self.sample_pc(v, f, n) for v, f, n in zip(vertices, faces, n_pts)]
+        pcs = [self.as_tensor(pc, torch.float32).reshape(-1, 3) for pc in pcs]
+        part_planes = encode_point_clouds(self.encode, pcs)
+
+        feats = []
+        with self.autocast():
+            for b in range(len(vertices)):
+                point_feat = mesh_features(part_planes[b:b + 1], vertices[b], faces[b],
+                                           self.cfg.n_point_per_face, self.n_sample_each,
+                                           vertex_feature=self.cfg.vertex_feature,
+                                           face_sampling=self.cfg.face_sampling,
+                                           quadrature_points_per_face=self.cfg.face_quadrature_points,
+                                           adaptive=adaptive_face_kwargs(self.cfg))
+                feats.append(point_feat.float().cpu().numpy())
+        return (feats, part_planes) if return_planes else feats
+
+    def run(self, dataset=None, save_dir=None):
+        """
+        Runs over `dataset` (default: the one partfield_inference.py would use) in batches of
+        cfg.dataset.val_batch_size and writes the predict_step outputs to save_dir (default
+        exp_results/<result_name>).
+
+        Returns:
+            list: uids whose outputs were written.
+        """
+        dataset = dataset if dataset is not None else build_predict_dataset(self.cfg)
+        save_dir = save_dir or f"exp_results/{self.cfg.result_name}"
+        os.makedirs(save_dir, exist_ok=True)
+        ledger = getattr(dataset, "ledger", None)
+
+        written = []
+        for batch in build_inference_dataloader(self.cfg, dataset):
+            starttime = time.time()
+            for uid in batch['skipped_uids']:
+                print("Skipping " + uid + ", it does not fit the memory budget.")
+            todo = []
+            for i, uid in enumerate(batch['uid']):
+                if output_exists(save_dir, uid):
+                    print("Already processed " + uid)
+                else:
+                    todo.append(i)
+
+            if todo and self.cfg.is_pc:
+                feats, part_planes = self.predict_points([batch['pc'][i] for i in todo], return_planes=True)
+                for i, point_feat in zip(todo, feats):
+                    save_outputs(save_dir, batch['uid'][i], point_feat, points=batch['pc'][i].numpy())
+            elif todo:
+                vertices = [batch['vertices'][i] for i in todo]
+                faces = [batch['faces'][i] for i in todo]
+                pcs = [batch['pc'][i] for i in todo] if 'pc' in batch else None
+                feats, part_planes = self.predict_batch(vertices, faces, pcs=pcs,
+                                                        n_pts=[int(batch['pc_num_pts'][i]) for i in todo],
+                                                        return_planes=True)
+                print("Time elapsed for feature prediction: " + str(time.time() - starttime))
+                for i, point_feat in zip(todo, feats):
+                    save_outputs(save_dir, batch['uid'][i], point_feat, vertices=batch['vertices'][i].numpy(),
+                                 faces=batch['faces'][i].numpy(), vertex_feature=self.cfg.vertex_feature)
+            if todo and self.cfg.save_part_planes:
+                for j, i in enumerate(todo):
+                    save_part_planes(save_dir, batch['uid'][i], part_planes[j:j + 1])
+            written += [batch['uid'][i] for i in todo]
+
+            if ledger is not None:
+                for uid in batch['uid']:
+                    ledger.mark_done(uid, status="done")
+                for uid in batch['skipped_uids']:
+                    ledger.mark_done(uid, status="skipped")
+            print("Time elapsed: " + str(time.time() - starttime))
+        return written
@@ -0,0 +1,63 @@
+import os
+
+import torch
+import torch.nn as nn
+
+#########################
+## Dynamic int8 quantization
+#########################
+## On CPU the triplane transformer's MLPs (6 x 1024 -> 4096 -> 1024 and the
+## TriplaneTransformer.mlp skip branch) dominate the FLOPs. quantization.mode
+## "dynamic_int8" replaces a calibrated subset of them by int8 dynamically quantized
+## Linears (int8 weights, activations quantized per batch at run time, fbgemm/onednn
+## kernels). The attention projections and the convolutions stay fp32.
+##
+## quantize_partfield.py picks the subset: it measures on a few calibration meshes how
+## much each layer group (one block's MLP, or the skip MLP) lowers the cosine similarity of
+## the point features to fp32 and keeps the groups whose combined drop stays within
+## quantization.max_cos_drop. The quantized transformer weights and the chosen layers are
+## saved next to the checkpoint (<ckpt>.int8.pt) and loaded by PartFieldPredictor.
+
+def linear_groups(triplane_transformer):
+    """
+    {group name: [Linear submodule names]} of the quantizable layers: the MLP of every
+    transformer block and the skip-branch mlp.
+    """
+    groups = {}
+    for name, module in triplane_transformer.named_modules():
+        ### attention projections (MultiheadAttention's out_proj is a Linear subclass) stay fp32
+        group = name.rsplit(".", 1)[0]
+        if type(module) is nn.Linear and group.split(".")[-1] == "mlp":
+            groups.setdefault(group, []).append(name)
+    return groups
+
+def quantize_linears(triplane_transformer, layers):
+    """
+    Replaces the Linear submodules named in `layers` by dynamically quantized int8 ones, in place.
+    """
+    if layers:
+        torch.ao.quantization.quantize_dynamic(triplane_transformer, qconfig_spec=set(layers),
+                                               dtype=torch.qint8, inplace=True)
+    return triplane_transformer
+
+def quantized_path(cfg, ckpt_path):
+    if cfg.quantization.path:
+        return cfg.quantization.path
+    return os.path.splitext(ckpt_path)[0] + ".int8.pt"
+
+def save_quantized(path, triplane_transformer, layers, calibration=None):
+    torch.save({"layers": list(layers), "state_dict": triplane_transformer.state_dict(),
+                "calibration": calibration or {}}, path)
+    print(f"Saved int8 weights of {len(layers)} layers to {path}")
+
+def load_quantized(path, triplane_transformer):
+    """
+    Quantizes the layers recorded in `path` and loads their int8 weights, in place.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No int8 weights at {path}, run quantize_partfield.py to calibrate and export them")
+    data = torch.load(path, map_location="cpu", weights_only=False)
+    quantize_linears(triplane_transformer, data["layers"])
+    triplane_transformer.load_state_dict(data["state_dict"])
+    print(f"Loaded int8 weights of {len(data['layers'])} layers from {path}")
+    return data["layers"]
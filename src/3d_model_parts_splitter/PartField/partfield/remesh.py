@@ -0,0 +1,449 @@
+import functools
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import skimage
+import trimesh
+
+import mesh2sdf
+import tetgen
+
+from partfield.device import usable_cpus
+from partfield.mesh_cleanup import remove_unreferenced_vertices
+
+#########################
+## UDF + tetgen remesh
+#########################
+## Unsigned distance field -> marching cubes -> per-component normal fix -> tetgen, then
+## the boundary surface of the tet mesh. Everything stays in memory: the surface is read
+## straight from tetgen's node/elem arrays instead of a .vtk/.obj round-trip, and the
+## per-component work is spread over a worker pool (see tet_remesh).
+##
+## The distance field is either mesh2sdf's dense size^3 grid or a sparse narrow band
+## (sparse_udf below) that only stores blocks near the surface. Both use the same grid:
+## point (i, j, k) sits at -1 + 2 * (i, j, k) / size.
+
+# Faces of a positively oriented tet (a, b, c, d), wound so their normals point outwards
+TET_FACES = np.array([[1, 2, 3], [0, 3, 2], [0, 1, 3], [0, 2, 1]])
+
+def extract_tet_surface(nodes, elems):
+    """
+    Boundary surface of a tetrahedral mesh: the faces that belong to exactly one tet,
+    found with a sorted face-key pass, oriented outwards and compacted.
+
+    Parameters:
+        nodes (numpy.ndarray): (N, 3) tet mesh vertices.
+        elems (numpy.ndarray): (T, 4) (or (T, 10) for quadratic tets) element indices.
+
+    Returns:
+        tuple: (vertices, faces) of the boundary surface.
+    """
+    nodes = np.asarray(nodes, dtype=np.float64)
+    elems = np.asarray(elems, dtype=np.int64)[:, :4]
+    if len(elems) == 0:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+
+    ### flip negatively oriented tets so the TET_FACES winding is outward for all of them
+    p = nodes[elems]
+    vol = np.einsum('ij,ij->i', np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0]), p[:, 3] - p[:, 0])
+    elems = np.where((vol < 0)[:, None], elems[:, [0, 1, 3, 2]], elems)
+
+    faces = elems[:, TET_FACES].reshape(-1, 3)
+    keys = np.sort(faces, axis=1)
+    n_v = len(nodes)
+    if n_v < 2 ** 21:
+        keys = (keys[:, 0] * n_v + keys[:, 1]) * n_v + keys[:, 2]
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    else:
+        _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    faces = faces[counts[inverse.reshape(-1)] == 1]
+
+    ### keep only surface vertices
+    used = np.zeros(n_v, dtype=bool)
+    used[faces.reshape(-1)] = True
+    remap = np.cumsum(used) - 1
+    return nodes[used], remap[faces]
+
+def window_distances(tris, lo, offsets):
+    """
+    Exact unsigned distances from the grid points `lo + offsets` to each triangle.
+
+    The point-triangle distance is written in terms of four dot products of q = p - a
+    (with the edges ab, ac, the unit normal and q itself); those are affine in the
+    offset, so one batched matmul gives them for the whole window.
+
+    Parameters:
+        tris (numpy.ndarray): (T, 3, 3) triangles, in grid units.
+        lo (numpy.ndarray): (T, 3) window origin of each triangle.
+        offsets (numpy.ndarray): (P, 3) window offsets.
+
+    Returns:
+        numpy.ndarray: (T, P) distances.
+    """
+    a = tris[:, 0]
+    e1, e2 = tris[:, 1] - a, tris[:, 2] - a
+    n = np.cross(e1, e2)
+    n_len = np.linalg.norm(n, axis=1, keepdims=True)
+    n = n / np.maximum(n_len, 1e-12)
+    r = lo - a
+
+    ### x = q.e1, y = q.e2, h = q.n, qq = q.q
+    proj = np.matmul(offsets[None], np.stack([e1, e2, n, 2 * r], axis=2))  # (T, P, 4)
+    x = proj[..., 0] + np.einsum('ij,ij->i', r, e1)[:, None]
+    y = proj[..., 1] + np.einsum('ij,ij->i', r, e2)[:, None]
+    h = proj[..., 2] + np.einsum('ij,ij->i', r, n)[:, None]
+    qq = proj[..., 3] + np.einsum('ij,ij->i', r, r)[:, None] + np.einsum('ij,ij->i', offsets, offsets)[None]
+
+    d11 = np.einsum('ij,ij->i', e1, e1)[:, None]
+    d12 = np.einsum('ij,ij->i', e1, e2)[:, None]
+    d22 = np.einsum('ij,ij->i', e2, e2)[:, None]
+    det = d11 * d22 - d12 * d12
+
+    ### projection inside the triangle: distance to the plane
+    v = d22 * x - d12 * y
+    w = d11 * y - d12 * x
+    inside = (v >= 0) & (w >= 0) & (v + w <= det) & (det > 1e-12)
+
+    ### otherwise: closest of the three edges (ab, ac, bc)
+    def edge_sq_dist(qe, qq_e, ee):
+        t = np.clip(qe / np.maximum(ee, 1e-12), 0.0, 1.0)
+        return qq_e - 2 * t * qe + t * t * ee
+
+    d_sq = np.minimum(edge_sq_dist(x, qq, d11), edge_sq_dist(y, qq, d22))
+    d_sq = np.minimum(d_sq, edge_sq_dist(y - x - d12 + d11, qq - 2 * x + d11, d11 - 2 * d12 + d22))
+    d_sq = np.where(inside, h * h, d_sq)
+    return np.sqrt(np.maximum(d_sq, 0.0))
+
+def subdivide_triangles(tris, max_edge):
+    """
+    Midpoint-split a triangle soup (T, 3, 3) until no edge is longer than `max_edge`.
+    The union of the pieces is the original surface, so its distance field is unchanged.
+    """
+    done = []
+    while len(tris) > 0:
+        edge_len = np.linalg.norm(tris - tris[:, [1, 2, 0]], axis=-1).max(-1)
+        long = edge_len > max_edge
+        done.append(tris[~long])
+        tris = tris[long]
+        if len(tris) == 0:
+            break
+        a, b, c = tris[:, 0], tris[:, 1], tris[:, 2]
+        ab, bc, ca = (a + b) / 2, (b + c) / 2, (c + a) / 2
+        tris = np.concatenate([np.stack(t, axis=1) for t in
+                               ((a, ab, ca), (ab, b, bc), (ca, bc, c), (ab, bc, ca))])
+    return np.concatenate(done)
+
+def sparse_udf(vertices, faces, size=256, band=2.5, block_size=16, max_edge=None, max_evals=1 << 20):
+    """
+    Narrow-band unsigned distance field on a block-sparse grid.
+
+    Triangles are split until their edges are at most `max_edge` voxels long, then the
+    distance is evaluated exactly on the grid points in each triangle's bounding box grown
+    by `band` voxels, and min-reduced into the blocks those points fall in. Points further
+    than `band` from the surface keep the value `band`. Memory and time scale with the
+    surface area rather than the grid volume.
+
+    Parameters:
+        vertices (numpy.ndarray): (N, 3) vertices, normalized to [-1, 1].
+        faces (numpy.ndarray): (M, 3) triangle indices.
+        size (int): grid resolution (same grid as mesh2sdf.core.compute(..., size)).
+        band (float): narrow-band half width, in voxels.
+        block_size (int): block edge length, in grid points (>= max_edge + 2 * band).
+        max_edge (float, optional): triangle edge length the mesh is split to, in voxels.
+            Defaults to the largest that fits the block size, at most 8.
+        max_evals (int): point-triangle distance evaluations per chunk.
+
+    Returns:
+        tuple: (block_coords, blocks) with block_coords (K, 3) int64 block indices and
+            blocks (K, B, B, B) float32 distances in voxels.
+    """
+    B = int(block_size)
+    if max_edge is None:
+        max_edge = min(8.0, B - 2 * band)
+    assert 0 < max_edge and max_edge + 2 * band <= B, "block_size must be at least max_edge + 2 * band"
+    n_blocks = (size + B - 1) // B
+
+    ### grid units: point (i, j, k) at (i, j, k)
+    v = (np.asarray(vertices, dtype=np.float64) + 1.0) * (size / 2.0)
+    tris = subdivide_triangles(v[np.asarray(faces, dtype=np.int64)], max_edge)
+
+    ### window of grid points around each triangle; it spans at most two blocks per axis
+    lo = np.ceil(tris.min(1) - band).astype(np.int64)
+    dims = np.floor(tris.max(1) + band).astype(np.int64) - lo + 1
+
+    corners = np.stack([lo // B, (lo + dims - 1) // B], axis=1)  # (T, 2, 3)
+    corner_sel = np.stack(np.meshgrid(*[np.arange(2)] * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+    block_coords = corners[:, corner_sel, [0, 1, 2]].reshape(-1, 3)
+    block_coords = block_coords[np.all((block_coords >= 0) & (block_coords < n_blocks), axis=1)]
+    block_keys = np.unique((block_coords[:, 0] * n_blocks + block_coords[:, 1]) * n_blocks + block_coords[:, 2])
+    block_coords = np.stack(np.unravel_index(block_keys, (n_blocks,) * 3), axis=1)
+
+    blocks = np.full((len(block_keys), B, B, B), band, dtype=np.float32)
+    flat = blocks.reshape(-1)
+
+    ### triangles with the same window shape are evaluated together
+    dim_keys, tri_group = np.unique(dims, axis=0, return_inverse=True)
+    for g, dim in enumerate(dim_keys):
+        group = np.flatnonzero(tri_group.reshape(-1) == g)
+        offsets = np.stack(np.meshgrid(*[np.arange(k) for k in dim], indexing='ij'), axis=-1).reshape(-1, 3)
+        chunk = max(1, max_evals // len(offsets))
+        for start in range(0, len(group), chunk):
+            sel = group[start:start + chunk]
+            d = window_distances(tris[sel], lo[sel].astype(np.float64), offsets.astype(np.float64))
+
+            t, o = np.nonzero(d < band)
+            idx = lo[sel][t] + offsets[o]
+            valid = np.all((idx >= 0) & (idx < size), axis=1)
+            idx, d = idx[valid], d[t[valid], o[valid]]
+
+            bc = idx // B
+            rows = np.searchsorted(block_keys, (bc[:, 0] * n_blocks + bc[:, 1]) * n_blocks + bc[:, 2])
+            local = idx % B
+            np.minimum.at(flat, ((rows * B + local[:, 0]) * B + local[:, 1]) * B + local[:, 2], d.astype(np.float32))
+
+    return block_coords, blocks
+
+def sparse_marching_cubes(block_coords, blocks, level, size, background):
+    """
+    Marching cubes over the occupied blocks of a sparse grid. Each block is padded with one
+    layer from its +x/+y/+z neighbours (or `background` where there is none) so cells on
+    block seams are covered exactly once; seam vertices are welded afterwards.
+
+    Returns:
+        tuple: (vertices, faces), vertices in grid units.
+    """
+    B = blocks.shape[1]
+    n_blocks = (size + B - 1) // B
+    keys = (block_coords[:, 0] * n_blocks + block_coords[:, 1]) * n_blocks + block_coords[:, 2]
+
+    padded = np.full((len(blocks), B + 1, B + 1, B + 1), background, dtype=np.float32)
+    padded[:, :B, :B, :B] = blocks
+    for dx in (0, 1):
+        for dy in (0, 1):
+            for dz in (0, 1):
+                if dx == dy == dz == 0:
+                    continue
+                nb = block_coords + np.array([dx, dy, dz])
+                valid = np.all(nb < n_blocks, axis=1)
+                nb_keys = (nb[:, 0] * n_blocks + nb[:, 1]) * n_blocks + nb[:, 2]
+                rows = np.clip(np.searchsorted(keys, nb_keys), 0, len(keys) - 1)
+                valid &= keys[rows] == nb_keys
+                dst = tuple(slice(B, B + 1) if o else slice(0, B) for o in (dx, dy, dz))
+                src = tuple(slice(0, 1) if o else slice(0, B) for o in (dx, dy, dz))
+                padded[(np.flatnonzero(valid),) + dst] = blocks[(rows[valid],) + src]
+
+    all_vertices, all_faces, all_copies = [], [], []
+    n_v = 0
+    for coord, vol in zip(block_coords, padded):
+        origin = coord * B
+        ### stay inside the size^3 grid of the dense field
+        ext = np.minimum(B + 1, size - origin)
+        if np.any(ext < 2):
+            continue
+        vol = vol[:ext[0], :ext[1], :ext[2]]
+        if vol.min() >= level or vol.max() <= level:
+            continue
+        verts, faces, _, _ = skimage.measure.marching_cubes(vol, level)
+        all_copies.append(np.any(verts == B, axis=1))
+        all_vertices.append(verts.astype(np.float64) + origin)
+        all_faces.append(faces + n_v)
+        n_v += len(verts)
+
+    if n_v == 0:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+    vertices = np.concatenate(all_vertices)
+    faces = np.concatenate(all_faces).astype(np.int64)
+
+    ### Vertices on the padding layer (local coordinate B) are copies of vertices of the
+    ### neighbouring block: same edge, same values, integer block offsets, so they are
+    ### bit-identical. Map each copy onto its original.
+    copy = np.concatenate(all_copies)
+    seam = np.flatnonzero(~copy & np.any((vertices % B == 0) & (vertices > 0), axis=1))
+    copies = np.flatnonzero(copy)
+    if len(copies) > 0:
+        cand = np.concatenate([seam, copies])
+        rows = np.ascontiguousarray(vertices[cand])
+        rows = rows.view(np.dtype((np.void, rows.dtype.itemsize * 3))).reshape(-1)
+        _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        rep = np.arange(len(vertices))
+        rep[copies] = cand[first[inverse.reshape(-1)[len(seam):]]]
+        faces = rep[faces]
+    return remove_unreferenced_vertices(vertices, faces)
+
+def udf_marching_cubes(vertices, faces, size=256, sparse=True, band=2.5, block_size=16):
+    """
+    Offset surface of a normalized mesh: marching cubes at level 2/size of its unsigned
+    distance field. Output vertices are in grid units [0, size].
+    """
+    if sparse:
+        ### level 2/size is one voxel in grid units
+        block_coords, blocks = sparse_udf(vertices, faces, size, band=band, block_size=block_size)
+        return sparse_marching_cubes(block_coords, blocks, 1.0, size, band)
+
+    level = 2 / size
+    sdf = mesh2sdf.core.compute(vertices, faces, size)
+    # NOTE: the negative value is not reliable if the mesh is not watertight
+    udf = np.abs(sdf)
+    vertices, faces, _, _ = skimage.measure.marching_cubes(udf, level)
+    return vertices, faces
+
+def fix_component_normals(vertices, faces):
+    """
+    trimesh fix_normals on one connected component, as plain arrays.
+    """
+    c = trimesh.Trimesh(vertices, faces, process=False)
+    c.fix_normals()
+    return c.vertices, c.faces
+
+def tetrahedralize_surface(vertices, faces, size):
+    """
+    tetgen on a closed surface (grid units) and the boundary surface of the result.
+    """
+    tet = tetgen.TetGen(vertices, faces)
+    ### on self-intersecting input tetgen also writes the facets it skipped to _skipped.face /
+    ### _skipped.node in the working directory, even when quiet (git-ignored)
+    tet.tetrahedralize(plc=True, nobisect=True, quality=True, fixedvolume=True, maxvolume=math.sqrt(2) / 12 * (2 / size) ** 3)
+    return extract_tet_surface(tet.node, tet.elem)
+
+def concatenate_arrays(parts):
+    """
+    Concatenate a list of (vertices, faces) pairs into one mesh.
+    """
+    if len(parts) == 0:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+    n_v = np.cumsum([0] + [len(v) for v, _ in parts[:-1]])
+    vertices = np.concatenate([v for v, _ in parts])
+    faces = np.concatenate([np.asarray(f, dtype=np.int64) + o for (_, f), o in zip(parts, n_v)])
+    return vertices, faces
+
+def overlap_clusters(bounds):
+    """
+    Group components whose bounding boxes overlap (transitively). Components of different
+    groups are spatially separated, so tetgen can mesh each group on its own; nested
+    components (e.g. the inner and outer shell of the UDF offset) stay together.
+
+    Parameters:
+        bounds (numpy.ndarray): (C, 2, 3) per-component bounding boxes.
+
+    Returns:
+        list: lists of component indices.
+    """
+    n = len(bounds)
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    ### sweep along x: only boxes starting before this one ends can overlap it
+    order = np.argsort(bounds[:, 0, 0], kind="stable")
+    lo, hi = bounds[order, 0], bounds[order, 1]
+    for k in range(n):
+        end = np.searchsorted(lo[:, 0], hi[k, 0], side="right")
+        cand = np.arange(k + 1, end)
+        if len(cand) == 0:
+            continue
+        hit = cand[np.all((lo[cand, 1:] <= hi[k, 1:]) & (hi[cand, 1:] >= lo[k, 1:]), axis=1)]
+        for j in hit:
+            ri, rj = find(order[k]), find(order[j])
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+
+    roots = np.array([find(i) for i in range(n)])
+    return [np.flatnonzero(roots == r).tolist() for r in np.unique(roots)]
+
+def pack_by_size(sizes, chunk_size):
+    """
+    Greedily pack items (in order) into chunks of about `chunk_size` total size, so many
+    tiny items share one task while big ones get a task of their own.
+    """
+    chunks, current, total = [], [], 0
+    for i, n in enumerate(sizes):
+        if current and total + n > chunk_size:
+            chunks.append(current)
+            current, total = [], 0
+        current.append(i)
+        total += n
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _fix_normals_task(parts):
+    return [fix_component_normals(v, f) for v, f in parts]
+
+def _tet_task(groups, size):
+    ### one task: every group is normal-fixed, tetrahedralized and reduced to its surface
+    return [tetrahedralize_surface(*concatenate_arrays(_fix_normals_task(g)), size) for g in groups]
+
+def run_tasks(fn, tasks, num_workers):
+    """
+    Map `fn` over `tasks`, serially, over a process pool, or over a thread pool when
+    called from a daemonic process (e.g. a DataLoader worker), which cannot have children.
+    Pool processes are spawned, not forked: forking after torch has started its OpenMP
+    threads can deadlock the children.
+    """
+    if num_workers < 0:
+        num_workers = usable_cpus()
+    num_workers = min(num_workers, len(tasks))
+    if num_workers <= 1:
+        return [fn(t) for t in tasks]
+
+    if multiprocessing.current_process().daemon:
+        executor = ThreadPoolExecutor(num_workers)
+    else:
+        executor = ProcessPoolExecutor(num_workers, mp_context=multiprocessing.get_context("spawn"))
+    with executor:
+        return list(executor.map(fn, tasks))
+
+def tet_remesh(vertices, faces, size=256, num_workers=0, per_component_tet=False, chunk_faces=50000):
+    """
+    Fix the normals of every connected component of the marching cubes surface,
+    tetrahedralize, and return the boundary of the tet mesh.
+
+    Components are packed into tasks of about `chunk_faces` faces and dispatched over
+    `num_workers` workers (0: serial, -1: one per CPU). With `per_component_tet`, tetgen
+    also runs per task, on groups of components with overlapping bounding boxes, and the
+    surfaces are merged afterwards; otherwise it runs once on the whole mesh. tetgen's
+    Steiner point budget is per run, so per-group runs only pay off with enough workers.
+
+    Returns:
+        tuple: (vertices, faces) of the remeshed surface, in grid units [0, size].
+    """
+    components = trimesh.Trimesh(vertices, faces).split(only_watertight=False)
+    if len(components) > 100000:
+        raise NotImplementedError
+    parts = [(c.vertices, c.faces) for c in components]
+
+    if per_component_tet:
+        bounds = np.stack([np.stack([v.min(0), v.max(0)]) for v, _ in parts])
+        groups = overlap_clusters(bounds)
+        chunks = pack_by_size([sum(len(parts[i][1]) for i in g) for g in groups], chunk_faces)
+        tasks = [[[parts[i] for i in groups[k]] for k in chunk] for chunk in chunks]
+        results = run_tasks(functools.partial(_tet_task, size=size), tasks, num_workers)
+        return concatenate_arrays([r for task in results for r in task])
+
+    chunks = pack_by_size([len(f) for _, f in parts], chunk_faces)
+    results = run_tasks(_fix_normals_task, [[parts[i] for i in chunk] for chunk in chunks], num_workers)
+    vertices, faces = concatenate_arrays([r for task in results for r in task])
+
+    # generate tet mesh and extract its surface
+    return tetrahedralize_surface(vertices, faces, size)
+
+def remesh(vertices, faces, size=256, sparse=True, band=2.5, block_size=16,
+           num_workers=0, per_component_tet=False, chunk_faces=50000):
+    """
+    Full remesh of a mesh normalized to [-1, 1]. See udf_marching_cubes for the
+    distance field options and tet_remesh for the component parallelism.
+
+    Returns:
+        trimesh.Trimesh: remeshed surface, normalized to [-1, 1].
+    """
+    vertices, faces = udf_marching_cubes(vertices, faces, size, sparse=sparse, band=band, block_size=block_size)
+    vertices, faces = tet_remesh(vertices, faces, size, num_workers=num_workers,
+                                 per_component_tet=per_component_tet, chunk_faces=chunk_faces)
+    vertices = vertices * (2.0 / size) - 1.0  # normalize it to [-1, 1]
+    return trimesh.Trimesh(vertices, faces, process=False)
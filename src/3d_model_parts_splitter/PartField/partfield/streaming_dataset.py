@@ -0,0 +1,205 @@
+import contextlib
+import glob
+import json
+import os
+import shutil
+import tempfile
+
+import torch
+
+from partfield.dataloader import MeshLoader
+from partfield.memory_budget import MemoryBudgetExceeded
+
+#########################
+## Manifest-driven streaming dataset
+#########################
+## For bulk feature extraction over large corpora. The file list comes from a manifest
+## (local or s3://) that is read line by line, items are split deterministically over
+## machine shards, distributed ranks and DataLoader workers, inputs are fetched one at a
+## time from local disk or an S3-compatible store, and every finished uid is appended to a
+## progress ledger so a restarted job resumes exactly where it stopped.
+##
+## Manifest lines are either a path, "uid<TAB>path", or a JSON object {"uid": ..., "path": ...}.
+## Relative paths are resolved against dataset.data_path.
+
+def is_s3(path):
+    return path.startswith("s3://")
+
+def split_s3(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+def parse_manifest_line(line):
+    """
+    Returns:
+        tuple: (uid or None, path), or None for blank and comment lines.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        entry = json.loads(line)
+        return entry.get("uid"), entry["path"]
+    if "\t" in line:
+        uid, path = line.split("\t", 1)
+        return uid, path
+    return None, line
+
+def uid_from_path(path):
+    ### same rule as Demo_Dataset for paths relative to data_path
+    name = path.split("/", 3)[-1] if is_s3(path) else path
+    return os.path.splitext(name)[0].replace("/", "_")
+
+def shard_info(num_shards=1, shard_id=0):
+    """
+    (index, count) of the current reader among all readers: machine shards (num_shards,
+    shard_id) x distributed ranks x DataLoader workers of this process.
+    """
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        rank, world = torch.distributed.get_rank(), torch.distributed.get_world_size()
+    else:
+        world = int(os.environ.get("WORLD_SIZE", 1))
+        rank = int(os.environ.get("RANK", os.environ.get("LOCAL_RANK", 0)))
+
+    worker = torch.utils.data.get_worker_info()
+    worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+
+    index = (shard_id * world + rank) * num_workers + worker_id
+    return index, num_shards * world * num_workers
+
+class ProgressLedger:
+    """
+    Append-only record of finished uids, one JSONL file per writer in `ledger_dir`.
+    A uid is only recorded after its outputs are written, so a uid in the ledger is
+    complete and everything else is redone on resume.
+    """
+    def __init__(self, ledger_dir, writer_name="0"):
+        self.ledger_dir = ledger_dir
+        self.path = os.path.join(ledger_dir, f"progress_{writer_name}.jsonl")
+        os.makedirs(ledger_dir, exist_ok=True)
+
+    def completed(self):
+        done = set()
+        for fname in glob.glob(os.path.join(self.ledger_dir, "progress_*.jsonl")):
+            with open(fname) as f:
+                for line in f:
+                    try:
+                        done.add(json.loads(line)["uid"])
+                    except (ValueError, KeyError):
+                        ### a torn last line from an interrupted write
+                        continue
+        return done
+
+    def mark_done(self, uid, status="done"):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"uid": uid, "status": status}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+class FileSource:
+    """
+    Opens manifest and input files from local disk or an S3-compatible store.
+    The boto3 client is created lazily, in the process that uses it.
+    """
+    def __init__(self, data_path="", endpoint_url=""):
+        self.data_path = data_path
+        self.endpoint_url = endpoint_url or None
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return self._client
+
+    def resolve(self, path):
+        if is_s3(path) or os.path.isabs(path):
+            return path
+        return os.path.join(self.data_path, path)
+
+    def iter_lines(self, path):
+        path = self.resolve(path)
+        if is_s3(path):
+            bucket, key = split_s3(path)
+            body = self.client.get_object(Bucket=bucket, Key=key)["Body"]
+            for line in body.iter_lines():
+                yield line.decode("utf-8")
+        else:
+            with open(path) as f:
+                yield from f
+
+    @contextlib.contextmanager
+    def local_copy(self, path):
+        """
+        Local path of an input for the duration of the block. S3 objects are streamed to a
+        temporary file (keeping the extension, which the mesh loaders rely on) and removed.
+        """
+        path = self.resolve(path)
+        if not is_s3(path):
+            yield path
+            return
+        bucket, key = split_s3(path)
+        tmp_dir = tempfile.mkdtemp(prefix="partfield_")
+        try:
+            local_path = os.path.join(tmp_dir, os.path.basename(key))
+            with open(local_path, "wb") as f:
+                self.client.download_fileobj(bucket, key, f)
+            yield local_path
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+class Manifest_Dataset(torch.utils.data.IterableDataset):
+    def __init__(self, cfg):
+        super().__init__()
+
+        self.manifest = cfg.dataset.manifest
+        self.num_shards = cfg.dataset.num_shards
+        self.shard_id = cfg.dataset.shard_id
+        assert 0 <= self.shard_id < self.num_shards
+
+        self.source = FileSource(cfg.dataset.data_path, cfg.dataset.s3_endpoint_url)
+        ledger_dir = cfg.dataset.ledger_dir or f"exp_results/{cfg.result_name}/ledger"
+        rank = int(os.environ.get("RANK", os.environ.get("LOCAL_RANK", 0)))
+        self.ledger = ProgressLedger(ledger_dir, writer_name=f"{self.shard_id}_{rank}")
+
+        ### same item loading as Demo_Dataset, on the files the manifest names
+        self.loader = MeshLoader(cfg)
+
+        ### items pending for this rank when the run starts, summed over its DataLoader workers;
+        ### counted once: DataLoader and Lightning call len() repeatedly (the manifest may be on S3)
+        index, count = shard_info(self.num_shards, self.shard_id)
+        self.num_pending = sum(1 for _ in self.entries(index, count, self.ledger.completed()))
+        print("manifest:", self.manifest, "pending items for this rank:", self.num_pending)
+
+    def entries(self, index, count, done):
+        """
+        (uid, path) of every pending manifest entry whose position falls in reader `index`
+        of `count`; the manifest is streamed, not held in memory.
+        """
+        position = 0
+        for line in self.source.iter_lines(self.manifest):
+            entry = parse_manifest_line(line)
+            if entry is None:
+                continue
+            uid, path = entry
+            if position % count == index:
+                uid = uid or uid_from_path(path)
+                if uid not in done:
+                    yield uid, path
+            position += 1
+
+    def __len__(self):
+        return self.num_pending
+
+    def __iter__(self):
+        index, count = shard_info(self.num_shards, self.shard_id)
+        done = self.ledger.completed()
+        for uid, path in self.entries(index, count, done):
+            try:
+                with self.source.local_copy(path) as local_path:
+                    item = self.loader.get_model(path, uid=uid, local_path=local_path)
+            except MemoryBudgetExceeded as e:
+                print("Skipping " + e.uid + ": " + str(e))
+                item = {'uid': e.uid, 'skipped': True}
+            yield item
@@ -0,0 +1,73 @@
+import torch
+
+#########################
+## Seeded surface sampler
+#########################
+## Area-weighted face selection + uniform barycentric sampling in torch.
+## Replaces trimesh.sample.sample_surface for the encoder point cloud: it runs on any
+## device, is reproducible for a given seed, and keeps the area CDF so repeated draws
+## on the same mesh only pay for the sampling itself.
+
+class SurfaceSampler:
+    def __init__(self, vertices, faces, device="cpu"):
+        """
+        Parameters:
+            vertices (numpy.ndarray or torch.Tensor): (N, 3) vertex positions.
+            faces (numpy.ndarray or torch.Tensor): (M, 3) triangle indices.
+            device (str or torch.device): device the sampling runs on.
+        """
+        self.device = torch.device(device)
+        self.vertices = torch.as_tensor(vertices, dtype=torch.float32, device=self.device)
+        self.faces = torch.as_tensor(faces, dtype=torch.long, device=self.device)
+
+        tri = self.vertices[self.faces]
+        areas = 0.5 * torch.linalg.norm(torch.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0], dim=-1), dim=-1)
+
+        # float64 so the CDF keeps its resolution on meshes with millions of faces
+        # (MPS has no float64 support, fall back to float32 there)
+        cdf_dtype = torch.float32 if self.device.type == "mps" else torch.float64
+        cdf = torch.cumsum(areas.to(cdf_dtype), dim=0)
+        self.total_area = float(cdf[-1]) if len(cdf) > 0 else 0.0
+        if self.total_area <= 0:
+            raise ValueError("Cannot sample the surface of a mesh with zero area")
+        self.cdf = cdf / cdf[-1]
+
+    def sample(self, n_points, seed=0, batch_size=None, return_faces=False):
+        """
+        Draw `n_points` points uniformly over the surface.
+
+        Parameters:
+            n_points (int): points per sample.
+            seed (int): seed of the torch.Generator used for the draw.
+            batch_size (int, optional): if set, draw that many independent point sets at once.
+            return_faces (bool): also return the index of the face each point lies on.
+
+        Returns:
+            torch.Tensor: (n_points, 3) or (batch_size, n_points, 3) points, plus the
+                matching face indices if `return_faces`.
+        """
+        shape = (n_points,) if batch_size is None else (batch_size, n_points)
+        generator = torch.Generator(device=self.device)
+        generator.manual_seed(int(seed))
+
+        r = torch.rand(shape, generator=generator, device=self.device, dtype=self.cdf.dtype)
+        face_idx = torch.searchsorted(self.cdf, r, right=True).clamp_(max=len(self.faces) - 1)
+
+        # Uniform barycentric coordinates (same parametrization as Kaolin / predict_step)
+        uv = torch.rand(shape + (2,), generator=generator, device=self.device, dtype=torch.float32)
+        u = torch.sqrt(uv[..., 0:1])
+        v = uv[..., 1:2]
+
+        tri = self.vertices[self.faces[face_idx]]  # (..., 3, 3)
+        points = (1 - u) * tri[..., 0, :] + u * (1 - v) * tri[..., 1, :] + u * v * tri[..., 2, :]
+
+        if return_faces:
+            return points, face_idx
+        return points
+
+def sample_surface_points(vertices, faces, n_points, seed=0, device="cpu"):
+    """
+    One-shot helper: seeded area-weighted surface samples as a numpy (n_points, 3) array.
+    """
+    points = SurfaceSampler(vertices, faces, device=device).sample(n_points, seed=seed)
+    return points.cpu().numpy()
@@ -1,8 +1,5 @@
 from partfield.config import default_argument_parser, setup
-from lightning.pytorch import seed_everything, Trainer
-from lightning.pytorch.strategies import DDPStrategy
-from lightning.pytorch.callbacks import ModelCheckpoint
-import lightning
+from partfield.device import resolve_device, configure_cpu_threads
 import torch
 import glob
 import os, sys
@@ -10,6 +7,30 @@ import numpy as np
 import random
 
 def predict(cfg):
+    if cfg.remesh_demo:
+        cfg.n_point_per_face = 10
+
+    device = resolve_device(cfg)
+
+    if cfg.inference_engine == "predictor":
+        ### single device, no Trainer/DDP setup and no Lightning import (see partfield/predictor.py);
+        ### the predictor sets the CPU thread counts itself
+        from partfield.predictor import PartFieldPredictor
+        torch.manual_seed(0)
+        random.seed(0)
+        np.random.seed(0)
+        PartFieldPredictor(cfg, cfg.continue_ckpt, device=device).run()
+        return
+    assert cfg.inference_engine == "lightning", f"Unknown inference_engine: {cfg.inference_engine}"
+    assert cfg.encoder_backend == "torch", "encoder_backend onnx needs inference_engine predictor"
+    assert not cfg.quantization.mode, "quantization needs inference_engine predictor"
+    if device.type == "cpu":
+        print("CPU threads (intra-op, inter-op):", configure_cpu_threads(cfg))
+
+    from lightning.pytorch import seed_everything, Trainer
+    from lightning.pytorch.strategies import DDPStrategy
+    from lightning.pytorch.callbacks import ModelCheckpoint
+
     seed_everything(cfg.seed)
 
     torch.manual_seed(0)
@@ -27,10 +48,18 @@ def predict(cfg):
         verbose=True
     )]
 
-    trainer = Trainer(devices=-1,
-                      accelerator="gpu",
-                      precision="16-mixed",
-                      strategy=DDPStrategy(find_unused_parameters=True),
+    if device.type == "cuda":
+        trainer_device = dict(devices=[device.index] if device.index is not None else -1,
+                              accelerator="gpu",
+                              precision="16-mixed",
+                              strategy=DDPStrategy(find_unused_parameters=True))
+    else:
+        ### fp16 autocast is a GPU setting; CPU runs in fp32 (or the cpu.bf16_stages) in a single process.
+        ### bf16 matmuls on inference-mode tensors take a slow mkldnn fallback: predict under no_grad then
+        trainer_device = dict(devices=1, accelerator="cpu", precision="32-true", strategy="auto",
+                              inference_mode=not cfg.cpu.bf16_stages)
+
+    trainer = Trainer(**trainer_device,
                       max_epochs=cfg.training_epochs,
                       log_every_n_steps=1,
                       limit_train_batches=3500,
@@ -41,9 +70,6 @@ def predict(cfg):
     from partfield.model_trainer_pvcnn_only_demo import Model
     model = Model(cfg)        
 
-    if cfg.remesh_demo:
-        cfg.n_point_per_face = 10
-
     trainer.predict(model, ckpt_path=cfg.continue_ckpt)
         
 def main():
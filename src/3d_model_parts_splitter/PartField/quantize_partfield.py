@@ -0,0 +1,157 @@
+"""
+Calibrates and exports the dynamic int8 transformer MLPs (quantization.mode "dynamic_int8")
+and reports their quality against fp32.
+
+1. Encodes every calibration mesh of dataset.data_path (at most --max_meshes) with the
+   fp32 model and keeps the transformer inputs and the point features at the encoder points.
+2. Quantizes every layer group (one block's MLP, or the skip mlp) on its own and measures
+   the mean drop of the point feature cosine similarity to fp32, then adds the groups from
+   the least to the most sensitive while the combined drop stays within
+   quantization.max_cos_drop.
+3. Saves the quantized weights to quantization.path (default <ckpt>.int8.pt).
+4. Report: per mesh, face feature cosine similarity (fp32 vs. int8, same readout), KMeans
+   segmentation mIoU of the int8 labels against the fp32 labels (compute_metric.py IoU) for
+   --clusters part counts, and the transformer latency of both.
+
+Example:
+    python quantize_partfield.py -c configs/final/demo.yaml --opts \
+        continue_ckpt model/model_objaverse.ckpt dataset.data_path data/calibration preprocess_mesh True
+"""
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from sklearn.cluster import KMeans
+
+from compute_metric import eval_single_gt_shape
+from partfield.config import default_argument_parser, setup
+from partfield.dataloader import Demo_Dataset
+from partfield.face_features import adaptive_face_kwargs, mesh_features, point_features
+from partfield.predictor import PartFieldPredictor
+from partfield.quantization import linear_groups, quantize_linears, quantized_path, save_quantized
+
+def cosine(a, b):
+    return torch.nn.functional.cosine_similarity(a.float(), b.float(), dim=-1)
+
+@torch.no_grad()
+def part_planes(triplane_transformer, feat):
+    planes = triplane_transformer(feat)
+    return planes[:, :, 64:]
+
+@torch.no_grad()
+def mean_cos_drop(triplane_transformer, samples):
+    """
+    Mean over the calibration meshes of 1 - cos(point features, fp32 point features).
+    """
+    drops = []
+    for sample in samples:
+        feat = point_features(part_planes(triplane_transformer, sample["feat"]), sample["points"])
+        drops.append(float(1 - cosine(feat, sample["ref"]).mean()))
+    return float(np.mean(drops))
+
+def quantized_copy(triplane_transformer, layers):
+    return quantize_linears(copy.deepcopy(triplane_transformer), layers)
+
+def select_layers(triplane_transformer, samples, max_cos_drop):
+    groups = linear_groups(triplane_transformer)
+    sensitivity = {}
+    for group, layers in groups.items():
+        sensitivity[group] = mean_cos_drop(quantized_copy(triplane_transformer, layers), samples)
+        print(f"{group:28s} cos drop {sensitivity[group]:.2e}")
+
+    selected, drop = [], 0.0
+    for group in sorted(groups, key=sensitivity.get):
+        candidate = selected + groups[group]
+        candidate_drop = mean_cos_drop(quantized_copy(triplane_transformer, candidate), samples)
+        if candidate_drop <= max_cos_drop:
+            selected, drop = candidate, candidate_drop
+    print(f"Selected {len(selected)} of {sum(len(l) for l in groups.values())} layers, cos drop {drop:.2e}")
+    return selected, {"sensitivity": sensitivity, "cos_drop": drop, "max_cos_drop": max_cos_drop}
+
+def kmeans_labels(feat, n_clusters):
+    feat = feat / np.linalg.norm(feat, axis=-1, keepdims=True)
+    return KMeans(n_clusters=n_clusters, random_state=0).fit(feat).labels_
+
+@torch.no_grad()
+def face_features(predictor, planes, vertices, faces):
+    cfg = predictor.cfg
+    torch.manual_seed(0)
+    return mesh_features(planes, vertices, faces, cfg.n_point_per_face, predictor.n_sample_each,
+                         face_sampling=cfg.face_sampling, quadrature_points_per_face=cfg.face_quadrature_points,
+                         adaptive=adaptive_face_kwargs(cfg)).float().cpu().numpy()
+
+def main():
+    parser = default_argument_parser()
+    parser.add_argument("--max_meshes", default=8, type=int)
+    parser.add_argument("--calibration_points", default=10000, type=int, help="encoder points scored per mesh")
+    parser.add_argument("--clusters", nargs="+", type=int, default=[4, 8, 12])
+    parser.add_argument("--output", default="exp_results/quantization/report.json")
+    args = parser.parse_args()
+    cfg = setup(args, freeze=False)
+    cfg.device = "cpu"
+    cfg.quantization.mode = ""
+
+    predictor = PartFieldPredictor(cfg)
+    fp32 = predictor.triplane_transformer
+    dataset = Demo_Dataset(cfg)
+
+    samples = []
+    for index in range(len(dataset)):
+        if len(samples) == args.max_meshes:
+            break
+        item = dataset[index]
+        if 'skipped' in item or 'vertices' not in item:
+            continue
+        vertices = predictor.as_tensor(np.asarray(item['vertices']))
+        faces = predictor.as_tensor(np.asarray(item['faces']), torch.int64)
+        pc = item['pc'].unsqueeze(0) if 'pc' in item else predictor.sample_pc(vertices, faces, item['pc_num_pts'])
+        with torch.no_grad():
+            feat = predictor.pvcnn(pc, pc)
+            ref_planes = part_planes(fp32, feat)
+        points = pc[0, :args.calibration_points]
+        samples.append({"uid": item['uid'], "feat": feat, "points": points, "vertices": vertices, "faces": faces,
+                        "ref_planes": ref_planes, "ref": point_features(ref_planes, points)})
+    assert samples, f"No calibration meshes in {cfg.dataset.data_path}"
+
+    layers, calibration = select_layers(fp32, samples, cfg.quantization.max_cos_drop)
+    int8 = quantized_copy(fp32, layers)
+    path = quantized_path(cfg, cfg.continue_ckpt)
+    save_quantized(path, int8, layers, calibration)
+
+    report = {"layers": layers, "calibration": calibration, "per_mesh": {}}
+    for sample in samples:
+        start = time.time()
+        planes = part_planes(int8, sample["feat"])
+        int8_time = time.time() - start
+        start = time.time()
+        part_planes(fp32, sample["feat"])
+        fp32_time = time.time() - start
+
+        ref = face_features(predictor, sample["ref_planes"], sample["vertices"], sample["faces"])
+        feat = face_features(predictor, planes, sample["vertices"], sample["faces"])
+        cos = cosine(torch.from_numpy(feat), torch.from_numpy(ref)).numpy()
+        miou = {}
+        for k in args.clusters:
+            if k >= len(ref):
+                continue
+            ref_labels, labels = kmeans_labels(ref, k), kmeans_labels(feat, k)
+            miou[k] = float(eval_single_gt_shape(ref_labels, np.array([labels == l for l in np.unique(labels)])))
+        report["per_mesh"][sample["uid"]] = {"cos_mean": float(cos.mean()), "cos_min": float(cos.min()), "miou_vs_fp32": miou,
+                                             "fp32_time": fp32_time, "int8_time": int8_time}
+
+    print()
+    print("%-24s %10s %10s %14s %12s %12s" % ("mesh", "cos mean", "cos min", "mIoU vs fp32", "fp32 [s]", "int8 [s]"))
+    for uid, r in report["per_mesh"].items():
+        miou = np.mean(list(r["miou_vs_fp32"].values())) if r["miou_vs_fp32"] else float("nan")
+        print("%-24s %10.5f %10.5f %14.3f %12.2f %12.2f" % (uid, r["cos_mean"], r["cos_min"], miou, r["fp32_time"], r["int8_time"]))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved report to {args.output}")
+
+if __name__ == "__main__":
+    main()
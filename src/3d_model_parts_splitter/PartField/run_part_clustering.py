@@ -20,6 +20,7 @@ import networkx as nx
 from plyfile import PlyData
 import open3d as o3d
 from partfield.utils import *
+from partfield.mesh_cache import MeshCache, file_digest, mesh_cache_params_from_config
 
 #### Export to file #####
 def export_colored_mesh_ply(V, F, FL, filename='segmented_mesh.ply'):
@@ -88,7 +89,7 @@ def export_pointcloud_with_labels_to_ply(V, VL, filename='colored_pointcloud.ply
 #########################
 
 #########################
-def construct_face_adjacency_matrix_ccmst(face_list, vertices, k=10, with_knn=True):
+def construct_face_adjacency_matrix_ccmst(face_list, vertices, k=10, with_knn=True, edge_pairs=None):
     """
     Given a list of faces (each face is a 3-tuple of vertex indices),
     construct a face-based adjacency matrix of shape (num_faces, num_faces).
@@ -110,6 +111,8 @@ def construct_face_adjacency_matrix_ccmst(face_list, vertices, k=10, with_knn=Tr
         Array of vertex coordinates.
     k : int, optional
         Number of neighbors to use in centroid KNN. Default is 10.
+    edge_pairs : np.ndarray of shape (K, 2), optional
+        Precomputed shared-edge face pairs; skips building them from face_list.
 
     Returns
     -------
@@ -127,39 +130,42 @@ def construct_face_adjacency_matrix_ccmst(face_list, vertices, k=10, with_knn=Tr
     # 1) Build adjacency based on shared edges.
     #    (Same logic as the original code, plus import statements.)
     #--------------------------------------------------------------------------
-    edge_to_faces = defaultdict(list)
     uf = UnionFind(num_faces)
-    for f_idx, (v0, v1, v2) in enumerate(face_list):
-        # Sort each edge’s endpoints so (i, j) == (j, i)
-        edges = [
-            tuple(sorted((v0, v1))),
-            tuple(sorted((v1, v2))),
-            tuple(sorted((v2, v0)))
-        ]
-        for e in edges:
-            edge_to_faces[e].append(f_idx)
-
-    row = []
-    col = []
-    for edge, face_indices in edge_to_faces.items():
-        unique_faces = list(set(face_indices))
-        if len(unique_faces) > 1:
-            # For every pair of distinct faces that share this edge,
-            # mark them as mutually adjacent
-            for i in range(len(unique_faces)):
-                for j in range(i + 1, len(unique_faces)):
-                    fi = unique_faces[i]
-                    fj = unique_faces[j]
-                    row.append(fi)
-                    col.append(fj)
-                    row.append(fj)
-                    col.append(fi)
-                    uf.union(fi, fj)
-
-    data = np.ones(len(row), dtype=np.int8)
-    face_adjacency = coo_matrix(
-        (data, (row, col)), shape=(num_faces, num_faces)
-    ).tocsr()
+    if edge_pairs is not None:
+        face_adjacency = edge_pairs_to_adjacency(edge_pairs, num_faces, uf=uf)
+    else:
+        edge_to_faces = defaultdict(list)
+        for f_idx, (v0, v1, v2) in enumerate(face_list):
+            # Sort each edge’s endpoints so (i, j) == (j, i)
+            edges = [
+                tuple(sorted((v0, v1))),
+                tuple(sorted((v1, v2))),
+                tuple(sorted((v2, v0)))
+            ]
+            for e in edges:
+                edge_to_faces[e].append(f_idx)
+
+        row = []
+        col = []
+        for edge, face_indices in edge_to_faces.items():
+            unique_faces = list(set(face_indices))
+            if len(unique_faces) > 1:
+                # For every pair of distinct faces that share this edge,
+                # mark them as mutually adjacent
+                for i in range(len(unique_faces)):
+                    for j in range(i + 1, len(unique_faces)):
+                        fi = unique_faces[i]
+                        fj = unique_faces[j]
+                        row.append(fi)
+                        col.append(fj)
+                        row.append(fj)
+                        col.append(fi)
+                        uf.union(fi, fj)
+
+        data = np.ones(len(row), dtype=np.int8)
+        face_adjacency = coo_matrix(
+            (data, (row, col)), shape=(num_faces, num_faces)
+        ).tocsr()
 
     #--------------------------------------------------------------------------
     # 2) Check if the graph from shared edges is already connected.
@@ -301,7 +307,7 @@ def construct_face_adjacency_matrix_ccmst(face_list, vertices, k=10, with_knn=Tr
     return face_adjacency
 #########################
 
-def construct_face_adjacency_matrix_facemst(face_list, vertices, k=10, with_knn=True):
+def construct_face_adjacency_matrix_facemst(face_list, vertices, k=10, with_knn=True, edge_pairs=None):
     """
     Given a list of faces (each face is a 3-tuple of vertex indices),
     construct a face-based adjacency matrix of shape (num_faces, num_faces).
@@ -322,6 +328,8 @@ def construct_face_adjacency_matrix_facemst(face_list, vertices, k=10, with_knn=
         Array of vertex coordinates.
     k : int, optional
         Number of neighbors to use in centroid KNN. Default is 10.
+    edge_pairs : np.ndarray of shape (K, 2), optional
+        Precomputed shared-edge face pairs; skips building them from face_list.
 
     Returns
     -------
@@ -339,39 +347,42 @@ def construct_face_adjacency_matrix_facemst(face_list, vertices, k=10, with_knn=
     # 1) Build adjacency based on shared edges.
     #    (Same logic as the original code, plus import statements.)
     #--------------------------------------------------------------------------
-    edge_to_faces = defaultdict(list)
     uf = UnionFind(num_faces)
-    for f_idx, (v0, v1, v2) in enumerate(face_list):
-        # Sort each edge’s endpoints so (i, j) == (j, i)
-        edges = [
-            tuple(sorted((v0, v1))),
-            tuple(sorted((v1, v2))),
-            tuple(sorted((v2, v0)))
-        ]
-        for e in edges:
-            edge_to_faces[e].append(f_idx)
-
-    row = []
-    col = []
-    for edge, face_indices in edge_to_faces.items():
-        unique_faces = list(set(face_indices))
-        if len(unique_faces) > 1:
-            # For every pair of distinct faces that share this edge,
-            # mark them as mutually adjacent
-            for i in range(len(unique_faces)):
-                for j in range(i + 1, len(unique_faces)):
-                    fi = unique_faces[i]
-                    fj = unique_faces[j]
-                    row.append(fi)
-                    col.append(fj)
-                    row.append(fj)
-                    col.append(fi)
-                    uf.union(fi, fj)
-
-    data = np.ones(len(row), dtype=np.int8)
-    face_adjacency = coo_matrix(
-        (data, (row, col)), shape=(num_faces, num_faces)
-    ).tocsr()
+    if edge_pairs is not None:
+        face_adjacency = edge_pairs_to_adjacency(edge_pairs, num_faces, uf=uf)
+    else:
+        edge_to_faces = defaultdict(list)
+        for f_idx, (v0, v1, v2) in enumerate(face_list):
+            # Sort each edge’s endpoints so (i, j) == (j, i)
+            edges = [
+                tuple(sorted((v0, v1))),
+                tuple(sorted((v1, v2))),
+                tuple(sorted((v2, v0)))
+            ]
+            for e in edges:
+                edge_to_faces[e].append(f_idx)
+
+        row = []
+        col = []
+        for edge, face_indices in edge_to_faces.items():
+            unique_faces = list(set(face_indices))
+            if len(unique_faces) > 1:
+                # For every pair of distinct faces that share this edge,
+                # mark them as mutually adjacent
+                for i in range(len(unique_faces)):
+                    for j in range(i + 1, len(unique_faces)):
+                        fi = unique_faces[i]
+                        fj = unique_faces[j]
+                        row.append(fi)
+                        col.append(fj)
+                        row.append(fj)
+                        col.append(fi)
+                        uf.union(fi, fj)
+
+        data = np.ones(len(row), dtype=np.int8)
+        face_adjacency = coo_matrix(
+            (data, (row, col)), shape=(num_faces, num_faces)
+        ).tocsr()
 
     #--------------------------------------------------------------------------
     # 2) Check if the graph from shared edges is already connected.
@@ -469,7 +480,7 @@ def construct_face_adjacency_matrix_facemst(face_list, vertices, k=10, with_knn=
 
     return face_adjacency
 
-def construct_face_adjacency_matrix_naive(face_list):
+def construct_face_adjacency_matrix_naive(face_list, edge_pairs=None):
     """
     Given a list of faces (each face is a 3-tuple of vertex indices),
     construct a face-based adjacency matrix of shape (num_faces, num_faces).
@@ -483,6 +494,8 @@ def construct_face_adjacency_matrix_naive(face_list):
     ----------
     face_list : list of tuples
         List of faces, each face is a tuple (v0, v1, v2) of vertex indices.
+    edge_pairs : np.ndarray of shape (K, 2), optional
+        Precomputed shared-edge face pairs; skips building them from face_list.
 
     Returns
     -------
@@ -497,44 +510,47 @@ def construct_face_adjacency_matrix_naive(face_list):
         # Return an empty matrix if no faces
         return csr_matrix((0, 0))
 
-    # Step 1: Map each undirected edge -> list of face indices that contain that edge
-    edge_to_faces = defaultdict(list)
-
-    # Populate the edge_to_faces dictionary
-    for f_idx, (v0, v1, v2) in enumerate(face_list):
-        # For an edge, we always store its endpoints in sorted order
-        # to avoid duplication (e.g. edge (2,5) is the same as (5,2)).
-        edges = [
-            tuple(sorted((v0, v1))),
-            tuple(sorted((v1, v2))),
-            tuple(sorted((v2, v0)))
-        ]
-        for e in edges:
-            edge_to_faces[e].append(f_idx)
-
-    # Step 2: Build the adjacency (row, col) lists among faces
-    row = []
-    col = []
-    for e, faces_sharing_e in edge_to_faces.items():
-        # If an edge is shared by multiple faces, make each pair of those faces adjacent
-        f_indices = list(set(faces_sharing_e))  # unique face indices for this edge
-        if len(f_indices) > 1:
-            # For each pair of faces, mark them as adjacent
-            for i in range(len(f_indices)):
-                for j in range(i + 1, len(f_indices)):
-                    f_i = f_indices[i]
-                    f_j = f_indices[j]
-                    row.append(f_i)
-                    col.append(f_j)
-                    row.append(f_j)
-                    col.append(f_i)
-
-    # Create a COO matrix, then convert it to CSR
-    data = np.ones(len(row), dtype=np.int8)
-    face_adjacency = coo_matrix(
-        (data, (row, col)),
-        shape=(num_faces, num_faces)
-    ).tocsr()
+    if edge_pairs is not None:
+        face_adjacency = edge_pairs_to_adjacency(edge_pairs, num_faces)
+    else:
+        # Step 1: Map each undirected edge -> list of face indices that contain that edge
+        edge_to_faces = defaultdict(list)
+
+        # Populate the edge_to_faces dictionary
+        for f_idx, (v0, v1, v2) in enumerate(face_list):
+            # For an edge, we always store its endpoints in sorted order
+            # to avoid duplication (e.g. edge (2,5) is the same as (5,2)).
+            edges = [
+                tuple(sorted((v0, v1))),
+                tuple(sorted((v1, v2))),
+                tuple(sorted((v2, v0)))
+            ]
+            for e in edges:
+                edge_to_faces[e].append(f_idx)
+
+        # Step 2: Build the adjacency (row, col) lists among faces
+        row = []
+        col = []
+        for e, faces_sharing_e in edge_to_faces.items():
+            # If an edge is shared by multiple faces, make each pair of those faces adjacent
+            f_indices = list(set(faces_sharing_e))  # unique face indices for this edge
+            if len(f_indices) > 1:
+                # For each pair of faces, mark them as adjacent
+                for i in range(len(f_indices)):
+                    for j in range(i + 1, len(f_indices)):
+                        f_i = f_indices[i]
+                        f_j = f_indices[j]
+                        row.append(f_i)
+                        col.append(f_j)
+                        row.append(f_j)
+                        col.append(f_i)
+
+        # Create a COO matrix, then convert it to CSR
+        data = np.ones(len(row), dtype=np.int8)
+        face_adjacency = coo_matrix(
+            (data, (row, col)),
+            shape=(num_faces, num_faces)
+        ).tocsr()
 
     # Step 3: Ensure single connected component
     # Use connected_components to see how many components exist
@@ -572,6 +588,38 @@ def construct_face_adjacency_matrix_naive(face_list):
 
     return face_adjacency
 
+def edge_pairs_to_adjacency(edge_pairs, num_faces, uf=None):
+    """
+    Build the shared-edge face adjacency from precomputed face pairs
+    (e.g. the face_adjacency stored in the mesh cache).
+
+    Parameters
+    ----------
+    edge_pairs : np.ndarray of shape (K, 2)
+        Pairs of faces sharing an edge.
+    num_faces : int
+        Number of faces.
+    uf : UnionFind, optional
+        If given, every pair is also merged in it.
+
+    Returns
+    -------
+    face_adjacency : scipy.sparse.csr_matrix
+        Symmetric CSR matrix with 1s for adjacent faces.
+    """
+    edge_pairs = np.asarray(edge_pairs, dtype=np.int64).reshape(-1, 2)
+    row = np.concatenate([edge_pairs[:, 0], edge_pairs[:, 1]])
+    col = np.concatenate([edge_pairs[:, 1], edge_pairs[:, 0]])
+    data = np.ones(len(row), dtype=np.int8)
+    face_adjacency = coo_matrix(
+        (data, (row, col)), shape=(num_faces, num_faces)
+    ).tocsr()
+
+    if uf is not None:
+        for fi, fj in edge_pairs:
+            uf.union(fi, fj)
+    return face_adjacency
+
 class UnionFind:
     def __init__(self, n):
         self.parent = list(range(n))
@@ -636,16 +684,9 @@ def load_ply_to_numpy(filename):
     
     return points
 
-def solve_clustering(input_fname, uid, view_id, save_dir="test_results1", out_render_fol= "test_render_clustering", use_agglo=False, max_num_clusters=18, is_pc=False, option=1, with_knn=True, export_mesh=True):
+def solve_clustering(input_fname, uid, view_id, save_dir="test_results1", out_render_fol= "test_render_clustering", use_agglo=False, max_num_clusters=18, is_pc=False, option=1, with_knn=True, export_mesh=True, mesh_cache=None, cache_params=None):
     print(uid, view_id)
     
-    if not is_pc:
-        input_fname = f'{save_dir}/input_{uid}_{view_id}.ply'
-        mesh = load_mesh_util(input_fname)
-
-    else:
-        pc = load_ply_to_numpy(input_fname)
-
     ### Load inferred PartField features
     try:
         point_feat = np.load(f'{save_dir}/part_feat_{uid}_{view_id}.npy')
@@ -659,6 +700,29 @@ def solve_clustering(input_fname, uid, view_id, save_dir="test_results1", out_re
             print(f'{save_dir}/part_feat_{uid}_{view_id}_batch.npy')
             return
 
+    edge_pairs = None
+    if not is_pc:
+        ### Preprocessed mesh written by the dataloader, if caching is enabled. The entry must
+        ### come from the same preprocessing and match the features (a mesh downsampled by the
+        ### memory budget is never cached): otherwise the mesh exported with the features is used.
+        entry = None
+        if mesh_cache is not None and cache_params is not None:
+            entry = mesh_cache.load(file_digest(input_fname), cache_params)
+            if entry is not None and len(entry['faces']) != len(point_feat):
+                print(f"Mesh cache entry of {uid} has {len(entry['faces'])} faces, features have {len(point_feat)} rows: not used")
+                entry = None
+
+        if entry is not None:
+            mesh = trimesh.Trimesh(vertices=entry['vertices'].astype(np.float64),
+                                   faces=entry['faces'].astype(np.int64), process=False)
+            edge_pairs = entry['face_adjacency']
+        else:
+            input_fname = f'{save_dir}/input_{uid}_{view_id}.ply'
+            mesh = load_mesh_util(input_fname)
+
+    else:
+        pc = load_ply_to_numpy(input_fname)
+
     point_feat = point_feat / np.linalg.norm(point_feat, axis=-1, keepdims=True)
 
     if not use_agglo:
@@ -696,11 +760,11 @@ def solve_clustering(input_fname, uid, view_id, save_dir="test_results1", out_re
             exit()
 
         if option == 0:
-            adj_matrix = construct_face_adjacency_matrix_naive(mesh.faces)
+            adj_matrix = construct_face_adjacency_matrix_naive(mesh.faces, edge_pairs=edge_pairs)
         elif option == 1:
-            adj_matrix = construct_face_adjacency_matrix_facemst(mesh.faces, mesh.vertices, with_knn=with_knn)
+            adj_matrix = construct_face_adjacency_matrix_facemst(mesh.faces, mesh.vertices, with_knn=with_knn, edge_pairs=edge_pairs)
         else:
-            adj_matrix = construct_face_adjacency_matrix_ccmst(mesh.faces, mesh.vertices, with_knn=with_knn)
+            adj_matrix = construct_face_adjacency_matrix_ccmst(mesh.faces, mesh.vertices, with_knn=with_knn, edge_pairs=edge_pairs)
 
         clustering = AgglomerativeClustering(connectivity=adj_matrix,
                                     n_clusters=1,
@@ -749,6 +813,10 @@ if __name__ == '__main__':
     parser.add_argument('--with_knn', default= False, type=bool)
 
     parser.add_argument('--export_mesh', default= True, type=bool)
+    parser.add_argument('--mesh_cache_dir', default= "", type=str)
+    ### inference config (partfield_inference.py -c / --opts): cache entries must match its preprocessing
+    parser.add_argument('--config_file', default= "", type=str)
+    parser.add_argument('--opts', default=[], nargs=argparse.REMAINDER)
 
     FLAGS = parser.parse_args()
     root = FLAGS.root
@@ -763,6 +831,11 @@ if __name__ == '__main__':
     WITH_KNN = FLAGS.with_knn
 
     EXPORT_MESH = FLAGS.export_mesh
+    MESH_CACHE = MeshCache(FLAGS.mesh_cache_dir) if FLAGS.mesh_cache_dir else None
+    CACHE_PARAMS = None
+    if MESH_CACHE is not None:
+        assert FLAGS.config_file, "--mesh_cache_dir needs the inference --config_file (and --opts) to match cache entries"
+        CACHE_PARAMS = mesh_cache_params_from_config(FLAGS.config_file, FLAGS.opts)
 
     models = os.listdir(root)
     os.makedirs(OUTPUT_FOL, exist_ok=True)
@@ -803,4 +876,4 @@ if __name__ == '__main__':
         uid = model.split(".")[-2]
         view_id = 0
 
-        solve_clustering(fname, uid, view_id, save_dir=root, out_render_fol= OUTPUT_FOL, use_agglo=USE_AGGLO, max_num_clusters=MAX_NUM_CLUSTERS, is_pc=IS_PC, option=OPTION, with_knn=WITH_KNN, export_mesh=EXPORT_MESH)
+        solve_clustering(fname, uid, view_id, save_dir=root, out_render_fol= OUTPUT_FOL, use_agglo=USE_AGGLO, max_num_clusters=MAX_NUM_CLUSTERS, is_pc=IS_PC, option=OPTION, with_knn=WITH_KNN, export_mesh=EXPORT_MESH, mesh_cache=MESH_CACHE, cache_params=CACHE_PARAMS)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+import torch
+
+### the tests import partfield like the scripts do, from the PartField directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def small_encoder_stack():
+    """
+    (pvcnn, triplane_transformer) of the inference architecture at a fraction of its width
+    and resolution: 16-channel 32 x 32 encoder planes, 72-channel output planes (64 sdf + 8 part).
+    """
+    from partfield.config.defaults import _C
+    from partfield.model.triplane import TriplaneTransformer
+    from partfield.predictor import build_pvcnn
+
+    cfg = _C.clone()
+    cfg.pvcnn.z_triplane_channels = 16
+    cfg.pvcnn.z_triplane_resolution = 32
+    torch.manual_seed(0)
+    pvcnn = build_pvcnn(cfg).eval()
+    triplane_transformer = TriplaneTransformer(input_dim=16, transformer_dim=32, transformer_layers=1,
+                                               transformer_heads=4, triplane_low_res=8, triplane_high_res=32,
+                                               triplane_dim=72).eval()
+    return pvcnn, triplane_transformer
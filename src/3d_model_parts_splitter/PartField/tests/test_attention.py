@@ -0,0 +1,44 @@
+import pytest
+import torch
+import torch.nn as nn
+
+from partfield.model.attention import SDPAttention, build_attention
+from partfield.model.triplane import TriplaneTransformer
+
+def mha_and_sdpa(build):
+    torch.manual_seed(0)
+    mha = build("mha")
+    sdpa = build("sdpa")
+    ### same parameter names and layouts: mha checkpoints load as they are
+    sdpa.load_state_dict(mha.state_dict())
+    return mha, sdpa
+
+@pytest.mark.parametrize("kdim", [None, 12])
+def test_sdpa_matches_multihead_attention(kdim):
+    mha, sdpa = mha_and_sdpa(lambda a: build_attention(a, 32, 4, kdim=kdim, vdim=kdim, batch_first=True))
+    torch.manual_seed(1)
+    x = torch.randn(2, 20, 32, requires_grad=True)
+    cond = torch.randn(2, 7, kdim or 32)
+    key = x if kdim is None else cond
+    ### training mode with grad: nn.MultiheadAttention takes its reference (non-fused) path
+    ref, _ = mha(x, key, key, need_weights=False)
+    out, _ = sdpa(x, key, key)
+    assert torch.allclose(out, ref, atol=1e-5)
+    ref_grad, = torch.autograd.grad(ref.sum(), x)
+    out_grad, = torch.autograd.grad(out.sum(), x)
+    assert torch.allclose(out_grad, ref_grad, atol=1e-5)
+
+def test_sdpa_triplane_transformer_matches_mha():
+    mha, sdpa = mha_and_sdpa(lambda a: TriplaneTransformer(input_dim=16, transformer_dim=32, transformer_layers=2,
+                                                           transformer_heads=4, triplane_low_res=8,
+                                                           triplane_high_res=32, triplane_dim=12, attention=a))
+    assert any(isinstance(m, SDPAttention) for m in sdpa.modules())
+    assert not any(isinstance(m, nn.MultiheadAttention) for m in sdpa.modules())
+    torch.manual_seed(1)
+    triplanes = torch.randn(1, 3, 16, 32, 32)
+    with torch.no_grad():
+        assert torch.allclose(sdpa.eval()(triplanes), mha.eval()(triplanes), atol=1e-5)
+
+def test_unknown_attention_backend():
+    with pytest.raises(ValueError):
+        build_attention("flash", 32, 4)
@@ -0,0 +1,109 @@
+import pytest
+import torch
+
+from partfield.config.defaults import _C
+from partfield.memory_budget import MB
+from partfield import dataloader
+from partfield.dataloader import (Correspondence_Demo_Dataset, Demo_Remesh_Dataset, collate_meshes, encode_point_clouds,
+                                  inference_num_workers, stack_point_clouds)
+
+def encode_mean(pc):
+    """
+    Stand-in encoder: (B, N, 3) -> (B, 3) mean point, sensitive to every point of a cloud.
+    """
+    return pc.mean(dim=1)
+
+def test_collate_keeps_full_point_clouds():
+    pcs = [torch.rand(100, 3), torch.rand(60, 3)]
+    batch = collate_meshes([{'uid': 'a', 'pc': pcs[0], 'pc_num_pts': 100},
+                            {'uid': 'b', 'pc': pcs[1], 'pc_num_pts': 60},
+                            {'uid': 'c', 'skipped': True}])
+    assert batch['uid'] == ['a', 'b'] and batch['skipped_uids'] == ['c']
+    assert [len(pc) for pc in batch['pc']] == [100, 60]
+    assert torch.equal(batch['pc'][1], pcs[1])
+    assert batch['pc_num_pts'].tolist() == [100, 60]
+
+def test_encode_point_clouds_of_different_sizes():
+    torch.manual_seed(0)
+    pcs = [torch.rand(100, 3), torch.rand(60, 3), torch.rand(100, 3)]
+    calls = []
+    def encode(pc):
+        calls.append(tuple(pc.shape))
+        return encode_mean(pc)
+    planes = encode_point_clouds(encode, pcs)
+    ### every cloud is encoded with all of its points, in input order
+    expected = torch.stack([pc.mean(dim=0) for pc in pcs])
+    assert torch.allclose(planes, expected)
+    ### clouds of the same size share one encoder call
+    assert sorted(calls) == [(1, 60, 3), (2, 100, 3)]
+
+def test_encode_point_clouds_fixed_size_is_one_stack():
+    pcs = [torch.rand(50, 3) for _ in range(3)]
+    calls = []
+    planes = encode_point_clouds(lambda pc: calls.append(pc.shape) or encode_mean(pc), pcs)
+    assert len(calls) == 1
+    assert torch.allclose(planes, encode_mean(stack_point_clouds(pcs)))
+
+def test_stack_point_clouds_rejects_different_sizes():
+    with pytest.raises(AssertionError):
+        stack_point_clouds([torch.rand(10, 3), torch.rand(9, 3)])
+
+def test_correspondence_dataset_uses_listed_files(tmp_path):
+    for name in ["a.obj", "b.obj", "c.obj"]:
+        (tmp_path / name).write_text("")
+    cfg = _C.clone()
+    cfg.dataset.data_path = str(tmp_path)
+    cfg.dataset.all_files = ["b.obj", "a.obj"]
+    cfg.pc_num_pts = 1234
+    dataset = Correspondence_Demo_Dataset(cfg)
+    assert dataset.data_list == ["b.obj", "a.obj"]
+    ### loading settings come from MeshLoader
+    assert dataset.pc_num_pts == 1234 and dataset.memory_budget is not None
+
+def test_remesh_dataset_shares_the_loading_settings(tmp_path):
+    for name in ["a.obj", "b.glb", "c.off"]:
+        (tmp_path / name).write_text("")
+    cfg = _C.clone()
+    cfg.dataset.data_path = str(tmp_path)
+    cfg.pc_num_pts = 1234
+    cfg.adaptive_pc.enabled = True
+    cfg.memory_budget.remesh_extra_mb = 7
+    dataset = Demo_Remesh_Dataset(cfg)
+    assert sorted(dataset.data_list) == ["a.obj", "b.glb"]
+    assert dataset.pc_num_pts == 1234 and dataset.point_policy is not None
+    ### the remesh grids are added to every item's memory estimate
+    assert dataset.memory_budget.extra == 7 * MB
+
+def test_inference_num_workers(monkeypatch):
+    monkeypatch.setattr(dataloader, "usable_cpus", lambda: 4)
+    assert inference_num_workers(8, list(range(100))) == 4
+    assert inference_num_workers(2, list(range(100))) == 2
+    assert inference_num_workers(8, list(range(3))) == 3
+    ### a single item is loaded in-process
+    assert inference_num_workers(8, [0]) == 0
+
+    class Unsized(torch.utils.data.IterableDataset):
+        def __iter__(self):
+            return iter([])
+    assert inference_num_workers(8, Unsized()) == 4
+
+def test_remesh_item_point_cloud(tmp_path, monkeypatch):
+    import trimesh
+    from partfield.surface_sampler import sample_surface_points
+
+    trimesh.creation.icosphere(2).export(str(tmp_path / "ball.obj"))
+    cfg = _C.clone()
+    cfg.dataset.data_path = str(tmp_path)
+    cfg.adaptive_pc.enabled = True
+    ### tetgen takes seconds even on a coarse grid; any new surface shows where the points come from
+    monkeypatch.setattr(dataloader, "remesh", lambda vertices, faces, **kwargs: trimesh.Trimesh(vertices, faces).subdivide())
+    monkeypatch.chdir(tmp_path)
+    dataset = Demo_Remesh_Dataset(cfg)
+    item = dataset[0]
+
+    ### same point count and seeded samples as the other datasets, on the remeshed surface
+    mesh = trimesh.Trimesh(item['vertices'], item['faces'], process=False)
+    assert len(mesh.faces) == 4 * 320
+    assert item['pc_num_pts'] == dataset.point_policy.choose(mesh.area, len(mesh.faces))
+    expected = sample_surface_points(mesh.vertices, mesh.faces, item['pc_num_pts'], seed=cfg.seed)
+    assert torch.equal(item['pc'], torch.tensor(expected, dtype=torch.float32))
@@ -0,0 +1,63 @@
+import os
+from types import SimpleNamespace
+
+import torch
+
+from partfield import device as device_module
+from partfield.config.defaults import _C
+from partfield.device import (configure_cpu_threads, free_memory, physical_cores, resolve_device,
+                              sample_chunk_size)
+from partfield.face_features import readout_chunk_size
+
+def test_resolve_device_falls_back_to_cpu(monkeypatch):
+    cfg = _C.clone()
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: False)
+    assert resolve_device(cfg) == torch.device("cpu")
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+    assert resolve_device(cfg) == torch.device("cuda")
+    ### an explicit device is used as is
+    cfg.device = "cpu"
+    assert resolve_device(cfg) == torch.device("cpu")
+
+def test_physical_cores_scale_with_affinity(monkeypatch):
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    monkeypatch.setattr(device_module.psutil, "cpu_count", lambda logical=True: 32 if logical else 16)
+    ### 8 of 32 hyper-threads -> 4 of 16 cores
+    assert physical_cores() == 4
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: {0}, raising=False)
+    assert physical_cores() == 1
+
+def test_sample_chunk_size_per_device(monkeypatch):
+    cfg = _C.clone()
+    cfg.n_sample_each = 0
+    cfg.cpu.n_sample_each = 20000
+    assert sample_chunk_size(cfg, "cpu") == 20000
+    assert sample_chunk_size(cfg, "cuda") == 0
+    cfg.cpu.n_sample_each = 0
+    assert sample_chunk_size(cfg, "cpu") == 0
+
+    ### 0: the readout chunk scales with the free host memory, clamped to [1, n_points]
+    planes = torch.zeros(1, 3, 8, 4, 4)
+    monkeypatch.setattr(device_module.psutil, "virtual_memory", lambda: SimpleNamespace(available=208 * 4000))
+    assert free_memory("cpu") == 208 * 4000
+    assert readout_chunk_size(planes, 10 ** 6, sample_chunk_size(cfg, "cpu")) == 1000
+    monkeypatch.setattr(device_module.psutil, "virtual_memory", lambda: SimpleNamespace(available=208 * 8000))
+    assert readout_chunk_size(planes, 10 ** 6, sample_chunk_size(cfg, "cpu")) == 2000
+    assert readout_chunk_size(planes, 300, sample_chunk_size(cfg, "cpu")) == 300
+    monkeypatch.setattr(device_module.psutil, "virtual_memory", lambda: SimpleNamespace(available=0))
+    assert readout_chunk_size(planes, 300, sample_chunk_size(cfg, "cpu")) == 1
+
+def test_configure_cpu_threads(monkeypatch):
+    num_threads = torch.get_num_threads()
+    try:
+        cfg = _C.clone()
+        cfg.cpu.num_threads = 3
+        intra, interop = configure_cpu_threads(cfg)
+        assert intra == torch.get_num_threads() == 3
+        assert interop == torch.get_num_interop_threads()
+        ### 0: one thread per physical core available
+        monkeypatch.setattr(device_module, "physical_cores", lambda: 2)
+        cfg.cpu.num_threads = 0
+        assert configure_cpu_threads(cfg)[0] == torch.get_num_threads() == 2
+    finally:
+        torch.set_num_threads(num_threads)
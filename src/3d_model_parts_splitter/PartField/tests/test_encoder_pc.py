@@ -0,0 +1,42 @@
+import pytest
+import torch
+
+from partfield.model.PVCNN.encoder_pc import generate_plane_features, normalize_coordinate, scatter_mean
+
+def normalize_coordinate_baseline(p, padding=0.1, plane='xz'):
+    ### the version with data-dependent branches
+    xy = p[:, :, {'xz': [0, 2], 'xy': [0, 1]}.get(plane, [1, 2])]
+    xy_new = xy / (1 + padding + 10e-6)
+    xy_new = xy_new + 0.5
+    if xy_new.max() >= 1:
+        xy_new[xy_new >= 1] = 1 - 10e-6
+    if xy_new.min() < 0:
+        xy_new[xy_new < 0] = 0.0
+    return xy_new
+
+@pytest.mark.parametrize("plane", ['xz', 'xy', 'yz'])
+def test_normalize_coordinate_matches_baseline(plane):
+    torch.manual_seed(0)
+    ### outliers on both sides
+    p = torch.rand(2, 1000, 3) * 1.4 - 0.7
+    assert torch.equal(normalize_coordinate(p.clone(), padding=0., plane=plane),
+                       normalize_coordinate_baseline(p.clone(), padding=0., plane=plane))
+
+def test_scatter_mean_matches_torch_scatter():
+    torch_scatter = pytest.importorskip("torch_scatter")
+    torch.manual_seed(0)
+    src = torch.randn(2, 8, 3000)
+    ### 64 cells, some left empty
+    index = torch.randint(0, 48, (2, 1, 3000))
+    ref = torch_scatter.scatter_mean(src, index, out=src.new_zeros(2, 8, 64))
+    out = scatter_mean(src, index, 64)
+    assert torch.allclose(out, ref, atol=1e-6)
+    assert torch.equal(out[..., 48:], torch.zeros(2, 8, 16))
+
+def test_generate_plane_features_traces_without_graph_breaks():
+    torch.manual_seed(0)
+    ### (B, n_p, 3) points, some outside the unit cube
+    p = torch.rand(1, 500, 3) * 2.4 - 1.2
+    c = torch.randn(1, 4, 500)
+    compiled = torch.compile(generate_plane_features, backend="aot_eager", fullgraph=True)
+    assert torch.equal(compiled(p, c, 16), generate_plane_features(p, c, 16))
@@ -0,0 +1,113 @@
+import math
+
+import pytest
+import torch
+import trimesh
+
+from partfield import face_features
+from partfield.face_features import (face_sample_counts, mesh_features, point_features, quadrature_rule,
+                                     readout_chunk_size, sample_and_segment_mean)
+
+def random_planes(res=16, channels=8, seed=0):
+    torch.manual_seed(seed)
+    return torch.randn(1, 3, channels, res, res)
+
+def linear_planes(res=16):
+    ### bilinear interpolation of a linear ramp is exact: the feature is linear in the point
+    u = torch.linspace(-1, 1, res)
+    ramp = torch.stack([u[None, :].expand(res, res), u[:, None].expand(res, res), 0.5 * u[None, :] - u[:, None]])
+    return ramp[None, None].expand(1, 3, 3, res, res).clone()
+
+def sphere(subdivisions=3):
+    mesh = trimesh.creation.icosphere(subdivisions, radius=0.9)
+    return torch.tensor(mesh.vertices, dtype=torch.float32), torch.tensor(mesh.faces)
+
+@pytest.mark.parametrize("n_points, degree", [(1, 1), (3, 2), (7, 5), (12, 6)])
+def test_quadrature_rule_exact_up_to_its_degree(n_points, degree):
+    bary, weights = quadrature_rule(n_points, dtype=torch.float64)
+    assert bary.shape == (n_points, 3) and torch.allclose(bary.sum(1), torch.ones(n_points, dtype=torch.float64))
+    for i in range(degree + 1):
+        for j in range(degree + 1 - i):
+            ### mean of b1^i b2^j over the triangle
+            exact = 2 * math.factorial(i) * math.factorial(j) / math.factorial(i + j + 2)
+            value = (weights.double() * bary[:, 1] ** i * bary[:, 2] ** j).sum()
+            ### weights are float32
+            assert abs(float(value) - exact) < 1e-7, (i, j)
+
+def test_quadrature_face_mean_of_linear_field():
+    planes = linear_planes()
+    vertices, faces = sphere(2)
+    centroid_feat = point_features(planes, vertices[faces].mean(1))
+    for n_points in [1, 3, 7, 12]:
+        feat = mesh_features(planes, vertices, faces, 0, 0, face_sampling="quadrature", quadrature_points_per_face=n_points)
+        assert torch.allclose(feat, centroid_feat, atol=1e-5)
+
+def test_quadrature_beats_random_sampling():
+    planes = random_planes(channels=4)
+    vertices, faces = sphere(2)
+    torch.manual_seed(1)
+    dense = mesh_features(planes, vertices, faces, 10000, 0, face_sampling="random")
+    torch.manual_seed(2)
+    sampled = mesh_features(planes, vertices, faces, 1000, 0, face_sampling="random")
+    quad = mesh_features(planes, vertices, faces, 0, 0, face_sampling="quadrature", quadrature_points_per_face=12)
+    rms = lambda feat: float((feat - dense).pow(2).mean().sqrt())
+    ### 12 points per face are closer to the dense face mean than the 1000 random ones
+    assert rms(quad) < rms(sampled)
+
+def test_face_sample_counts_follow_projected_area():
+    vertices = torch.tensor([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1e-4], [1e-4, 0, 1e-4]], dtype=torch.float32)
+    faces = torch.tensor([[0, 1, 2], [0, 3, 4]])
+    ### plane_res 9: texel area (2 / 8)^2, the xy projection of face 0 covers 8 texels
+    counts = face_sample_counts(vertices, faces, 9, points_per_texel=4.0, min_points=4, max_points=1000)
+    assert counts.tolist() == [32, 4]
+    assert face_sample_counts(vertices, faces, 9, max_points=10).tolist() == [10, 4]
+
+def test_adaptive_with_fixed_counts_matches_random():
+    ### same draws in the same order: the segment mean is the per-face mean of the baseline
+    planes = random_planes(channels=4)
+    vertices, faces = sphere(2)
+    torch.manual_seed(3)
+    reference = mesh_features(planes, vertices, faces, 16, 0, face_sampling="random")
+    torch.manual_seed(3)
+    adaptive = mesh_features(planes, vertices, faces, 0, 0, face_sampling="adaptive",
+                             adaptive=dict(min_points=16, max_points=16))
+    assert torch.allclose(adaptive, reference, atol=1e-5)
+
+def test_segment_mean_over_chunks(monkeypatch):
+    ### deterministic points: the k-th point of a face at a fixed barycentric coordinate
+    def fixed_points(vertices, faces, counts):
+        face_index = torch.repeat_interleave(torch.arange(len(faces)), counts)
+        k = torch.cat([torch.arange(int(c)) for c in counts]).float()[:, None]
+        w = torch.cat([torch.cos(k) ** 2, torch.sin(k) ** 2 * 0.5, torch.sin(k) ** 2 * 0.5], dim=1)
+        return torch.einsum('nk,nkd->nd', w, vertices[faces[face_index]]), face_index
+    monkeypatch.setattr(face_features, "sample_points_ragged", fixed_points)
+
+    planes = random_planes(channels=4)
+    vertices, faces = sphere(1)
+    counts = torch.randint(1, 20, (len(faces),))
+    expected = torch.stack([point_features(planes, fixed_points(vertices, faces[f:f + 1], counts[f:f + 1])[0]).mean(0)
+                            for f in range(len(faces))])
+    for n_sample_each in [1, 37, 10 ** 6]:
+        out = sample_and_segment_mean(planes, vertices, faces, counts, n_sample_each)
+        assert torch.allclose(out, expected, atol=1e-5), n_sample_each
+
+def test_readout_chunk_size(monkeypatch):
+    planes = random_planes(channels=8)
+    assert readout_chunk_size(planes, 10 ** 6, n_sample_each=1000) == 1000
+    ### automatic: a quarter of the free memory over the bytes per query (5 * 8 * 4 + 48 = 208)
+    monkeypatch.setattr(face_features, "free_memory", lambda device: 208 * 4000)
+    assert readout_chunk_size(planes, 10 ** 6) == 1000
+    assert readout_chunk_size(planes, 300) == 300
+    monkeypatch.setattr(face_features, "free_memory", lambda device: 0)
+    assert readout_chunk_size(planes, 300) == 1
+
+@pytest.mark.parametrize("n_sample_each", [1, 50, 0])
+def test_chunked_readout_matches_one_shot(n_sample_each):
+    planes = random_planes(channels=4)
+    vertices, faces = sphere(2)
+    for kwargs in [dict(face_sampling="quadrature", quadrature_points_per_face=7), dict(vertex_feature=True)]:
+        one_shot = mesh_features(planes, vertices, faces, 0, 10 ** 7, **kwargs)
+        chunked = mesh_features(planes, vertices, faces, 0, n_sample_each, **kwargs)
+        assert torch.allclose(chunked, one_shot, atol=1e-6), kwargs
+    assert torch.equal(mesh_features(planes, vertices, faces, 0, n_sample_each, vertex_feature=True),
+                       point_features(planes, vertices))
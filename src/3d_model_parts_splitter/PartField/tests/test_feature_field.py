@@ -0,0 +1,53 @@
+import numpy as np
+import torch
+import trimesh
+
+from partfield.config.defaults import _C
+from partfield.dataloader import Demo_Dataset
+from partfield.face_features import mesh_features, point_features
+from partfield.feature_field import TriplaneFeatureField, save_part_planes
+
+def test_saved_planes_match_direct_readout(tmp_path):
+    torch.manual_seed(0)
+    part_planes = torch.randn(1, 3, 6, 16, 16)
+    save_part_planes(str(tmp_path), "chair", part_planes)
+    field = TriplaneFeatureField.load_item(str(tmp_path), "chair", device="cpu")
+    ### the planes are stored as fp16
+    planes = part_planes.half().float()
+    assert torch.equal(field.part_planes, planes)
+
+    mesh = trimesh.creation.icosphere(2, radius=0.9)
+    vertices = torch.tensor(mesh.vertices, dtype=torch.float32)
+    faces = torch.tensor(mesh.faces)
+    points = torch.rand(100, 3) * 2 - 1
+    np.testing.assert_allclose(field.points(points.numpy()), point_features(planes, points).numpy(), atol=1e-6)
+    np.testing.assert_allclose(field.vertices(mesh.vertices), point_features(planes, vertices).numpy(), atol=1e-6)
+    quad = dict(face_sampling="quadrature", quadrature_points_per_face=7)
+    np.testing.assert_allclose(field.faces(mesh.vertices, mesh.faces, **quad),
+                               mesh_features(planes, vertices, faces, 0, 0, **quad).numpy(), atol=1e-6)
+    ### fp16 storage stays close to the fp32 field
+    np.testing.assert_allclose(field.points(points.numpy()), point_features(part_planes, points).numpy(), atol=1e-2)
+
+def test_faces_with_cfg_uses_the_readout_settings(tmp_path):
+    torch.manual_seed(0)
+    field = TriplaneFeatureField(torch.randn(3, 4, 8, 8), device="cpu")
+    mesh = trimesh.creation.icosphere(1, radius=0.9)
+    cfg = _C.clone()
+    cfg.face_sampling = "quadrature"
+    cfg.face_quadrature_points = 3
+    np.testing.assert_array_equal(field.faces(mesh.vertices, mesh.faces, cfg=cfg),
+                                  field.faces(mesh.vertices, mesh.faces, face_sampling="quadrature",
+                                              quadrature_points_per_face=3))
+
+def test_normalize_matches_the_dataset(tmp_path, monkeypatch):
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    mesh = trimesh.creation.box(extents=(2.0, 0.5, 1.0))
+    mesh.apply_translation((3.0, -1.0, 0.25))
+    mesh.export(data_path / "box.obj")
+    monkeypatch.chdir(tmp_path)
+    cfg = _C.clone()
+    cfg.dataset.data_path = str(data_path)
+    cfg.pc_num_pts = 1000
+    item = Demo_Dataset(cfg)[0]
+    np.testing.assert_allclose(TriplaneFeatureField.normalize(mesh.vertices), item['vertices'], atol=1e-6)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import trimesh
+
+from partfield.memory_budget import MB, MemoryBudget, MemoryBudgetExceeded, cluster_decimate
+
+def test_cluster_decimate_reaches_target_on_the_surface():
+    sphere = trimesh.creation.icosphere(5)
+    vertices, faces = cluster_decimate(np.asarray(sphere.vertices), np.asarray(sphere.faces), 2000)
+    assert 500 < len(faces) <= 2000
+    assert faces.min() >= 0 and faces.max() == len(vertices) - 1
+    ### cluster means of a unit sphere stay close to it
+    np.testing.assert_allclose(np.linalg.norm(vertices, axis=1), 1.0, atol=0.02)
+
+def fixed_budget(monkeypatch, rss_mb, **kwargs):
+    budget = MemoryBudget(stats_path=None, **kwargs)
+    monkeypatch.setattr(budget, "rss", lambda: rss_mb * MB)
+    return budget
+
+def test_no_ceiling_keeps_the_mesh(monkeypatch):
+    ### the baseline: every item is processed as loaded
+    budget = fixed_budget(monkeypatch, 100)
+    mesh = trimesh.creation.icosphere(4)
+    faces = mesh.faces.copy()
+    assert budget.fit_mesh(mesh, {"uid": "a"}) is mesh
+    assert np.array_equal(mesh.faces, faces)
+
+def test_ceiling_downsamples_or_rejects(monkeypatch):
+    mesh = trimesh.creation.icosphere(5)  # 20480 faces, 10 MB at 512 bytes per face
+    budget = fixed_budget(monkeypatch, 95, ceiling_mb=100)
+    stats = {"uid": "a"}
+    mesh = budget.fit_mesh(mesh, stats)
+    ### 5 MB of headroom hold 10240 faces
+    assert stats["action"] == "downsampled" and len(mesh.faces) <= 10240
+
+    budget = fixed_budget(monkeypatch, 95, ceiling_mb=100, action="reject")
+    with pytest.raises(MemoryBudgetExceeded) as e:
+        budget.fit_mesh(trimesh.creation.icosphere(5), {"uid": "b", "start": 0.0})
+    assert e.value.uid == "b"
+
+def test_garbage_is_collected_only_near_the_limit(monkeypatch):
+    budget = fixed_budget(monkeypatch, 50, ceiling_mb=100, gc_fraction=0.75)
+    stats = {}
+    budget.ensure_room(10 * MB, stats)
+    assert "gc_runs" not in stats
+    budget.ensure_room(30 * MB, stats)
+    assert stats["gc_runs"] == 1
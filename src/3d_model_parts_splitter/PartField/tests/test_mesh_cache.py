@@ -0,0 +1,100 @@
+import argparse
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import trimesh
+
+from partfield.config import setup
+from partfield.config.defaults import _C
+from partfield.dataloader import Demo_Dataset
+from partfield.mesh_cache import MeshCache, face_edge_adjacency, mesh_cache_params, mesh_cache_params_from_config
+
+PARTFIELD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMO_CONFIG = os.path.join(PARTFIELD_DIR, "configs/final/demo.yaml")
+
+def demo_cfg(data_path, cache_dir, **opts):
+    cfg = _C.clone()
+    cfg.dataset.data_path = str(data_path)
+    cfg.mesh_cache_dir = str(cache_dir)
+    cfg.result_name = "cache_test"
+    cfg.pc_num_pts = 2000
+    cfg.preprocess_mesh = True
+    for key, value in opts.items():
+        setattr(cfg, key, value)
+    return cfg
+
+def test_cache_roundtrip_keeps_float64_vertices(tmp_path):
+    cache = MeshCache(str(tmp_path))
+    mesh = trimesh.creation.icosphere(2)
+    vertices = mesh.vertices * (1 + 1e-9)
+    cache.save("key", vertices, mesh.faces, np.zeros((0, 3)), {"a": 1})
+    entry = cache.load("key", {"a": 1})
+    assert entry['vertices'].dtype == np.float64
+    assert np.array_equal(entry['vertices'], vertices)
+    assert np.array_equal(entry['face_adjacency'], face_edge_adjacency(mesh.faces))
+
+def test_cache_params_must_match(tmp_path):
+    cache = MeshCache(str(tmp_path))
+    mesh = trimesh.creation.box()
+    params = mesh_cache_params(_C)
+    cache.save("key", mesh.vertices, mesh.faces, np.zeros((0, 3)), params)
+    assert cache.load("key", params) is not None
+
+    cfg = _C.clone()
+    cfg.mesh_cleanup = "pymeshlab"
+    assert cache.load("key", mesh_cache_params(cfg)) is None
+
+def test_dataset_cache_hit_matches_miss_and_exports_input(tmp_path, monkeypatch):
+    data_path, cache_dir = tmp_path / "data", tmp_path / "cache"
+    data_path.mkdir()
+    trimesh.creation.icosphere(2).export(data_path / "sphere.obj")
+    monkeypatch.chdir(tmp_path)
+    input_ply = "exp_results/cache_test/input_sphere_0.ply"
+
+    dataset = Demo_Dataset(demo_cfg(data_path, cache_dir))
+    miss = dataset[0]
+    assert os.path.exists(input_ply) and len(os.listdir(cache_dir)) == 1
+    os.remove(input_ply)
+
+    hit = Demo_Dataset(demo_cfg(data_path, cache_dir))[0]
+    ### the input mesh is exported on a cache hit too, and is the same mesh
+    assert os.path.exists(input_ply)
+    assert np.array_equal(hit['vertices'], miss['vertices'])
+    assert np.array_equal(hit['faces'], miss['faces'])
+    assert np.array_equal(hit['pc'].numpy(), miss['pc'].numpy())
+
+def test_cache_params_from_config_match_inference(tmp_path):
+    opts = ["dataset.data_path", str(tmp_path), "preprocess_mesh", "True", "pc_num_pts", "2000",
+            "mesh_cache_dir", str(tmp_path / "cache")]
+    ### the cfg partfield_inference.py builds from -c DEMO_CONFIG --opts <opts>
+    cfg = setup(argparse.Namespace(config_file=DEMO_CONFIG, opts=opts), freeze=False)
+    assert mesh_cache_params_from_config(DEMO_CONFIG, opts) == Demo_Dataset(cfg).cache_params
+    ### no --opts
+    assert mesh_cache_params_from_config(DEMO_CONFIG)["preprocess_mesh"] is False
+
+def test_clustering_cli_reads_the_mesh_cache(tmp_path, monkeypatch):
+    for module in ["matplotlib", "open3d", "networkx"]:
+        pytest.importorskip(module)
+    data_path, cache_dir, dump_dir = tmp_path / "data", tmp_path / "cache", tmp_path / "clustering"
+    data_path.mkdir()
+    trimesh.creation.icosphere(2).export(data_path / "sphere.obj")
+    opts = ["dataset.data_path", str(data_path), "preprocess_mesh", "True", "pc_num_pts", "2000",
+            "mesh_cache_dir", str(cache_dir), "result_name", "cli_test"]
+
+    ### inference side: the dataset writes the cache entry, features have one row per face
+    monkeypatch.chdir(tmp_path)
+    item = Demo_Dataset(setup(argparse.Namespace(config_file=DEMO_CONFIG, opts=opts), freeze=False))[0]
+    feat_dir = tmp_path / "exp_results" / "cli_test"
+    np.save(feat_dir / "part_feat_sphere_0_batch.npy", np.random.default_rng(0).normal(size=(len(item['faces']), 8)))
+    ### a hit must not need the exported mesh
+    os.remove(feat_dir / "input_sphere_0.ply")
+
+    subprocess.run([sys.executable, os.path.join(PARTFIELD_DIR, "run_part_clustering.py"),
+                    "--root", str(feat_dir), "--dump_dir", str(dump_dir), "--source_dir", str(data_path),
+                    "--max_num_clusters", "4", "--mesh_cache_dir", str(cache_dir),
+                    "--config_file", DEMO_CONFIG, "--opts"] + opts,
+                   check=True, cwd=PARTFIELD_DIR)
+    assert len(os.listdir(dump_dir / "cluster_out")) == 2
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import trimesh
+
+from partfield.mesh_cleanup import clean_mesh, clean_mesh_pymeshlab, merge_close_vertices
+
+def canonical_faces(faces):
+    ### rotate each face to start at its smallest index (keeps the winding), then sort the rows
+    faces = np.asarray(faces, dtype=np.int64)
+    first = faces.argmin(axis=1)
+    rolled = faces[np.arange(len(faces))[:, None], (first[:, None] + np.arange(3)) % 3]
+    return rolled[np.lexsort(rolled.T[::-1])]
+
+def dirty_sphere(flipped=True):
+    ### unwelded icosphere, near-duplicate vertices, duplicate (and flipped) faces and unreferenced vertices
+    rng = np.random.default_rng(0)
+    sphere = trimesh.creation.icosphere(3)
+    vertices = sphere.vertices[sphere.faces.reshape(-1)]
+    faces = np.arange(len(vertices)).reshape(-1, 3)
+    vertices = vertices + rng.normal(scale=1e-5, size=vertices.shape) * (rng.random((len(vertices), 1)) < 0.3)
+    faces = np.concatenate([faces, faces[:50][:, ::-1] if flipped else faces[:0], faces[10:20]])
+    vertices = np.concatenate([vertices, rng.random((20, 3))])
+    return vertices, faces
+
+@pytest.mark.parametrize("flipped", [False, True])
+def test_clean_mesh_matches_pymeshlab(flipped):
+    pytest.importorskip("pymeshlab")
+    vertices, faces = dirty_sphere(flipped)
+    new_vertices, new_faces = clean_mesh(vertices, faces)
+    ref_vertices, ref_faces = clean_mesh_pymeshlab(vertices, faces)
+
+    assert new_vertices.shape == ref_vertices.shape == (642, 3)
+    np.testing.assert_allclose(new_vertices, ref_vertices, atol=1e-12)
+    assert len(new_faces) == len(ref_faces) == 1280
+    if flipped:
+        ### which copy of a flipped duplicate survives is a tie-break of either backend: compare without winding
+        np.testing.assert_array_equal(canonical_faces(np.sort(new_faces, axis=1)), canonical_faces(np.sort(ref_faces, axis=1)))
+    else:
+        np.testing.assert_array_equal(canonical_faces(new_faces), canonical_faces(ref_faces))
+
+def collapsing_sphere(seed):
+    ### vertices pulled within the merge radius of a neighbour: their faces collapse in the merge
+    rng = np.random.default_rng(seed)
+    sphere = trimesh.creation.icosphere(2)
+    vertices, faces = np.array(sphere.vertices), np.array(sphere.faces)
+    for a in rng.choice(len(vertices), 15, replace=False):
+        b = next(v for v in faces[np.any(faces == a, axis=1)][0] if v != a)
+        vertices[a] = vertices[b] + rng.normal(size=3) * 1e-5
+    return vertices, faces
+
+def test_merge_drops_collapsed_faces():
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1e-6, 0], [0, 1, 0]], dtype=np.float64)
+    faces = np.array([[0, 1, 2], [0, 2, 3]])
+    ### the sliver 0-1-2 collapses onto vertex 1, the other face survives remapped
+    new_vertices, new_faces = merge_close_vertices(vertices, faces, 1e-3)
+    assert new_faces.tolist() == [[0, 1, 3]]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_clean_mesh_matches_pymeshlab_with_collapsed_faces(seed):
+    pytest.importorskip("pymeshlab")
+    vertices, faces = collapsing_sphere(seed)
+    new_vertices, new_faces = clean_mesh(vertices, faces)
+    ref_vertices, ref_faces = clean_mesh_pymeshlab(vertices, faces)
+    assert len(new_faces) < len(faces)
+    np.testing.assert_allclose(new_vertices, ref_vertices, atol=1e-12)
+    np.testing.assert_array_equal(canonical_faces(new_faces), canonical_faces(ref_faces))
@@ -0,0 +1,31 @@
+import torch
+
+from partfield.config.defaults import _C
+from partfield.model_trainer_pvcnn_only_demo import Model
+
+def build_model(inference_only, seed=0):
+    cfg = _C.clone()
+    cfg.inference_only = inference_only
+    cfg.regress_2d_feat = True
+    torch.manual_seed(seed)
+    return Model(cfg)
+
+def test_inference_only_model_loads_a_training_checkpoint():
+    full = build_model(False)
+    model = build_model(True, seed=1)
+    assert not hasattr(model, "sdf_decoder") and not hasattr(model, "feat_decoder")
+
+    checkpoint = {"state_dict": dict(full.state_dict())}
+    model.on_load_checkpoint(checkpoint)
+    ### what is left is exactly the predict path: a strict load checks every built module
+    model.load_state_dict(checkpoint["state_dict"])
+    predict_keys = [k for k in full.state_dict() if k.split(".")[0] not in ("sdf_decoder", "feat_decoder")]
+    assert sorted(model.state_dict()) == sorted(predict_keys)
+    for key, value in model.state_dict().items():
+        assert torch.equal(value, full.state_dict()[key]), key
+
+def test_grid_coord_is_built_on_first_use():
+    model = build_model(True)
+    assert model._grid_coord is None
+    assert model.grid_coord.shape == (256 ** 3, 3)
+    assert model.grid_coord is model._grid_coord
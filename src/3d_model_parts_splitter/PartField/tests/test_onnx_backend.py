@@ -0,0 +1,43 @@
+import os
+
+import pytest
+import torch
+
+from partfield import onnx_backend
+from partfield.config.defaults import _C
+from partfield.onnx_backend import EncoderStack, OnnxEncoder, export_encoder, load_onnx_encoder
+
+def test_onnx_encoder_matches_torch(tmp_path, small_encoder_stack):
+    pytest.importorskip("onnxruntime")
+    pvcnn, triplane_transformer = small_encoder_stack
+    path = str(tmp_path / "encoder.onnx")
+    export_encoder(pvcnn, triplane_transformer, path, n_points=500)
+    encoder = OnnxEncoder(path, num_threads=1)
+    ### batch and point count differ from the traced example (dynamic axes)
+    torch.manual_seed(1)
+    pc = torch.rand(2, 800, 3) * 2 - 1
+    with torch.no_grad():
+        ref = EncoderStack(pvcnn, triplane_transformer)(pc)
+    out = encoder(pc)
+    assert out.shape == ref.shape == (2, 3, 8, 32, 32)
+    assert float((out - ref).norm() / ref.norm()) < 1e-4
+
+def test_encoder_is_exported_again_for_a_newer_checkpoint(tmp_path, monkeypatch):
+    exports = []
+    monkeypatch.setattr(onnx_backend, "export_encoder", lambda *args, **kwargs: exports.append(args[2]))
+    monkeypatch.setattr(onnx_backend, "OnnxEncoder", lambda path, num_threads: path)
+    ckpt = tmp_path / "model.ckpt"
+    ckpt.write_text("")
+    cfg = _C.clone()
+
+    path = load_onnx_encoder(cfg, str(ckpt), None, None)
+    assert path == str(tmp_path / "model.encoder.onnx") and exports == [path]
+    with open(path, "w"):
+        pass
+    os.utime(ckpt, (0, 0))
+    load_onnx_encoder(cfg, str(ckpt), None, None)
+    assert len(exports) == 1
+    os.utime(ckpt, None)
+    os.utime(path, (0, 0))
+    load_onnx_encoder(cfg, str(ckpt), None, None)
+    assert len(exports) == 2
@@ -0,0 +1,40 @@
+import pytest
+import torch
+
+from partfield.model.PVCNN.encoder_pc import sample_triplane_feat, sample_triplane_feat_unfused
+from partfield.model.plane_sampling import PLANE_AXES_PAIRS, fused_plane_sample, plane_axes_pairs
+from partfield.model.triplane import sample_from_planes, sample_from_planes_unfused
+
+def planes_and_points(batch):
+    torch.manual_seed(0)
+    planes = torch.randn(batch, 3, 5, 12, 12)
+    ### a few points outside [-1, 1] exercise the padding
+    points = torch.rand(batch, 500, 3) * 2.2 - 1.1
+    return planes, points
+
+@pytest.mark.parametrize("batch", [1, 2])
+def test_fused_triplane_feat_matches_per_plane(batch):
+    planes, points = planes_and_points(batch)
+    assert torch.allclose(sample_triplane_feat(planes, points), sample_triplane_feat_unfused(planes, points), atol=1e-5)
+
+@pytest.mark.parametrize("batch", [1, 2])
+def test_fused_sample_from_planes_matches_per_plane(batch):
+    planes, points = planes_and_points(batch)
+    assert torch.allclose(sample_from_planes(planes, points), sample_from_planes_unfused(planes, points), atol=1e-6)
+
+def test_fused_plane_sample_unreduced_sums_to_reduced():
+    planes, points = planes_and_points(1)
+    pairs = ((0, 1), (1, 2), (0, 2))
+    per_plane = fused_plane_sample(planes, points, pairs, reduce=False)
+    assert per_plane.shape == (1, 3, 500, 5)
+    assert torch.allclose(per_plane.sum(1), fused_plane_sample(planes, points, pairs), atol=1e-6)
+
+def test_plane_axes_pairs():
+    axes = [[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+            [[1, 0, 0], [0, 0, 1], [0, 1, 0]],
+            [[0, 0, 1], [0, 1, 0], [1, 0, 0]]]
+    assert plane_axes_pairs(axes) == PLANE_AXES_PAIRS
+    ### rotated axes are not a coordinate permutation
+    rotated = torch.tensor(axes, dtype=torch.float32)
+    rotated[0, :2, :2] = torch.tensor([[0.6, 0.8], [-0.8, 0.6]])
+    assert plane_axes_pairs(rotated) is None
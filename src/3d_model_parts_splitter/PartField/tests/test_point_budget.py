@@ -0,0 +1,44 @@
+import trimesh
+
+from partfield.config.defaults import _C
+from partfield.dataloader import Demo_Dataset
+from partfield.point_budget import PointCountPolicy
+
+def make_dataset(tmp_path, **adaptive):
+    cfg = _C.clone()
+    cfg.dataset.data_path = str(tmp_path)
+    cfg.pc_num_pts = 20000
+    for key, value in adaptive.items():
+        setattr(cfg.adaptive_pc, key, value)
+    return Demo_Dataset(cfg)
+
+def test_disabled_policy_keeps_pc_num_pts(tmp_path):
+    ### the baseline: one fixed count whatever the mesh
+    dataset = make_dataset(tmp_path)
+    for mesh in [trimesh.creation.box(), trimesh.creation.icosphere(5)]:
+        assert dataset.num_points_for(mesh) == 20000
+
+def test_policy_clamps_and_buckets():
+    policy = PointCountPolicy(min_pts=10000, max_pts=100000, bucket=10000)
+    ### small area, few faces -> floor
+    assert policy.choose(0.1, 10) == 10000
+    ### 2 points per face dominates: 2 * 23456 = 46912 -> next bucket
+    assert policy.choose(0.1, 23456) == 50000
+    ### surface coverage: area / (2/32)^2 * 4 points per voxel = 1024 * area
+    assert policy.choose(30.0, 10) == 40000
+    ### huge meshes stop at the ceiling
+    assert policy.choose(1000.0, 10 ** 7) == 100000
+
+def test_policy_latency_cap():
+    policy = PointCountPolicy(min_pts=10000, max_pts=100000, bucket=10000,
+                              latency_budget_ms=250.0, base_latency_ms=50.0, ms_per_kpt=5.0)
+    ### (250 - 50) / 5 * 1000 = 40000 points fit the budget
+    assert policy.choose(1000.0, 10 ** 7) == 40000
+    ### the floor wins over the budget
+    tight = PointCountPolicy(min_pts=10000, latency_budget_ms=10.0, ms_per_kpt=5.0)
+    assert tight.choose(1000.0, 10 ** 7) == 10000
+
+def test_enabled_policy_in_dataset(tmp_path):
+    dataset = make_dataset(tmp_path, enabled=True, bucket=5000)
+    box = trimesh.creation.box(extents=(1.8, 1.8, 1.8))
+    assert dataset.num_points_for(box) == dataset.point_policy.choose(box.area, len(box.faces)) == 20000
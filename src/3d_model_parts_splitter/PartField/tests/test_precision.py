@@ -0,0 +1,44 @@
+import pytest
+import torch
+import torch.nn.functional as F
+
+from partfield.config.defaults import _C
+from partfield.onnx_backend import EncoderStack
+from partfield.precision import BF16_STAGES, FP32_NORMS, enable_cpu_bf16
+
+def bf16_cfg(stages):
+    cfg = _C.clone()
+    cfg.cpu.bf16_stages = list(stages)
+    return cfg
+
+def part_planes(pvcnn, triplane_transformer, pc):
+    with torch.no_grad():
+        return EncoderStack(pvcnn, triplane_transformer)(pc)
+
+@pytest.mark.parametrize("stages", [[stage] for stage in BF16_STAGES] + [list(BF16_STAGES)])
+def test_bf16_stages_stay_close_to_fp32(small_encoder_stack, stages):
+    pvcnn, triplane_transformer = small_encoder_stack
+    torch.manual_seed(1)
+    pc = torch.rand(1, 800, 3) * 2 - 1
+    ref = part_planes(pvcnn, triplane_transformer, pc)
+    keys = sorted(pvcnn.state_dict()) + sorted(triplane_transformer.state_dict())
+
+    norm_dtypes = []
+    for module in list(pvcnn.modules()) + list(triplane_transformer.modules()):
+        if isinstance(module, FP32_NORMS):
+            module.register_forward_hook(lambda m, args, out: norm_dtypes.append(out.dtype))
+    assert enable_cpu_bf16(bf16_cfg(stages), pvcnn, triplane_transformer) == stages
+    out = part_planes(pvcnn, triplane_transformer, pc)
+
+    ### fp32 outputs and normalization layers, unchanged parameters
+    assert out.dtype == torch.float32
+    assert norm_dtypes and all(dtype == torch.float32 for dtype in norm_dtypes)
+    assert sorted(pvcnn.state_dict()) + sorted(triplane_transformer.state_dict()) == keys
+    ### the stage did run in bf16, and stays close to fp32
+    assert not torch.equal(out, ref)
+    cos = F.cosine_similarity(out.flatten(), ref.flatten(), dim=0)
+    assert float(cos) > 0.99
+
+def test_unknown_bf16_stage(small_encoder_stack):
+    with pytest.raises(AssertionError):
+        enable_cpu_bf16(bf16_cfg(["decoder"]), *small_encoder_stack)
@@ -0,0 +1,95 @@
+import numpy as np
+import torch
+
+from partfield.face_features import point_features
+from partfield.predictor import PartFieldPredictor
+
+def planted_encode(pc):
+    """
+    Cheap stand-in encoder: (B, N, 3) -> (B, 3, 3, 8, 8) planes, a ramp scaled by the mean
+    point of every cloud, so the planes differ per cloud and the readout varies per point.
+    """
+    ramp = torch.linspace(0, 1, 8)[:, None] + torch.linspace(1, 2, 8)[None, :]
+    return pc.mean(dim=1)[:, None, :, None, None] * ramp.expand(1, 3, 1, 8, 8)
+
+def planted_predictor():
+    predictor = PartFieldPredictor.__new__(PartFieldPredictor)
+    predictor.device = torch.device("cpu")
+    predictor.encode = planted_encode
+    return predictor
+
+def test_predict_points_of_different_sizes():
+    torch.manual_seed(0)
+    predictor = planted_predictor()
+    pcs = [torch.rand(100, 3) * 2 - 1, torch.rand(60, 3) * 2 - 1]
+    feats, part_planes = predictor.predict_points(pcs, return_planes=True)
+
+    ### one feature per input point, read from the planes of that cloud
+    assert [f.shape for f in feats] == [(100, 3), (60, 3)]
+    for pc, feat, planes in zip(pcs, feats, part_planes):
+        assert torch.allclose(planes, planted_encode(pc[None])[0])
+        assert torch.allclose(torch.from_numpy(feat), point_features(planes[None], pc))
+
+def test_predict_points_single_cloud():
+    predictor = planted_predictor()
+    pc = torch.rand(30, 3) * 2 - 1
+    assert predictor.predict_points(pc).shape == (30, 3)
+
+def small_model_cfg(monkeypatch):
+    """
+    Inference config of a small encoder stack (see conftest.small_encoder_stack); the
+    transformer width is fixed in build_triplane_transformer, so both engines build it here.
+    """
+    from partfield.config.defaults import _C
+    from partfield.model.triplane import TriplaneTransformer
+    import partfield.model_trainer_pvcnn_only_demo as model_trainer
+    import partfield.predictor as predictor
+
+    def small_transformer(cfg):
+        return TriplaneTransformer(input_dim=cfg.triplane_channels_low * 2, transformer_dim=32,
+                                   transformer_layers=1, transformer_heads=4, triplane_low_res=8,
+                                   triplane_high_res=32, triplane_dim=cfg.triplane_channels_high)
+    monkeypatch.setattr(predictor, "build_triplane_transformer", small_transformer)
+    monkeypatch.setattr(model_trainer, "build_triplane_transformer", small_transformer)
+
+    cfg = _C.clone()
+    cfg.pvcnn.z_triplane_channels = 16
+    cfg.pvcnn.z_triplane_resolution = 32
+    cfg.triplane_channels_low = 8
+    cfg.triplane_channels_high = 72
+    cfg.pc_num_pts = 2000
+    ### deterministic face readout, so both engines average the same points
+    cfg.face_sampling = "quadrature"
+    cfg.result_name = "small"
+    return cfg
+
+def test_predictor_matches_predict_step(tmp_path, monkeypatch):
+    import trimesh
+    from partfield.model_trainer_pvcnn_only_demo import Model
+
+    cfg = small_model_cfg(monkeypatch)
+    torch.manual_seed(0)
+    model = Model(cfg).eval()
+    ckpt_path = str(tmp_path / "small.ckpt")
+    torch.save({"state_dict": model.state_dict()}, ckpt_path)
+    predictor = PartFieldPredictor(cfg, ckpt_path, device="cpu")
+
+    mesh = trimesh.creation.icosphere(subdivisions=2, radius=0.8)
+    vertices = torch.tensor(mesh.vertices, dtype=torch.float32)
+    faces = torch.tensor(mesh.faces, dtype=torch.int64)
+
+    pc = predictor.sample_pc(vertices, faces)
+    with torch.no_grad():
+        assert torch.allclose(predictor.encode(pc), model.encode_part_planes(pc), atol=1e-5)
+
+    ### predict_step writes exp_results/<result_name> under the working directory
+    monkeypatch.chdir(tmp_path)
+    batch = {'uid': ["sphere"], 'skipped_uids': [], 'vertices': [vertices], 'faces': [faces],
+             'pc_num_pts': torch.tensor([cfg.pc_num_pts])}
+    with torch.no_grad():
+        model.predict_step(batch, 0)
+    expected = np.load(tmp_path / "exp_results" / "small" / "part_feat_sphere_0_batch.npy")
+
+    feats = predictor.predict(vertices, faces)
+    assert feats.shape == (len(faces), 8)
+    assert np.allclose(feats, expected, atol=1e-5)
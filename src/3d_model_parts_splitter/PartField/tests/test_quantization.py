@@ -0,0 +1,52 @@
+import copy
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from partfield.model.triplane import TriplaneTransformer
+from partfield.quantization import linear_groups, load_quantized, quantize_linears, save_quantized
+
+def small_transformer():
+    torch.manual_seed(0)
+    return TriplaneTransformer(input_dim=16, transformer_dim=64, transformer_layers=2, transformer_heads=4,
+                               triplane_low_res=8, triplane_high_res=32, triplane_dim=24).eval()
+
+def triplanes():
+    torch.manual_seed(1)
+    return torch.randn(1, 3, 16, 32, 32)
+
+def test_linear_groups_are_the_mlps():
+    groups = linear_groups(small_transformer())
+    assert sorted(groups) == ["mlp", "transformer.layers.0.mlp", "transformer.layers.1.mlp"]
+    assert all(len(layers) == 2 for layers in groups.values())
+    assert not any("attn" in name for layers in groups.values() for name in layers)
+
+def test_int8_mlps_stay_close_to_fp32():
+    model = small_transformer()
+    quantized = quantize_linears(copy.deepcopy(model), [n for layers in linear_groups(model).values() for n in layers])
+    assert not linear_groups(quantized)
+    with torch.no_grad():
+        ref, out = model(triplanes()), quantized(triplanes())
+    ### per-point features along the channel axis
+    cos = F.cosine_similarity(out, ref, dim=2)
+    assert float(cos.min()) > 0.99
+
+def test_quantized_weights_roundtrip(tmp_path):
+    model = small_transformer()
+    layers = linear_groups(model)["transformer.layers.1.mlp"]
+    quantize_linears(model, layers)
+    path = str(tmp_path / "model.int8.pt")
+    save_quantized(path, model, layers)
+
+    ### a fresh fp32 transformer (as built from the checkpoint) gets the same int8 layers
+    torch.manual_seed(2)
+    loaded = TriplaneTransformer(input_dim=16, transformer_dim=64, transformer_layers=2, transformer_heads=4,
+                                 triplane_low_res=8, triplane_high_res=32, triplane_dim=24).eval()
+    assert load_quantized(path, loaded) == layers
+    with torch.no_grad():
+        assert torch.equal(loaded(triplanes()), model(triplanes()))
+
+def test_missing_quantized_weights(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_quantized(str(tmp_path / "none.int8.pt"), small_transformer())
@@ -0,0 +1,87 @@
+import os
+
+import mesh2sdf
+import numpy as np
+import pytest
+import tetgen
+import torch
+import trimesh
+from scipy.spatial import cKDTree
+
+from partfield.remesh import extract_tet_surface, run_tasks, sparse_udf, udf_marching_cubes
+
+def sphere_and_box():
+    ### both off the grid: grid points exactly at the level make marching cubes ambiguous
+    sphere = trimesh.creation.icosphere(3, radius=0.6)
+    sphere.apply_translation((0.0137, -0.0211, 0.0093))
+    box = trimesh.creation.box(extents=(0.51, 0.33, 0.47))
+    box.apply_translation((0.3123, 0.1077, -0.2031))
+    return trimesh.util.concatenate([sphere, box])
+
+def densify(block_coords, blocks, size, background):
+    B = blocks.shape[1]
+    n_blocks = (size + B - 1) // B
+    dense = np.full((n_blocks * B,) * 3, background, dtype=np.float32)
+    for (i, j, k), block in zip(block_coords * B, blocks):
+        dense[i:i + B, j:j + B, k:k + B] = block
+    return dense[:size, :size, :size]
+
+def test_run_tasks_process_pool_after_torch_threads():
+    ### torch's intra-op pool is up before the pool is created (the inference setting)
+    torch.randn(256, 256) @ torch.randn(256, 256)
+    tasks = list(range(-4, 4))
+    assert run_tasks(abs, tasks, 2) == [abs(t) for t in tasks]
+
+def test_run_tasks_all_workers_follow_affinity(monkeypatch):
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: {0}, raising=False)
+    ### one usable CPU: -1 runs serially, whatever os.cpu_count() says
+    assert run_tasks(lambda t: t * 2, [1, 2, 3], -1) == [2, 4, 6]
+
+@pytest.mark.parametrize("size", [48, 40])
+def test_sparse_udf_matches_mesh2sdf_in_band(size):
+    mesh = sphere_and_box()
+    band = 2.5
+    sparse = densify(*sparse_udf(mesh.vertices, mesh.faces, size, band=band, block_size=16), size, band)
+    ### mesh2sdf's grid, in voxels
+    dense = np.abs(mesh2sdf.core.compute(mesh.vertices, mesh.faces, size)) * (size / 2)
+    ### mesh2sdf is exact near the surface only
+    near = dense < 2.0
+    assert near.sum() > 1000
+    np.testing.assert_allclose(sparse[near], dense[near], atol=1e-4)
+    ### outside the band the sparse field keeps the background value
+    assert np.all(sparse[dense > band + 0.1] == band)
+
+@pytest.mark.parametrize("size", [48, 40])
+def test_sparse_marching_cubes_matches_dense(size):
+    mesh = sphere_and_box()
+    vertices, faces = udf_marching_cubes(mesh.vertices, mesh.faces, size, sparse=True, block_size=16)
+    ref_vertices, ref_faces = udf_marching_cubes(mesh.vertices, mesh.faces, size, sparse=False)
+    ### seam vertices are welded: same surface, same counts
+    assert vertices.shape == ref_vertices.shape and faces.shape == ref_faces.shape
+    d_ab, _ = cKDTree(ref_vertices).query(vertices)
+    d_ba, _ = cKDTree(vertices).query(ref_vertices)
+    assert max(d_ab.max(), d_ba.max()) < 1e-3
+    assert len(np.unique(vertices, axis=0)) == len(vertices)
+    assert trimesh.Trimesh(vertices, faces).is_watertight
+
+@pytest.mark.parametrize("flip", [False, True])
+def test_extract_tet_surface_of_tetgen_mesh(flip):
+    mesh = trimesh.creation.icosphere(2, radius=0.7)
+    mesh.apply_translation((0.1, -0.05, 0.2))
+    tet = tetgen.TetGen(mesh.vertices, mesh.faces)
+    tet.tetrahedralize(plc=True, quality=True, maxvolume=1e-3)
+    nodes, elems = tet.node, np.array(tet.elem)
+    assert len(elems) > 100
+    if flip:
+        ### negatively oriented tets get the same outward faces
+        elems[::2] = elems[::2][:, [1, 0, 2, 3]]
+    vertices, faces = extract_tet_surface(nodes, elems)
+
+    surface = trimesh.Trimesh(vertices, faces, process=False)
+    assert surface.is_watertight and surface.is_winding_consistent
+    ### outward normals: every face looks away from the center of the convex input
+    center = mesh.vertices.mean(axis=0)
+    assert np.all(np.einsum("ij,ij->i", surface.face_normals, surface.triangles_center - center) > 0)
+    ### the boundary encloses the input volume, and only boundary vertices are kept
+    assert surface.volume == pytest.approx(mesh.volume, rel=1e-6)
+    assert len(np.unique(faces)) == len(vertices)
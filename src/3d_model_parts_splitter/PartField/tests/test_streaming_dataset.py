@@ -0,0 +1,82 @@
+import torch
+import trimesh
+
+from partfield.config.defaults import _C
+from partfield.streaming_dataset import FileSource, Manifest_Dataset
+
+def manifest_cfg(tmp_path, lines):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("".join(line + "\n" for line in lines))
+    cfg = _C.clone()
+    cfg.dataset.data_path = str(tmp_path)
+    cfg.dataset.manifest = str(manifest)
+    cfg.dataset.ledger_dir = str(tmp_path / "ledger")
+    cfg.pc_num_pts = 100
+    return cfg
+
+def write_meshes(tmp_path, n):
+    """
+    n small meshes and their manifest lines; uids are the file names without extension.
+    """
+    mesh = trimesh.creation.box()
+    names = [f"mesh_{i:02d}.obj" for i in range(n)]
+    for name in names:
+        mesh.export(str(tmp_path / name))
+    return names
+
+def uids_of(dataset, num_workers=0):
+    loader = torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=num_workers)
+    return [item['uid'] for item in loader]
+
+def test_len_reads_the_manifest_once(tmp_path, monkeypatch):
+    cfg = manifest_cfg(tmp_path, ["a.obj", "b.obj", "# comment", "c\tc.obj"])
+
+    reads = []
+    iter_lines = FileSource.iter_lines
+    monkeypatch.setattr(FileSource, "iter_lines", lambda self, path: reads.append(path) or iter_lines(self, path))
+
+    dataset = Manifest_Dataset(cfg)
+    dataset.ledger.mark_done("a")
+    assert [len(dataset) for _ in range(3)] == [3, 3, 3]
+    assert len(reads) == 1
+
+def test_shards_ranks_and_workers_cover_every_item_once(tmp_path, monkeypatch):
+    names = write_meshes(tmp_path, 23)
+    cfg = manifest_cfg(tmp_path, names)
+    cfg.dataset.num_shards = 2
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("WORLD_SIZE", "3")
+
+    seen = []
+    for shard_id in range(2):
+        for rank in range(3):
+            cfg.dataset.shard_id = shard_id
+            monkeypatch.setenv("RANK", str(rank))
+            dataset = Manifest_Dataset(cfg)
+            ### the pending count of a rank sums over its workers
+            uids = uids_of(dataset, num_workers=2)
+            assert len(uids) == len(dataset)
+            seen += uids
+    assert sorted(seen) == sorted(name[:-len(".obj")] for name in names)
+
+def test_resume_skips_finished_uids(tmp_path, monkeypatch):
+    names = write_meshes(tmp_path, 6)
+    cfg = manifest_cfg(tmp_path, names)
+    monkeypatch.chdir(tmp_path)
+
+    dataset = Manifest_Dataset(cfg)
+    first = []
+    for item in dataset:
+        ### what the inference engines do once an item's outputs are written
+        dataset.ledger.mark_done(item['uid'])
+        first.append(item['uid'])
+        if len(first) == 4:
+            break
+    ### an interrupted write leaves a torn last line
+    with open(dataset.ledger.path, "a") as f:
+        f.write('{"uid": "mesh_0')
+
+    resumed = Manifest_Dataset(cfg)
+    assert len(resumed) == 2
+    assert uids_of(resumed) == ["mesh_04", "mesh_05"]
+    assert first == ["mesh_00", "mesh_01", "mesh_02", "mesh_03"]
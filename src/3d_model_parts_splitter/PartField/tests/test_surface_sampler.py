@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+import torch
+import trimesh
+
+from partfield.surface_sampler import SurfaceSampler, sample_surface_points
+
+def triangles(areas):
+    """
+    Disjoint right triangles with the given areas, one per face.
+    """
+    vertices, faces = [], []
+    for i, area in enumerate(areas):
+        side = np.sqrt(2 * area)
+        vertices += [[0, 0, i], [side, 0, i], [0, side, i]]
+        faces.append([3 * i, 3 * i + 1, 3 * i + 2])
+    return np.array(vertices, dtype=np.float32), np.array(faces)
+
+def test_same_seed_same_samples():
+    mesh = trimesh.creation.icosphere(subdivisions=2)
+    sampler = SurfaceSampler(mesh.vertices, mesh.faces)
+    assert torch.equal(sampler.sample(1000, seed=3), sampler.sample(1000, seed=3))
+    assert not torch.equal(sampler.sample(1000, seed=3), sampler.sample(1000, seed=4))
+    ### a new sampler on the same mesh draws the same points
+    assert np.array_equal(sample_surface_points(mesh.vertices, mesh.faces, 1000, seed=3),
+                          sampler.sample(1000, seed=3).numpy())
+    batch = sampler.sample(1000, seed=3, batch_size=2)
+    assert batch.shape == (2, 1000, 3) and torch.equal(batch, sampler.sample(1000, seed=3, batch_size=2))
+
+def test_face_counts_scale_with_area():
+    areas = np.array([1.0, 2.0, 0.0, 5.0])
+    vertices, faces = triangles(areas)
+    n_points = 200000
+    _, face_idx = SurfaceSampler(vertices, faces).sample(n_points, seed=0, return_faces=True)
+    counts = np.bincount(face_idx.numpy(), minlength=len(faces))
+    ### the zero-area face is never drawn, the others within a few standard deviations
+    assert counts[2] == 0
+    expected = n_points * areas / areas.sum()
+    assert np.all(np.abs(counts - expected) < 5 * np.sqrt(expected) + 1)
+
+def test_samples_lie_on_their_face():
+    mesh = trimesh.creation.box(extents=(1.0, 2.0, 0.5))
+    points, face_idx = SurfaceSampler(mesh.vertices, mesh.faces).sample(5000, seed=1, return_faces=True)
+    tri = mesh.vertices[mesh.faces[face_idx.numpy()]]
+    bary = trimesh.triangles.points_to_barycentric(tri, points.numpy().astype(np.float64))
+    assert np.all(bary > -1e-5) and np.allclose(bary.sum(axis=1), 1)
+    ### barycentric coordinates drop the off-plane part: the rebuilt points must be the samples
+    rebuilt = np.einsum("ni,nij->nj", bary, tri)
+    assert np.allclose(rebuilt, points.numpy(), atol=1e-5)
+
+def test_face_normals_match_the_surface():
+    ### on a sphere, the normal of the face a point was drawn from is the radial direction
+    mesh = trimesh.creation.icosphere(subdivisions=4)
+    points, face_idx = SurfaceSampler(mesh.vertices, mesh.faces).sample(5000, seed=2, return_faces=True)
+    normals = mesh.face_normals[face_idx.numpy()]
+    radial = points.numpy() / np.linalg.norm(points.numpy(), axis=1, keepdims=True)
+    assert np.min(np.sum(normals * radial, axis=1)) > 0.99
+
+def test_zero_area_mesh_is_rejected():
+    vertices, faces = triangles([0.0])
+    with pytest.raises(ValueError):
+        SurfaceSampler(vertices, faces)
@@ -0,0 +1,36 @@
+import pytest
+import torch
+
+from benchmark_voxelization import run_legacy, run_shared
+from partfield.model.PVCNN.pc_encoder import PVCNNEncoder
+from partfield.model.PVCNN.pv_module import PVConv
+from partfield.model.PVCNN.pv_module.voxelization import Voxelization
+
+def encoder_voxelizations():
+    encoder = PVCNNEncoder(128, device="cpu")
+    blocks = [block for block in encoder.encoder if isinstance(block, PVConv)]
+    return encoder, blocks, [block.voxelization for block in blocks]
+
+@pytest.mark.parametrize("batch", [1, 2])
+def test_shared_grids_match_legacy_voxelization(batch):
+    _, blocks, voxelizations = encoder_voxelizations()
+    torch.manual_seed(0)
+    ### few points: most voxels of the 32^3 grid stay empty
+    coords = torch.rand(batch, 3, 2000) * 2 - 1
+    inputs = [torch.randn(batch, block.in_channels, 2000) for block in blocks]
+    with torch.no_grad():
+        ref = run_legacy(voxelizations, inputs, coords)
+        out = run_shared(voxelizations, inputs, coords)
+    for o, r in zip(out, ref):
+        assert o.shape == r.shape
+        assert torch.allclose(o, r, atol=1e-6)
+
+def test_encoder_builds_one_grid_per_resolution(monkeypatch):
+    encoder, _, voxelizations = encoder_voxelizations()
+    built = []
+    grid = Voxelization.grid
+    monkeypatch.setattr(Voxelization, "grid", lambda self, coords: built.append(self.r) or grid(self, coords))
+    with torch.no_grad():
+        encoder(torch.rand(1, 1000, 3) - 0.5)
+    assert len(voxelizations) > len(set(v.r for v in voxelizations))
+    assert sorted(built) == sorted(set(v.r for v in voxelizations))
@@ -23,9 +23,11 @@ webhook_url = os.environ.get('WEBHOOK_URL')
 
 PF_ROOT = os.getenv("PF_ROOT", "/workspace/PartField/partfield")  # folder with scripts
 PF_CKPT = os.getenv("PF_CKPT", "/runpod-volume/model/model_objaverse.ckpt")  # read-only on volume
+PF_MESH_CACHE = os.getenv("PF_MESH_CACHE", "")  # preprocessed-mesh cache shared by inference and clustering
+PF_INFERENCE_ENGINE = os.getenv("PF_INFERENCE_ENGINE", "predictor")  # "predictor" (no Lightning Trainer) or "lightning"
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-log(f"Loaded environment: bucket={bucket_name}, webhook_url={webhook_url}, PF_ROOT={PF_ROOT}, PF_CKPT={PF_CKPT}, device={device}")
+log(f"Loaded environment: bucket={bucket_name}, webhook_url={webhook_url}, PF_ROOT={PF_ROOT}, PF_CKPT={PF_CKPT}, PF_MESH_CACHE={PF_MESH_CACHE}, device={device}")
 
 # ---------- helpers ----------
 def run_cmd(cmd, cwd=None):
@@ -68,25 +70,35 @@ def s3_upload(local_path, key, expires=3600):
     return url
 
 # ---------- PartField wrappers ----------
-def partfield_inference(job_id, data_dir, preprocess=True):
+PF_CONFIG = "configs/final/demo.yaml"
+
+def inference_opts(job_id, data_dir, preprocess=True):
     """
-    Runs feature extraction; outputs under PF_ROOT/exp_results/partfield_features/<job_id>
+    --opts of partfield_inference.py for one job. Clustering gets the same config and opts,
+    so it looks mesh cache entries up with the preprocessing inference used.
     """
-    result_name = f"partfield_features/{job_id}"
-    cmd = [
-        "python", "partfield_inference.py",
-        "-c", "configs/final/demo.yaml",
-        "--opts",
+    opts = [
         "continue_ckpt", PF_CKPT,          # read-only checkpoint on volume
-        "result_name", result_name,
+        "result_name", f"partfield_features/{job_id}",
         "dataset.data_path", data_dir,     # absolute /tmp path with the STL
+        "inference_engine", PF_INFERENCE_ENGINE,
+        "device", device,                  # cpu nodes take overflow traffic
     ]
     if preprocess:
-        cmd += ["preprocess_mesh", "True"]
+        opts += ["preprocess_mesh", "True"]
+    if PF_MESH_CACHE:
+        opts += ["mesh_cache_dir", PF_MESH_CACHE]
+    return opts
+
+def partfield_inference(job_id, data_dir, preprocess=True):
+    """
+    Runs feature extraction; outputs under PF_ROOT/exp_results/partfield_features/<job_id>
+    """
+    cmd = ["python", "partfield_inference.py", "-c", PF_CONFIG, "--opts"] + inference_opts(job_id, data_dir, preprocess)
     run_cmd(cmd, cwd=PF_ROOT)
     return os.path.join(PF_ROOT, "exp_results", "partfield_features", job_id)
 
-def partfield_clustering(job_id, data_dir, feat_root, mode="agglo_knn", max_clusters=20):
+def partfield_clustering(job_id, data_dir, feat_root, mode="agglo_knn", max_clusters=20, preprocess=True):
     """
     Clusters features into parts; outputs under PF_ROOT/exp_results/clustering/<job_id>
     mode: "agglo" | "agglo_knn" | "kmeans"
@@ -109,6 +121,10 @@ def partfield_clustering(job_id, data_dir, feat_root, mode="agglo_knn", max_clus
         cmd = base  # default codepath = kmeans (no adjacency)
     else:
         raise ValueError("mode must be one of: agglo, agglo_knn, kmeans")
+    if PF_MESH_CACHE:
+        # --opts takes the rest of the command line, so it goes last
+        cmd += ["--mesh_cache_dir", PF_MESH_CACHE, "--config_file", PF_CONFIG,
+                "--opts"] + inference_opts(job_id, data_dir, preprocess)
 
     run_cmd(cmd, cwd=PF_ROOT)
     return dump_dir
@@ -165,7 +181,7 @@ def handler(job):
         log(f"✅ Features at {feat_root}")
 
         log("🧩 Step 2/2: Clustering (segmentation)")
-        cluster_dir = partfield_clustering(file_id, data_dir, feat_root, mode=mode, max_clusters=max_k)
+        cluster_dir = partfield_clustering(file_id, data_dir, feat_root, mode=mode, max_clusters=max_k, preprocess=True)
         log(f"✅ Clustering output at {cluster_dir}")
 
         # 3) Save (upload) results to S3